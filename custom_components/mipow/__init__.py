@@ -9,11 +9,35 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_ADDRESS, EVENT_HOMEASSISTANT_STOP, Platform
 from homeassistant.core import callback, Event, HomeAssistant
 from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+import homeassistant.util.dt as dt_util
 import logging
 
-from .mipow import MiPow
-from .component import MIPOW_DOMAIN, UPDATE_SECONDS, MiPowData
+from .pymipow import MiPow, OWNERSHIP_HOME_ASSISTANT
+from .pymipow.airtime import adapter_name
+from .pymipow.profiler import LoopProfiler
+from .pymipow.recorder import GattRecorder
+from .pymipow.trace import Tracer
+from .component import (
+    MIPOW_DOMAIN,
+    UPDATE_SECONDS,
+    CONF_BATCH_CALLBACKS,
+    CONF_LOOP_PROFILE,
+    CONF_OWNERSHIP,
+    CONF_RECORD_GATT,
+    CONF_SHARED_COORDINATOR,
+    CONF_TRACE,
+    MiPowData,
+    async_get_airtime,
+)
+from .hub import MiPowHub, async_get_hub, async_remove_from_hub
+from .services import async_setup_services
+from .state import (
+    MiPowStateStore,
+    async_get_state_store,
+    async_setup_state_store,
+)
 
 PLATFORMS: list[Platform] = (
     Platform.LIGHT,
@@ -23,6 +47,11 @@ PLATFORMS: list[Platform] = (
 
 _LOGGER = logging.getLogger(__name__)
 
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    await async_setup_state_store(hass)
+    async_setup_services(hass)
+    return True
+
 async def async_setup_entry(
         hass: HomeAssistant, 
         entry: ConfigEntry
@@ -33,7 +62,55 @@ async def async_setup_entry(
     if not ble_device:
         raise ConfigEntryNotReady(f"Could not find MiPow device with address {address}")
 
-    mipow = MiPow(ble_device)
+    hub: MiPowHub | None = None
+    if entry.options.get(CONF_SHARED_COORDINATOR, False):
+        hub = async_get_hub(hass)
+
+    session: str = f"{address.replace(':', '')}-{dt_util.now():%Y%m%d-%H%M%S}".lower()
+    recorder: GattRecorder | None = None
+    if entry.options.get(CONF_RECORD_GATT, False):
+        recorder = GattRecorder(
+            hass.config.path(MIPOW_DOMAIN, f"{session}.jsonl"), address, entry.title
+        )
+        _LOGGER.info("Recording the GATT traffic of %s to %s", address, recorder.path)
+
+    tracer: Tracer | None = None
+    if entry.options.get(CONF_TRACE, False):
+        tracer = Tracer(
+            hass.config.path(MIPOW_DOMAIN, f"{session}.trace.json"), entry.title
+        )
+        _LOGGER.info("Tracing the operations of %s to %s", address, tracer.path)
+
+    profiler: LoopProfiler | None = None
+    if entry.options.get(CONF_LOOP_PROFILE, False):
+        profiler = LoopProfiler(entry.title)
+
+    store: MiPowStateStore = async_get_state_store(hass)
+    # The budget is saved per adapter, not per device
+    adapter: str = adapter_name(ble_device)
+    airtime = async_get_airtime(hass)
+    airtime.set_budget(adapter, store.get_airtime_budget(adapter) / 100)
+
+    mipow = MiPow(
+        ble_device,
+        now=dt_util.now,
+        ownership=entry.options.get(CONF_OWNERSHIP, OWNERSHIP_HOME_ASSISTANT),
+        scheduler=hub.scheduler if hub is not None else None,
+        recorder=recorder,
+        tracer=tracer,
+        profiler=profiler,
+        batch_callbacks=entry.options.get(CONF_BATCH_CALLBACKS, False),
+        airtime=airtime.device(ble_device),
+    )
+
+    store.load_capabilities(mipow.address)
+    saved = store.get(mipow.address)
+    desired = store.get_desired_state(mipow.address)
+    if desired:
+        # The first connect writes only what differs from the saved state
+        _LOGGER.debug("Saved state of %s: %s", address, desired)
+        mipow.load_state(desired)
+    entry.async_on_unload(store.async_track(mipow))
 
     @callback
     def _async_update_mipow(
@@ -64,7 +141,8 @@ async def async_setup_entry(
         _LOGGER,
         name=mipow.name,
         update_method=_async_update,
-        update_interval=timedelta(seconds=UPDATE_SECONDS),
+        # With the shared coordinator the hub polls the device
+        update_interval=None if hub is not None else timedelta(seconds=UPDATE_SECONDS),
     )
 
     try:
@@ -84,10 +162,18 @@ async def async_setup_entry(
     finally:
         cancel_first_update()
 
+    store.async_save_capabilities(mipow)
     hass.data.setdefault(MIPOW_DOMAIN, {})[entry.entry_id] = MiPowData(
-        entry.title, mipow, coordinator
+        entry.title,
+        mipow,
+        coordinator,
+        dict(entry.options),
+        saved if desired else None,
     )
 
+    if hub is not None:
+        hub.add(mipow, coordinator)
+
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     entry.async_on_unload(entry.add_update_listener(_async_update_listener))
 
@@ -102,15 +188,19 @@ async def async_setup_entry(
 
 async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
     data: MiPowData = hass.data[MIPOW_DOMAIN][entry.entry_id]
-    if entry.title != data.title:
+    if entry.title != data.title or entry.options != data.options:
         await hass.config_entries.async_reload(entry.entry_id)
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    async_get_state_store(hass).async_remove(entry.data[CONF_ADDRESS].upper())
+
 async def async_unload_entry(
         hass: HomeAssistant, 
         entry: ConfigEntry
     ) -> bool:
     if result := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
         data: MiPowData = hass.data[MIPOW_DOMAIN].pop(entry.entry_id)
+        async_remove_from_hub(hass, data.device)
         await data.device.stop()
 
     return result
@@ -0,0 +1,35 @@
+from __future__ import annotations
+from functools import lru_cache
+
+# A base colour is the colour at full brightness, it carries hue and saturation.
+# Brightness is applied with integer lookup tables at full 8-bit resolution,
+# so repeated brightness changes do not drift the colour.
+
+
+@lru_cache(maxsize=256)
+def brightness_table(brightness: int) -> tuple[int, ...]:
+    return tuple((value * brightness + 127) // 255 for value in range(256))
+
+
+@lru_cache(maxsize=1024)
+def base_color(red: int, green: int, blue: int) -> tuple[int, int, int]:
+    value: int = max(red, green, blue)
+    if value == 0:
+        return (0, 0, 0)
+    half: int = value // 2
+    return (
+        (red * 255 + half) // value,
+        (green * 255 + half) // value,
+        (blue * 255 + half) // value,
+    )
+
+
+def color_brightness(red: int, green: int, blue: int) -> int:
+    return max(red, green, blue)
+
+
+def scale_color(
+    base: tuple[int, int, int], brightness: int
+) -> tuple[int, int, int]:
+    table = brightness_table(brightness)
+    return (table[base[0]], table[base[1]], table[base[2]])
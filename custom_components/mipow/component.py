@@ -1,12 +1,16 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Any
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 from homeassistant.backports.enum import StrEnum
 from homeassistant.components.light import EFFECT_COLORLOOP
+from homeassistant.core import Context, HomeAssistant, callback
 from homeassistant.helpers import device_registry as dr
-from homeassistant.helpers.entity import DeviceInfo
-from .mipow import MiPow
+from homeassistant.helpers.entity import DeviceInfo, Entity
+from .pymipow import MiPow, MIPOW_EFFECTS
+from .pymipow.airtime import AirtimeRegistry
+from .pymipow.trace import TRACE_CONTEXT
 
 MIPOW_DOMAIN = "mipow"
 UPDATE_SECONDS = 30
@@ -14,6 +18,38 @@ ATTR_DELAY = "delay"
 ATTR_REPETITIONS = "repetitions"
 ATTR_PAUSE = "pause"
 ATTR_TIMER = "timer"
+ATTR_TIMERS = "timers"
+ATTR_SCHEDULES = "schedules"
+ATTR_ACTION = "action"
+ATTR_TIME = "time"
+ATTR_FADE = "fade"
+ATTR_SLOT = "slot"
+SERVICE_SYNC_SCHEDULES = "sync_schedules"
+SERVICE_SET_EFFECT = "set_effect"
+SERVICE_ALERT = "alert"
+ATTR_DURATION = "duration"
+SERVICE_SNAPSHOT_SCENE = "snapshot_scene"
+SERVICE_RESTORE_SCENE = "restore_scene"
+ATTR_SCENE = "scene"
+SERVICE_DEFINE_EFFECT = "define_effect"
+SERVICE_PLAY_EFFECT = "play_effect"
+ATTR_KEYFRAMES = "keyframes"
+ATTR_HOLD = "hold"
+ATTR_REPEAT = "repeat"
+ATTR_FIRMWARE = "firmware"
+# Devices connecting at the same time, a typical bluetooth proxy has 3 slots
+CONNECTION_SLOTS = 3
+CONF_OWNERSHIP = "ownership"
+CONF_SHARED_COORDINATOR = "shared_coordinator"
+CONF_RECORD_GATT = "record_gatt"
+CONF_TRACE = "trace"
+CONF_LOOP_PROFILE = "loop_profile"
+CONF_BATCH_CALLBACKS = "batch_callbacks"
+CONF_AIRTIME_BUDGET = "airtime_budget"
+DEFAULT_AIRTIME_BUDGET = 50
+DATA_HUB = "hub"
+DATA_AIRTIME = "airtime"
+DATA_STATE = "state"
 
 class MiPowEffects(StrEnum):
     PULSE: str = "pulse"
@@ -23,11 +59,24 @@ class MiPowEffects(StrEnum):
     RAINBOW: str = "rainbow"
     COLORLOOP: str = EFFECT_COLORLOOP
 
+# Effects of the generic profile, a device may support fewer, see MiPow.effects
+CandleEffectsMap = {MiPowEffects(name): code for name, code in MIPOW_EFFECTS.items()}
+
 @dataclass
 class MiPowData:
     title: str
     device: MiPow
     coordinator: DataUpdateCoordinator
+    options: dict[str, Any] = field(default_factory=dict)
+    # State saved before the restart, None when the device has none yet
+    saved: dict[str, Any] | None = None
+
+class MiPowContextEntity(Entity):
+    # Device operations started by a service call are traced with its context
+    @callback
+    def async_set_context(self, context: Context) -> None:
+        super().async_set_context(context)
+        TRACE_CONTEXT.set(context.id)
 
 def map_to_device_info(device: MiPow) -> DeviceInfo:
     model: str = device.device_info.model
@@ -42,3 +91,19 @@ def map_to_device_info(device: MiPow) -> DeviceInfo:
         identifiers={(MIPOW_DOMAIN, device.address)},
         connections={(dr.CONNECTION_BLUETOOTH, device.address)},
     )
+
+@callback
+def async_get_airtime(hass: HomeAssistant) -> AirtimeRegistry:
+    # One account per adapter, shared by all the devices it serves
+    domain_data: dict[str, Any] = hass.data.setdefault(MIPOW_DOMAIN, {})
+    if DATA_AIRTIME not in domain_data:
+        domain_data[DATA_AIRTIME] = AirtimeRegistry()
+    return domain_data[DATA_AIRTIME]
+
+def get_target_data(hass: HomeAssistant, entry_ids: set[str]) -> list[MiPowData]:
+    entries: dict[str, Any] = hass.data.get(MIPOW_DOMAIN, {})
+    return [
+        entries[entry_id]
+        for entry_id in entry_ids
+        if isinstance(entries.get(entry_id), MiPowData)
+    ]
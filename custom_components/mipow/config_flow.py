@@ -1,15 +1,35 @@
 import logging
 from bleak.backends.device import BLEDevice
-from homeassistant.config_entries import ConfigFlow
+from homeassistant.config_entries import ConfigEntry, ConfigFlow, OptionsFlow
 from homeassistant.components.bluetooth import (
     BluetoothServiceInfoBleak,
+    async_ble_device_from_address,
     async_discovered_service_info,
 )
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.const import CONF_ADDRESS
+from homeassistant.core import callback
 import voluptuous as vol
-from .component import MIPOW_DOMAIN
-from .mipow import MiPow
+from .component import (
+    MIPOW_DOMAIN,
+    CONF_AIRTIME_BUDGET,
+    CONF_BATCH_CALLBACKS,
+    CONF_LOOP_PROFILE,
+    CONF_OWNERSHIP,
+    CONF_RECORD_GATT,
+    CONF_SHARED_COORDINATOR,
+    CONF_TRACE,
+    async_get_airtime,
+)
+from .pymipow import (
+    MiPow,
+    probe_devices,
+    OWNERSHIP_DEVICE,
+    OWNERSHIP_HOME_ASSISTANT,
+)
+from .pymipow.airtime import adapter_name
+from .pymipow.capabilities import is_mipow_advertisement
+from .state import async_get_state_store
 from bleak.exc import BleakError
 import asyncio
 
@@ -20,6 +40,12 @@ BLEAK_EXCEPTIONS = (AttributeError, BleakError, asyncio.exceptions.TimeoutError)
 class MiPowConfigFlow(ConfigFlow, domain=MIPOW_DOMAIN):
     def __init__(self) -> None:
         self._discovered_devices: dict[str, BluetoothServiceInfoBleak] = {}
+        self._reachable_devices: dict[str, bool] | None = None
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: ConfigEntry) -> OptionsFlow:
+        return MiPowOptionsFlow(config_entry)
 
     async def async_step_bluetooth(
         self, discovery_info: BluetoothServiceInfoBleak
@@ -37,8 +63,12 @@ class MiPowConfigFlow(ConfigFlow, domain=MIPOW_DOMAIN):
         if not self._discovered_devices:
             current_addresses = self._async_current_ids()
             for discovery in async_discovered_service_info(self.hass):
-
-                if discovery.address not in current_addresses:
+                # Only devices advertising like the manifest matchers, nothing
+                # else nearby is connected to
+                if (
+                    discovery.address not in current_addresses
+                    and is_mipow_advertisement(discovery.advertisement)
+                ):
                     self._discovered_devices[discovery.address] = discovery
 
         if not self._discovered_devices:
@@ -54,13 +84,12 @@ class MiPowConfigFlow(ConfigFlow, domain=MIPOW_DOMAIN):
 
             mipow = MiPow(device)
             try:
-                await mipow.update()
+                await mipow.probe()
             except BLEAK_EXCEPTIONS:
                 errors["base"] = "cannot_connect"
             except Exception:
                 errors["base"] = "unknown"
             else:
-                await mipow.stop()
                 return self.async_create_entry(
                     title=f"MiPow {device.name}({device.address})",
                     data={
@@ -68,11 +97,20 @@ class MiPowConfigFlow(ConfigFlow, domain=MIPOW_DOMAIN):
                     },
                 )
 
+        if self._reachable_devices is None:
+            # The MiPow devices only, a few at a time
+            self._reachable_devices = await probe_devices(
+                [
+                    service_info.device
+                    for service_info in self._discovered_devices.values()
+                ]
+            )
+
         data_schema = vol.Schema(
             {
                 vol.Required(CONF_ADDRESS): vol.In(
                     {
-                        service_info.address: f"{service_info.name} ({service_info.address})"
+                        service_info.address: self._get_device_label(service_info)
                         for service_info in self._discovered_devices.values()
                     }
                 ),
@@ -83,3 +121,69 @@ class MiPowConfigFlow(ConfigFlow, domain=MIPOW_DOMAIN):
             data_schema=data_schema,
             errors=errors,
         )
+
+    def _get_device_label(self, service_info: BluetoothServiceInfoBleak) -> str:
+        label: str = f"{service_info.name} ({service_info.address})"
+        if not self._reachable_devices.get(service_info.address, True):
+            label += " - unreachable"
+        return label
+
+
+class MiPowOptionsFlow(OptionsFlow):
+    def __init__(self, config_entry: ConfigEntry) -> None:
+        self._config_entry = config_entry
+
+    async def async_step_init(self, user_input=None) -> FlowResult:
+        # The airtime budget is shared by the devices of the adapter, it is saved
+        # per adapter instead of in the options of the device
+        adapter: str = adapter_name(
+            async_ble_device_from_address(
+                self.hass, self._config_entry.data[CONF_ADDRESS].upper(), True
+            )
+        )
+        store = async_get_state_store(self.hass)
+        if user_input is not None:
+            budget: int = user_input.pop(CONF_AIRTIME_BUDGET)
+            store.async_set_airtime_budget(adapter, budget)
+            async_get_airtime(self.hass).set_budget(adapter, budget / 100)
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self._config_entry.options
+        data_schema = vol.Schema(
+            {
+                vol.Required(
+                    CONF_OWNERSHIP,
+                    default=options.get(CONF_OWNERSHIP, OWNERSHIP_HOME_ASSISTANT),
+                ): vol.In(
+                    {
+                        OWNERSHIP_HOME_ASSISTANT: "Home Assistant",
+                        OWNERSHIP_DEVICE: "Device",
+                    }
+                ),
+                vol.Required(
+                    CONF_SHARED_COORDINATOR,
+                    default=options.get(CONF_SHARED_COORDINATOR, False),
+                ): bool,
+                vol.Required(
+                    CONF_RECORD_GATT,
+                    default=options.get(CONF_RECORD_GATT, False),
+                ): bool,
+                vol.Required(
+                    CONF_TRACE,
+                    default=options.get(CONF_TRACE, False),
+                ): bool,
+                vol.Required(
+                    CONF_LOOP_PROFILE,
+                    default=options.get(CONF_LOOP_PROFILE, False),
+                ): bool,
+                vol.Required(
+                    CONF_BATCH_CALLBACKS,
+                    default=options.get(CONF_BATCH_CALLBACKS, False),
+                ): bool,
+                vol.Required(
+                    CONF_AIRTIME_BUDGET,
+                    default=store.get_airtime_budget(adapter),
+                ): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+            }
+        )
+        return self.async_show_form(step_id="init", data_schema=data_schema)
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from dataclasses import asdict
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from typing import Any
+
+from .component import MIPOW_DOMAIN, MiPowData
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    data: MiPowData = hass.data[MIPOW_DOMAIN][entry.entry_id]
+    device = data.device
+    stats = device.command_stats
+    return {
+        "options": dict(entry.options),
+        "connected": device.connected,
+        "device_profile": device.profile.name,
+        "last_command": asdict(stats) if stats else None,
+        "loop_profile": device.profiler.summary() if device.profiler else None,
+        "airtime": device.airtime.summary() if device.airtime else None,
+        "adapter_airtime": (
+            device.airtime.adapter.summary() if device.airtime else None
+        ),
+    }
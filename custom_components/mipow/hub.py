@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+import logging
+from typing import Any
+
+from .component import MIPOW_DOMAIN, DATA_HUB, UPDATE_SECONDS
+from .pymipow import MiPow
+from .pymipow.fleet import Fleet
+from .pymipow.scheduler import DeadlineScheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MiPowHub:
+    def __init__(
+        self, hass: HomeAssistant, interval: float = UPDATE_SECONDS
+    ) -> None:
+        self._coordinators: dict[str, DataUpdateCoordinator] = {}
+        self._fleet = Fleet(
+            interval,
+            self._async_updated,
+            self._async_update_failed,
+            DeadlineScheduler(hass.loop),
+            hass.async_create_task,
+        )
+
+    @property
+    def scheduler(self) -> DeadlineScheduler:
+        return self._fleet.scheduler
+
+    def __len__(self) -> int:
+        return len(self._fleet)
+
+    @callback
+    def add(self, device: MiPow, coordinator: DataUpdateCoordinator) -> None:
+        self._coordinators[device.address] = coordinator
+        self._fleet.add(device)
+
+    @callback
+    def remove(self, device: MiPow) -> None:
+        self._fleet.remove(device)
+        self._coordinators.pop(device.address, None)
+
+    @callback
+    def stop(self) -> None:
+        self._fleet.stop()
+        self._coordinators.clear()
+
+    @callback
+    def _async_updated(self, device: MiPow) -> None:
+        if coordinator := self._coordinators.get(device.address):
+            coordinator.async_set_updated_data(None)
+
+    @callback
+    def _async_update_failed(self, device: MiPow, ex: Exception) -> None:
+        if coordinator := self._coordinators.get(device.address):
+            coordinator.async_set_update_error(ex)
+
+
+@callback
+def async_get_hub(hass: HomeAssistant) -> MiPowHub:
+    domain_data: dict[str, Any] = hass.data.setdefault(MIPOW_DOMAIN, {})
+    if DATA_HUB not in domain_data:
+        domain_data[DATA_HUB] = MiPowHub(hass)
+    return domain_data[DATA_HUB]
+
+
+@callback
+def async_remove_from_hub(hass: HomeAssistant, device: MiPow) -> None:
+    domain_data: dict[str, Any] = hass.data.get(MIPOW_DOMAIN, {})
+    hub: MiPowHub | None = domain_data.get(DATA_HUB)
+    if hub is None:
+        return
+
+    hub.remove(device)
+    if not len(hub):
+        hub.stop()
+        domain_data.pop(DATA_HUB)
@@ -12,31 +12,64 @@ from homeassistant.components.light import (
     LightEntityFeature,
     LightEntity,
 )
-from homeassistant.const import STATE_ON
+from homeassistant.const import STATE_OFF, STATE_ON
 from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv, entity_platform
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import (
     CoordinatorEntity,
     DataUpdateCoordinator,
 )
 from homeassistant.helpers.restore_state import RestoreEntity
-import homeassistant.util.color as color_util
 import logging
 from typing import Any
-from .mipow import MiPow, MIPOW_EFFECT_LIGHT_CODE
-from .component import MIPOW_DOMAIN, MiPowEffects, map_to_device_info, MiPowData
+import voluptuous as vol
+from .pymipow.codec import TIMER_MODE_DOZE, TIMER_MODE_WAKEUP, TimerSlot
+from .pymipow import MiPow, MIPOW_EFFECT_LIGHT_CODE, MIPOW_SCHEDULE_SLOTS
+from .component import (
+    MIPOW_DOMAIN,
+    ATTR_ACTION,
+    ATTR_DELAY,
+    ATTR_FADE,
+    ATTR_PAUSE,
+    ATTR_REPETITIONS,
+    ATTR_SCHEDULES,
+    ATTR_SLOT,
+    ATTR_TIME,
+    ATTR_TIMER,
+    ATTR_TIMERS,
+    SERVICE_SET_EFFECT,
+    SERVICE_SYNC_SCHEDULES,
+    CandleEffectsMap,
+    MiPowEffects,
+    map_to_device_info,
+    MiPowContextEntity,
+    MiPowData,
+)
+from .color import base_color, color_brightness, scale_color
+from .state import async_get_state_store
 
 _LOGGER = logging.getLogger(__name__)
 
-CandleEffectsMap = {
-    MiPowEffects.FLASH: 0,
-    MiPowEffects.PULSE: 1,
-    MiPowEffects.COLORLOOP: 2,
-    MiPowEffects.RAINBOW: 3,
-    MiPowEffects.CANDLE: 4,
-    MiPowEffects.LIGHT: MIPOW_EFFECT_LIGHT_CODE,
+TimerActionsMap = {
+    STATE_ON: TIMER_MODE_WAKEUP,
+    STATE_OFF: TIMER_MODE_DOZE,
 }
 
+SCHEDULE_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_ACTION): vol.In(TimerActionsMap),
+        vol.Required(ATTR_TIME): cv.time,
+        vol.Optional(ATTR_RGBW_COLOR, default=(0, 0, 0, 255)): vol.All(
+            vol.ExactSequence((cv.byte,) * 4), vol.Coerce(tuple)
+        ),
+        vol.Optional(ATTR_FADE, default=0): vol.All(
+            vol.Coerce(int), vol.Range(min=0, max=255)
+        ),
+    }
+)
+
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -44,32 +77,81 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     data: MiPowData = hass.data[MIPOW_DOMAIN][entry.entry_id]
-    async_add_entities([MiPowLightEntity(data.coordinator, data.device)])
-
-
-class MiPowLightEntity(CoordinatorEntity, LightEntity, RestoreEntity):
+    async_add_entities([MiPowLightEntity(data.coordinator, data.device, data.saved)])
+
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(
+        SERVICE_SYNC_SCHEDULES,
+        {
+            vol.Required(ATTR_SCHEDULES): vol.All(
+                cv.ensure_list,
+                [SCHEDULE_SCHEMA],
+                vol.Length(max=MIPOW_SCHEDULE_SLOTS),
+            ),
+        },
+        "async_sync_schedules",
+    )
+    platform.async_register_entity_service(
+        SERVICE_SET_EFFECT,
+        {
+            vol.Required(ATTR_EFFECT): vol.In(CandleEffectsMap),
+            vol.Optional(ATTR_RGBW_COLOR): vol.All(
+                vol.ExactSequence((cv.byte,) * 4), vol.Coerce(tuple)
+            ),
+            vol.Optional(ATTR_DELAY): cv.byte,
+            vol.Optional(ATTR_REPETITIONS): cv.byte,
+            vol.Optional(ATTR_PAUSE): cv.byte,
+            vol.Optional(ATTR_TIMER): vol.All(
+                vol.Coerce(int), vol.Range(min=0, max=24 * 60 - 1)
+            ),
+        },
+        "async_set_effect",
+    )
+
+
+class MiPowLightEntity(
+    MiPowContextEntity, CoordinatorEntity, LightEntity, RestoreEntity
+):
     _attr_has_entity_name = True
 
-    def __init__(self, coordinator: DataUpdateCoordinator, device: MiPow) -> None:
+    def __init__(
+        self,
+        coordinator: DataUpdateCoordinator,
+        device: MiPow,
+        saved: dict[str, Any] | None = None,
+    ) -> None:
         super().__init__(coordinator)
         self._device = device
+        self._saved: dict[str, Any] | None = saved
         self._attr_unique_id = device.address
         self._attr_effect = MiPowEffects.LIGHT
         self._attr_device_info = map_to_device_info(device)
         self._attr_supported_color_modes = {ColorMode.RGBW, ColorMode.WHITE}
         self._attr_effect_list = [
-            MiPowEffects.LIGHT,
-            MiPowEffects.CANDLE,
-            MiPowEffects.PULSE,
-            MiPowEffects.FLASH,
-            MiPowEffects.COLORLOOP,
-            MiPowEffects.RAINBOW,
+            effect
+            for effect in (
+                MiPowEffects.LIGHT,
+                MiPowEffects.CANDLE,
+                MiPowEffects.PULSE,
+                MiPowEffects.FLASH,
+                MiPowEffects.COLORLOOP,
+                MiPowEffects.RAINBOW,
+            )
+            if effect in device.effects
         ]
         self._attr_supported_features = (
             LightEntityFeature.EFFECT | LightEntityFeature.FLASH
         )
         self._attr_color_mode = ColorMode.RGBW
         self._attr_rgbw_color = (128, 128, 128, 128)
+        self._base_color: tuple[int, int, int] = base_color(128, 128, 128)
+        if saved:
+            # Colour and mode the light turns on with, also kept while it is off
+            if saved.get(ATTR_RGBW_COLOR):
+                self._attr_rgbw_color = tuple(saved[ATTR_RGBW_COLOR])
+                self._base_color = self._get_base_color(self._attr_rgbw_color)
+            self._attr_color_mode = saved.get(ATTR_COLOR_MODE, ColorMode.RGBW)
+            self._attr_effect = self._get_effect_name(device.effect)
         self._async_update_attrs()
 
     async def async_turn_off(self, **kwargs: Any) -> None:
@@ -87,7 +169,7 @@ class MiPowLightEntity(CoordinatorEntity, LightEntity, RestoreEntity):
 
         if ATTR_EFFECT in kwargs:
             effect = kwargs.get(ATTR_EFFECT)
-            if not effect in CandleEffectsMap:
+            if not effect in self._device.effects:
                 effect = MiPowEffects.LIGHT
 
         if ATTR_FLASH in kwargs:
@@ -115,11 +197,8 @@ class MiPowLightEntity(CoordinatorEntity, LightEntity, RestoreEntity):
             if self._is_only_white(rgbw_color):
                 rgbw_color = (0, 0, 0, brightness)
             else:
-                hsv = color_util.color_RGB_to_hsv(
-                    rgbw_color[0], rgbw_color[1], rgbw_color[2]
-                )
-                rgb_color = color_util.color_hsv_to_RGB(
-                    hsv[0], hsv[1], int(brightness / 255 * 100)
+                rgb_color = scale_color(
+                    self._get_base_color(rgbw_color), int(brightness)
                 )
                 rgbw_color = (rgb_color[0], rgb_color[1], rgb_color[2], rgbw_color[3])
 
@@ -135,6 +214,79 @@ class MiPowLightEntity(CoordinatorEntity, LightEntity, RestoreEntity):
 
         self._attr_color_mode = mode
         self._attr_effect = effect
+        self._async_save_state()
+
+    async def async_set_effect(
+        self,
+        effect: str,
+        rgbw_color: tuple[int, int, int, int] | None = None,
+        delay: int | None = None,
+        repetitions: int | None = None,
+        pause: int | None = None,
+        timer: int | None = None,
+    ) -> None:
+        if timer is not None and not self._device.device_info.has_timer:
+            raise HomeAssistantError(f"{self._device.name} does not support timers")
+
+        rgbw_color = rgbw_color or self._attr_rgbw_color
+        # One composite write, the number entities follow from the device callback
+        await self._device.set_light(
+            red=rgbw_color[0],
+            green=rgbw_color[1],
+            blue=rgbw_color[2],
+            white=rgbw_color[3],
+            effect=self._get_effect_id(effect),
+            delay=delay,
+            repetitions=repetitions,
+            pause=pause,
+            timer=timer,
+        )
+        self._attr_effect = effect
+
+    async def async_sync_schedules(self, schedules: list[dict[str, Any]]) -> None:
+        if not self._device.device_info.has_timer:
+            raise HomeAssistantError(f"{self._device.name} does not support timers")
+
+        slots: list[TimerSlot] = []
+        for schedule in schedules:
+            mode: int = TimerActionsMap[schedule[ATTR_ACTION]]
+            rgbw_color = (
+                schedule[ATTR_RGBW_COLOR] if mode == TIMER_MODE_WAKEUP else (0, 0, 0, 0)
+            )
+            slots.append(
+                TimerSlot(
+                    mode=mode,
+                    hour=schedule[ATTR_TIME].hour,
+                    minute=schedule[ATTR_TIME].minute,
+                    red=rgbw_color[0],
+                    green=rgbw_color[1],
+                    blue=rgbw_color[2],
+                    white=rgbw_color[3],
+                    runtime=schedule[ATTR_FADE],
+                )
+            )
+
+        written: int = await self._device.sync_schedules(slots)
+        _LOGGER.debug("Synced schedules of %s, written %s", self._device.name, written)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        timers = self._device.timers
+        if not timers:
+            return None
+
+        modes = {mode: action for action, mode in TimerActionsMap.items()}
+        return {
+            ATTR_TIMERS: [
+                {
+                    ATTR_SLOT: slot_id,
+                    ATTR_ACTION: modes.get(timer.mode, timer.mode),
+                    ATTR_TIME: f"{timer.hour:02}:{timer.minute:02}",
+                }
+                for slot_id, timer in enumerate(timers)
+                if timer.enabled
+            ]
+        }
 
     @property
     def capability_attributes(self) -> dict[str, Any]:
@@ -150,6 +302,9 @@ class MiPowLightEntity(CoordinatorEntity, LightEntity, RestoreEntity):
             self._device.register_callback(self._handle_coordinator_update)
         )
         await super().async_added_to_hass()
+        if self._saved is not None:
+            # The device was given the saved state before the first connect
+            return
 
         last_state = await self.async_get_last_state()
         _LOGGER.debug("Last state for %s: %s", self._attr_unique_id, last_state)
@@ -192,8 +347,20 @@ class MiPowLightEntity(CoordinatorEntity, LightEntity, RestoreEntity):
 
     @callback
     def _handle_coordinator_update(self, *args: Any) -> None:
-        self._async_update_attrs()
+        with self._device.measure("light._async_update_attrs"):
+            self._async_update_attrs()
         self.async_write_ha_state()
+        self._async_save_state()
+
+    @callback
+    def _async_save_state(self) -> None:
+        async_get_state_store(self.hass).async_set(
+            self._device.address,
+            {
+                ATTR_RGBW_COLOR: list(self._attr_rgbw_color),
+                ATTR_COLOR_MODE: self._attr_color_mode,
+            },
+        )
 
     @callback
     def _async_update_attrs(self) -> None:
@@ -202,19 +369,40 @@ class MiPowLightEntity(CoordinatorEntity, LightEntity, RestoreEntity):
         _LOGGER.debug("_async_update_attrs %s %s", device.rgbw, device.is_on)
 
         if device.is_on:
-            hsv = color_util.color_RGB_to_hsv(rgbw[0], rgbw[1], rgbw[2])
             self._attr_rgbw_color = rgbw
-            self._attr_brightness = (hsv[2] / 100) * 255
+            self._base_color = self._get_base_color(rgbw)
+            self._attr_brightness = color_brightness(rgbw[0], rgbw[1], rgbw[2])
             if self._is_only_white(rgbw):
                 self._attr_brightness = rgbw[3]
+            self._attr_effect = self._get_effect_name(
+                device.effect, self._attr_effect
+            )
 
         self._attr_is_on = device.is_on
 
+    def _get_base_color(self, rgbw) -> tuple[int, int, int]:
+        # Keep the known base colour while it still describes the colour,
+        # so hue and saturation survive brightness changes without rounding drift
+        brightness: int = color_brightness(rgbw[0], rgbw[1], rgbw[2])
+        if brightness == 0 or scale_color(self._base_color, brightness) == (
+            rgbw[0],
+            rgbw[1],
+            rgbw[2],
+        ):
+            return self._base_color
+        return base_color(rgbw[0], rgbw[1], rgbw[2])
+
     def _is_only_white(self, rgbw) -> bool:
         return rgbw[0] == 0 and rgbw[1] == 0 and rgbw[2] == 0
 
+    def _get_effect_name(self, effectId: int, default: str | None = None) -> str:
+        return next(
+            (name for name, code in self._device.effects.items() if code == effectId),
+            default or MiPowEffects.LIGHT,
+        )
+
     def _get_effect_id(self, effectName) -> int:
         if effectName is None:
             return MIPOW_EFFECT_LIGHT_CODE
 
-        return CandleEffectsMap[effectName]
+        return self._device.effects.get(effectName, MIPOW_EFFECT_LIGHT_CODE)
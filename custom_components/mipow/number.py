@@ -1,11 +1,12 @@
 from homeassistant.components.number import NumberEntityDescription
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.const import TIME_MINUTES
 from homeassistant.helpers.entity import EntityCategory
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.components.number import RestoreNumber
 import logging
+from typing import Any
 
 from .component import (
     MIPOW_DOMAIN,
@@ -14,9 +15,10 @@ from .component import (
     ATTR_PAUSE,
     ATTR_TIMER,
     map_to_device_info,
+    MiPowContextEntity,
     MiPowData,
 )
-from .mipow import MiPow
+from .pymipow import MiPow
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -28,27 +30,35 @@ async def async_setup_entry(
 ) -> None:
     data: MiPowData = hass.data[MIPOW_DOMAIN][entry.entry_id]
 
+    # The values are in the saved state of the device, nothing is restored
+    restored: bool = data.saved is not None
     async_add_entities(
         [
-            MiPowDelayEntity(data.device),
-            MiPowRepetitionsEntity(data.device),
-            MiPowPauseEntity(data.device),
+            MiPowDelayEntity(data.device, restored),
+            MiPowRepetitionsEntity(data.device, restored),
+            MiPowPauseEntity(data.device, restored),
         ]
     )
 
     if data.device.device_info.has_timer:
-        async_add_entities([MiPowTimeOffEntity(data.device)])
+        async_add_entities([MiPowTimeOffEntity(data.device, restored)])
 
 
-class MiPowNumber(RestoreNumber):
-    def __init__(self, device: MiPow, key: str) -> None:
+class MiPowNumber(MiPowContextEntity, RestoreNumber):
+    def __init__(self, device: MiPow, key: str, restored: bool = False) -> None:
         self._device: MiPow = device
+        self._restored: bool = restored
         self._attr_device_info = map_to_device_info(device)
         self._attr_name = key
         self._attr_unique_id = f"{device.address}_{key}"
 
     async def async_added_to_hass(self) -> None:
+        self.async_on_remove(
+            self._device.register_callback(self._handle_device_update)
+        )
         await super().async_added_to_hass()
+        if self._restored:
+            return
         last_number_data = await self.async_get_last_number_data()
         _LOGGER.debug(
             "Last value of %s = %s", self.__class__.__name__, last_number_data
@@ -56,10 +66,16 @@ class MiPowNumber(RestoreNumber):
         if last_number_data and last_number_data.native_value is not None:
             await self.async_set_native_value(last_number_data.native_value)
 
+    @callback
+    def _handle_device_update(self, *args: Any) -> None:
+        if self.native_value != self._attr_native_value:
+            self._attr_native_value = self.native_value
+            self.async_write_ha_state()
+
 
 class MiPowDelayEntity(MiPowNumber):
-    def __init__(self, device: MiPow) -> None:
-        super().__init__(device, ATTR_DELAY)
+    def __init__(self, device: MiPow, restored: bool = False) -> None:
+        super().__init__(device, ATTR_DELAY, restored)
         self.entity_description = NumberEntityDescription(
             key=ATTR_DELAY,
             name="Delay",
@@ -80,8 +96,8 @@ class MiPowDelayEntity(MiPowNumber):
 
 
 class MiPowRepetitionsEntity(MiPowNumber):
-    def __init__(self, device: MiPow) -> None:
-        super().__init__(device, ATTR_REPETITIONS)
+    def __init__(self, device: MiPow, restored: bool = False) -> None:
+        super().__init__(device, ATTR_REPETITIONS, restored)
         self.entity_description = NumberEntityDescription(
             key=ATTR_REPETITIONS,
             name="Repetitions",
@@ -102,8 +118,8 @@ class MiPowRepetitionsEntity(MiPowNumber):
 
 
 class MiPowPauseEntity(MiPowNumber):
-    def __init__(self, device: MiPow) -> None:
-        super().__init__(device, ATTR_PAUSE)
+    def __init__(self, device: MiPow, restored: bool = False) -> None:
+        super().__init__(device, ATTR_PAUSE, restored)
         self.entity_description = NumberEntityDescription(
             key=ATTR_PAUSE,
             name="Pause",
@@ -124,8 +140,8 @@ class MiPowPauseEntity(MiPowNumber):
 
 
 class MiPowTimeOffEntity(MiPowNumber):
-    def __init__(self, device: MiPow) -> None:
-        super().__init__(device, ATTR_TIMER)
+    def __init__(self, device: MiPow, restored: bool = False) -> None:
+        super().__init__(device, ATTR_TIMER, restored)
         self.entity_description = NumberEntityDescription(
             key=ATTR_TIMER,
             name="Time off",
@@ -138,6 +154,9 @@ class MiPowTimeOffEntity(MiPowNumber):
         )
         self._attr_native_value = 0
 
+    @property
+    def native_value(self) -> float | None:
+        return self._device.timer
+
     async def async_set_native_value(self, value: float) -> None:
-        self._attr_native_value = value
         await self._device.set_light(timer=int(value))
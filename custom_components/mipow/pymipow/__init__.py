@@ -0,0 +1,48 @@
+#
+# Asyncio library to control MiPow Playbulb devices without Home Assistant
+#
+# The names are imported lazily, so "import pymipow.codec" or the command line
+# help do not pay for importing bleak.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .device import (
+        MIPOW_DISCONNECT_SECONDS,
+        MIPOW_EFFECT_LIGHT_CODE,
+        MIPOW_EFFECTS,
+        MIPOW_PROBE_PARALLELISM,
+        MIPOW_SCHEDULE_SLOTS,
+        OWNERSHIP_DEVICE,
+        OWNERSHIP_HOME_ASSISTANT,
+        DesiredState,
+        MiPow,
+        MiPowDeviceInfo,
+        State,
+        probe_devices,
+    )
+
+__all__ = [
+    "MIPOW_DISCONNECT_SECONDS",
+    "MIPOW_EFFECT_LIGHT_CODE",
+    "MIPOW_EFFECTS",
+    "MIPOW_PROBE_PARALLELISM",
+    "MIPOW_SCHEDULE_SLOTS",
+    "OWNERSHIP_DEVICE",
+    "OWNERSHIP_HOME_ASSISTANT",
+    "DesiredState",
+    "MiPow",
+    "MiPowDeviceInfo",
+    "State",
+    "probe_devices",
+]
+
+
+def __getattr__(name: str) -> Any:
+    if name in __all__:
+        return getattr(import_module(".device", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,269 @@
+#
+# Airtime accounting of the MiPow Playbulb devices per device and per adapter
+#
+# Every connect, read and write is counted with its size and the time the link
+# was busy, split by the kind of work which caused it, e.g. polls, battery reads,
+# commands or reconciling after a reconnect. Background work of a device waits
+# while its adapter was busy for more than the budget of the recent window. The
+# budget is set once per adapter. Only the reads and writes count against it,
+# establishing a connection mostly waits for the device to advertise and has its
+# own limit, the connection slots.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+import time
+from typing import Any
+
+AIRTIME_WINDOW_SECONDS: float = 60
+# Share of the window the adapter may be busy before background work waits
+DEFAULT_AIRTIME_BUDGET: float = 0.5
+DEFAULT_ADAPTER: str = "default"
+
+KIND_POLL: str = "poll"
+KIND_BATTERY: str = "battery"
+KIND_DEVICE_INFO: str = "device_info"
+KIND_CONNECT: str = "connect"
+KIND_RECONCILE: str = "reconcile"
+KIND_COMMAND: str = "command"
+KIND_OTHER: str = "other"
+BACKGROUND_KINDS: frozenset[str] = frozenset(
+    (KIND_POLL, KIND_BATTERY, KIND_DEVICE_INFO)
+)
+
+# Kind of work of the public device operations
+OPERATION_KINDS: dict[str, str] = {
+    "update": KIND_POLL,
+    "read_state": KIND_POLL,
+    "refresh_battery": KIND_BATTERY,
+    "set_light": KIND_COMMAND,
+    "turn_off": KIND_COMMAND,
+    "snapshot": "scene",
+    "restore": "scene",
+    "alert": "alert",
+    "play": "effect",
+    "sync_schedules": "schedules",
+    "probe": "probe",
+}
+
+AIRTIME_KIND: ContextVar[str] = ContextVar("mipow_airtime_kind", default=KIND_OTHER)
+
+Connector = Callable[..., Awaitable[Any]]
+
+
+def adapter_name(device: Any) -> str:
+    # The bluetooth integration names the adapter or proxy in the details
+    details = getattr(device, "details", None)
+    if isinstance(details, dict):
+        if details.get("source"):
+            return str(details["source"])
+        path: str = details.get("path") or ""
+        if path.startswith("/org/bluez/"):
+            return path.split("/")[3]
+    return DEFAULT_ADAPTER
+
+
+@dataclass
+class AirtimeStats:
+    operations: int = 0
+    bytes: int = 0
+    busy: float = 0
+
+    def add(self, size: int, elapsed: float) -> None:
+        self.operations += 1
+        self.bytes += size
+        self.busy += elapsed
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "operations": self.operations,
+            "bytes": self.bytes,
+            "busy_ms": round(self.busy * 1000, 1),
+        }
+
+
+class AdapterAirtime:
+    def __init__(
+        self,
+        name: str,
+        window: float = AIRTIME_WINDOW_SECONDS,
+        budget: float = DEFAULT_AIRTIME_BUDGET,
+    ) -> None:
+        self._name: str = name
+        self._window: float = window
+        self._budget: float = budget
+        self._kinds: dict[str, AirtimeStats] = {}
+        # End time and busy time of the recent operations
+        self._recent: deque[tuple[float, float]] = deque()
+        self._recent_busy: float = 0
+        self._deferred: int = 0
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def budget(self) -> float:
+        return self._budget
+
+    def set_budget(self, budget: float) -> None:
+        self._budget = budget
+
+    @property
+    def saturated(self) -> bool:
+        return self._budget > 0 and self.utilisation() >= self._budget
+
+    def add(self, kind: str, size: int, elapsed: float, budgeted: bool = True) -> None:
+        self._kinds.setdefault(kind, AirtimeStats()).add(size, elapsed)
+        if not budgeted:
+            return
+        self._recent.append((time.monotonic(), elapsed))
+        self._recent_busy += elapsed
+
+    def utilisation(self) -> float:
+        # Operations of many devices overlap, so the value may exceed 1
+        horizon: float = time.monotonic() - self._window
+        while self._recent and self._recent[0][0] < horizon:
+            self._recent_busy -= self._recent.popleft()[1]
+        return max(0, self._recent_busy) / self._window
+
+    def deferred(self) -> None:
+        self._deferred += 1
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "budget": self._budget,
+            "utilisation": round(self.utilisation(), 3),
+            "deferred": self._deferred,
+            "kinds": {kind: stats.as_dict() for kind, stats in self._kinds.items()},
+        }
+
+
+class AirtimeRegistry:
+    def __init__(self, window: float = AIRTIME_WINDOW_SECONDS) -> None:
+        self._window: float = window
+        self._adapters: dict[str, AdapterAirtime] = {}
+
+    def adapter(self, name: str) -> AdapterAirtime:
+        if name not in self._adapters:
+            self._adapters[name] = AdapterAirtime(name, self._window)
+        return self._adapters[name]
+
+    def set_budget(self, name: str, budget: float) -> None:
+        self.adapter(name).set_budget(budget)
+
+    def device(self, device: Any) -> DeviceAirtime:
+        return DeviceAirtime(self.adapter(adapter_name(device)))
+
+    def summary(self) -> dict[str, Any]:
+        return {name: adapter.summary() for name, adapter in self._adapters.items()}
+
+
+class DeviceAirtime:
+    def __init__(self, adapter: AdapterAirtime) -> None:
+        self._adapter: AdapterAirtime = adapter
+        self._kinds: dict[str, AirtimeStats] = {}
+        self._deferred: int = 0
+
+    @property
+    def adapter(self) -> AdapterAirtime:
+        return self._adapter
+
+    @property
+    def saturated(self) -> bool:
+        return self._adapter.saturated
+
+    def defer(self, kind: str) -> bool:
+        # Interactive work always goes through
+        if kind not in BACKGROUND_KINDS or not self.saturated:
+            return False
+        self._deferred += 1
+        self._adapter.deferred()
+        return True
+
+    @contextmanager
+    def kind(self, name: str) -> Iterator[None]:
+        token = AIRTIME_KIND.set(name)
+        try:
+            yield
+        finally:
+            AIRTIME_KIND.reset(token)
+
+    def add(
+        self,
+        size: int,
+        elapsed: float,
+        kind: str | None = None,
+        budgeted: bool = True,
+    ) -> None:
+        kind = kind or AIRTIME_KIND.get()
+        self._kinds.setdefault(kind, AirtimeStats()).add(size, elapsed)
+        self._adapter.add(kind, size, elapsed, budgeted)
+
+    def wrap(self, connector: Connector) -> Connector:
+        async def _connect(
+            device: Any,
+            name: str,
+            disconnected_callback: Callable[[Any], None] | None = None,
+            cached_services: Any = None,
+        ) -> AirtimeClient:
+            start: float = time.perf_counter()
+            try:
+                client = await connector(
+                    device, name, disconnected_callback, cached_services
+                )
+            finally:
+                self.add(0, time.perf_counter() - start, KIND_CONNECT, False)
+            return AirtimeClient(self, client)
+
+        return _connect
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "adapter": self._adapter.name,
+            "deferred": self._deferred,
+            "kinds": {kind: stats.as_dict() for kind, stats in self._kinds.items()},
+        }
+
+
+class AirtimeClient:
+    def __init__(self, airtime: DeviceAirtime, client: Any) -> None:
+        self._airtime: DeviceAirtime = airtime
+        self._client = client
+
+    @property
+    def services(self) -> Any:
+        return self._client.services
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client.is_connected
+
+    async def read_gatt_char(self, characteristic: Any, **kwargs: Any) -> bytearray:
+        start: float = time.perf_counter()
+        result: bytearray = bytearray()
+        try:
+            result = await self._client.read_gatt_char(characteristic, **kwargs)
+            return result
+        finally:
+            self._airtime.add(len(result), time.perf_counter() - start)
+
+    async def write_gatt_char(
+        self,
+        characteristic: Any,
+        data: bytes | bytearray,
+        response: bool | None = None,
+    ) -> None:
+        start: float = time.perf_counter()
+        try:
+            await self._client.write_gatt_char(characteristic, data, response)
+        finally:
+            self._airtime.add(len(data), time.perf_counter() - start)
+
+    async def disconnect(self) -> bool:
+        return await self._client.disconnect()
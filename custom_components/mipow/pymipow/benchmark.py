@@ -0,0 +1,94 @@
+#
+# Micro-benchmark of the MiPow Playbulb packet encoders and decoders
+#
+# Every packet kind is encoded and decoded in a loop, after checking that the
+# decoded values match the encoded ones. The result is the mean time per call.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+from collections.abc import Callable
+import timeit
+
+from .codec import (
+    EFFECT_PACKET_SIZE,
+    TIMER_MODE_WAKEUP,
+    TIMER_SLOTS,
+    EffectPacket,
+    MiPowCodec,
+    TimerSlot,
+    decode_effect,
+    decode_rgbw,
+    decode_timers,
+    encode_alert,
+    encode_effect_packet,
+    encode_timer_disabled,
+)
+
+DEFAULT_ITERATIONS: int = 100_000
+
+EFFECT = EffectPacket(
+    red=255, green=80, blue=0, white=10, effect=1, repetitions=2, delay=20, pause=3
+)
+SLOT = TimerSlot(mode=TIMER_MODE_WAKEUP, hour=6, minute=30, red=255, runtime=10)
+
+
+def timers_read_back(packets: list[bytes | bytearray]) -> bytes:
+    # The device reads back (mode, hour, minute) of the written timer packets
+    return bytes(value for packet in packets for value in packet[1:2] + packet[7:5:-1])
+
+
+def check_round_trips() -> None:
+    codec = MiPowCodec()
+    rgbw = (1, 2, 3, 4)
+    if decode_rgbw(codec.encode_rgbw(*rgbw)) != rgbw:
+        raise AssertionError("rgbw packet does not round trip")
+
+    packet = codec.encode_effect(
+        red=EFFECT.red,
+        green=EFFECT.green,
+        blue=EFFECT.blue,
+        white=EFFECT.white,
+        effect=EFFECT.effect,
+        repetitions=EFFECT.repetitions,
+        delay=EFFECT.delay,
+        pause=EFFECT.pause,
+    )
+    if len(packet) != EFFECT_PACKET_SIZE or decode_effect(packet) != EFFECT:
+        raise AssertionError("effect packet does not round trip")
+    if encode_effect_packet(EFFECT) != bytes(packet):
+        raise AssertionError("effect packets of the codec and the scenes differ")
+
+    packets = [codec.encode_timer(slot_id, SLOT) for slot_id in range(TIMER_SLOTS)]
+    for slot in decode_timers(timers_read_back(packets)):
+        if (slot.mode, slot.hour, slot.minute) != (SLOT.mode, SLOT.hour, SLOT.minute):
+            raise AssertionError("timer packet does not round trip")
+
+    alert = encode_alert(255, 0, 0, 0, 0, 16)
+    if decode_effect(alert) != EffectPacket(255, 0, 0, 0, 0, 0, 16, 0):
+        raise AssertionError("alert packet does not round trip")
+
+
+def run_benchmark(iterations: int = DEFAULT_ITERATIONS) -> dict[str, float]:
+    check_round_trips()
+    codec = MiPowCodec()
+    rgbw: bytes = bytes(codec.encode_rgbw(1, 2, 3, 4))
+    effect: bytes = encode_effect_packet(EFFECT)
+    timers: bytes = timers_read_back(
+        [bytes(codec.encode_timer(slot_id, SLOT)) for slot_id in range(TIMER_SLOTS)]
+    )
+    calls: dict[str, Callable[[], object]] = {
+        "encode_rgbw": lambda: codec.encode_rgbw(1, 2, 3, 4),
+        "decode_rgbw": lambda: decode_rgbw(rgbw),
+        "encode_effect": lambda: codec.encode_effect(255, 80, 0, 10, 1, 2, 20, 3),
+        "decode_effect": lambda: decode_effect(effect),
+        "encode_timer": lambda: codec.encode_timer(1, SLOT),
+        "decode_timers": lambda: decode_timers(timers),
+        "encode_timer_disabled": lambda: encode_timer_disabled(0),
+        "encode_alert": lambda: encode_alert(255, 0, 0, 0, 0, 16),
+    }
+    # Nanoseconds per call
+    return {
+        name: round(timeit.timeit(call, number=iterations) / iterations * 1e9, 1)
+        for name, call in calls.items()
+    }
@@ -0,0 +1,86 @@
+#
+# Registry of the capabilities of known MiPow devices
+#
+# The device information and the battery probe are learnt on the first
+# successful connection of a device and kept per device address. Models which
+# advertise the same way can differ, e.g. BTL201 and BTL300, so the entries are
+# not shared between devices. A later connect reads only the firmware version
+# and reads the device information again when it changed. The registry can be
+# exported and loaded, so the capabilities survive a restart. It also keeps the
+# device profiles, the model and the firmware select the profile of a device.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+from dataclasses import asdict, dataclass
+from fnmatch import fnmatch
+from typing import TYPE_CHECKING, Any
+
+from .profiles import BUILTIN_PROFILES, GENERIC_PROFILE, DeviceProfile
+
+if TYPE_CHECKING:
+    from bleak.backends.scanner import AdvertisementData
+
+# Keep in sync with the bluetooth matchers in manifest.json
+ADVERTISED_NAME_PATTERNS: tuple[str, ...] = ("PLAYBULB*", "MIPOW*")
+
+
+def is_mipow_advertisement(advertisement: AdvertisementData | None) -> bool:
+    if advertisement is None or not advertisement.local_name:
+        return False
+    local_name: str = advertisement.local_name.upper()
+    return any(fnmatch(local_name, pattern) for pattern in ADVERTISED_NAME_PATTERNS)
+
+
+@dataclass(frozen=True)
+class Capabilities:
+    # The device information service, read once per device
+    manufacturer: str | None
+    hw_version: str | None
+    sw_version: str | None
+    model: str | None
+    serial: str | None
+    battery_powered: bool
+
+
+class CapabilityRegistry:
+    def __init__(self, profiles: tuple[DeviceProfile, ...] = BUILTIN_PROFILES) -> None:
+        # By the device address
+        self._capabilities: dict[str, Capabilities] = {}
+        self._profiles: list[DeviceProfile] = list(profiles)
+
+    def register_profile(self, profile: DeviceProfile) -> None:
+        # Registered profiles take precedence over the built in ones
+        self._profiles.insert(0, profile)
+
+    def find_profile(
+        self, model: str | None, firmware: str | None = None
+    ) -> DeviceProfile:
+        for profile in self._profiles:
+            if profile.matches(model, firmware):
+                return profile
+        return GENERIC_PROFILE
+
+    def get(self, address: str) -> Capabilities | None:
+        return self._capabilities.get(address.upper())
+
+    def register(self, address: str, capabilities: Capabilities) -> None:
+        self._capabilities[address.upper()] = capabilities
+
+    def export(self, address: str) -> dict[str, Any] | None:
+        capabilities = self.get(address)
+        if capabilities is None:
+            return None
+        return {"address": address.upper(), "capabilities": asdict(capabilities)}
+
+    def load(self, data: dict[str, Any]) -> None:
+        # Saved entries of an older format are dropped, the device is read again
+        try:
+            address: str = data["address"]
+            capabilities = Capabilities(**data["capabilities"])
+        except (KeyError, TypeError):
+            return
+        self._capabilities[address.upper()] = capabilities
+
+
+CAPABILITY_REGISTRY = CapabilityRegistry()
@@ -0,0 +1,493 @@
+#
+# Command line tool to control and benchmark many MiPow Playbulb devices at once
+#
+# Usage: PYTHONPATH=custom_components/mipow python -m pymipow --help
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import argparse
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime
+import logging
+import os
+import statistics
+import time
+from typing import TYPE_CHECKING, Any
+
+from .capabilities import is_mipow_advertisement
+from .codec import (
+    TIMER_MODE_DISABLED,
+    TIMER_MODE_DOZE,
+    TIMER_MODE_WAKEUP,
+    TimerSlot,
+)
+
+if TYPE_CHECKING:
+    from bleak.backends.device import BLEDevice
+    from bleak.backends.scanner import AdvertisementData
+    from .device import MiPow
+
+DEFAULT_CONCURRENCY: int = 3
+DEFAULT_SCAN_SECONDS: float = 5.0
+
+TIMER_ACTIONS: dict[str, int] = {
+    "on": TIMER_MODE_WAKEUP,
+    "off": TIMER_MODE_DOZE,
+}
+
+
+@dataclass(frozen=True)
+class DeviceResult:
+    address: str
+    latency: float
+    result: str | None = None
+    error: BaseException | None = None
+
+
+def _parse_rgbw(value: str) -> tuple[int, int, int, int]:
+    try:
+        rgbw = tuple(int(channel) for channel in value.split(","))
+    except ValueError as ex:
+        raise argparse.ArgumentTypeError(f"invalid colour {value}") from ex
+    if len(rgbw) != 4 or not all(0 <= channel <= 255 for channel in rgbw):
+        raise argparse.ArgumentTypeError(f"colour {value} is not R,G,B,W")
+    return rgbw
+
+
+def _parse_effect(value: str) -> int:
+    from .device import MIPOW_EFFECTS
+
+    if value in MIPOW_EFFECTS:
+        return MIPOW_EFFECTS[value]
+    try:
+        return int(value)
+    except ValueError as ex:
+        raise argparse.ArgumentTypeError(f"unknown effect {value}") from ex
+
+
+def _parse_schedule(value: str) -> TimerSlot:
+    # on@18:30=255,80,0,0/5 or off@23:00
+    try:
+        action, _, rest = value.partition("@")
+        rest, _, fade = rest.partition("/")
+        clock, _, color = rest.partition("=")
+        hour, minute = (int(part) for part in clock.split(":"))
+        rgbw = _parse_rgbw(color) if color else (0, 0, 0, 255)
+        mode = TIMER_ACTIONS[action]
+    except (KeyError, ValueError) as ex:
+        raise argparse.ArgumentTypeError(f"invalid schedule {value}") from ex
+
+    if mode == TIMER_MODE_DOZE:
+        rgbw = (0, 0, 0, 0)
+    return TimerSlot(
+        mode=mode,
+        hour=hour,
+        minute=minute,
+        red=rgbw[0],
+        green=rgbw[1],
+        blue=rgbw[2],
+        white=rgbw[3],
+        runtime=int(fade) if fade else 0,
+    )
+
+
+def _describe(mipow: MiPow) -> str:
+    from .device import MIPOW_EFFECTS
+
+    effects = {code: name for name, code in MIPOW_EFFECTS.items()}
+    result = (
+        f"{'on' if mipow.is_on else 'off'} rgbw={','.join(map(str, mipow.rgbw))}"
+        f" effect={effects.get(mipow.effect, mipow.effect)}"
+        f" delay={mipow.delay} repetitions={mipow.repetitions} pause={mipow.pause}"
+        f" timer={mipow.timer}"
+    )
+    if mipow.battery_level is not None:
+        result += f" battery={mipow.battery_level}%"
+    return result
+
+
+def _describe_timers(mipow: MiPow) -> str:
+    actions = {mode: action for action, mode in TIMER_ACTIONS.items()}
+    return " ".join(
+        f"{slot_id}:{actions.get(timer.mode, timer.mode)}"
+        f"@{timer.hour:02}:{timer.minute:02}"
+        if timer.mode != TIMER_MODE_DISABLED
+        else f"{slot_id}:-"
+        for slot_id, timer in enumerate(mipow.timers)
+    )
+
+
+async def _discover(
+    timeout: float,
+) -> dict[str, tuple[BLEDevice, AdvertisementData]]:
+    from bleak import BleakScanner
+
+    discovered = await BleakScanner.discover(timeout=timeout, return_adv=True)
+    return {
+        device.address.upper(): (device, advertisement)
+        for device, advertisement in discovered.values()
+    }
+
+
+async def _scan(args: argparse.Namespace) -> int:
+    discovered = await _discover(args.scan_timeout)
+    found: int = 0
+    for address, (device, advertisement) in sorted(discovered.items()):
+        if not is_mipow_advertisement(advertisement):
+            continue
+        found += 1
+        print(f"{address}  {advertisement.rssi:4} dBm  {advertisement.local_name}")
+    print(f"{found} device(s) found")
+    return 0
+
+
+async def _run_on_devices(
+    args: argparse.Namespace,
+    operation: Callable[[MiPow], Awaitable[str]],
+) -> int:
+    from .device import MiPow
+
+    discovered = await _discover(args.scan_timeout)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def _run(address: str) -> DeviceResult:
+        async with semaphore:
+            start: float = time.monotonic()
+            found = discovered.get(address.upper())
+            if found is None:
+                return DeviceResult(address, 0, error=LookupError("not found"))
+
+            session = f"{address.replace(':', '')}-{datetime.now():%Y%m%d-%H%M%S}"
+            recorder = tracer = None
+            if args.record:
+                from .recorder import GattRecorder
+
+                recorder = GattRecorder(
+                    os.path.join(args.record, f"{session.lower()}.jsonl"),
+                    found[0].address,
+                    found[0].name,
+                )
+            if args.trace:
+                from .trace import Tracer
+
+                tracer = Tracer(
+                    os.path.join(args.trace, f"{session.lower()}.trace.json"),
+                    found[0].name or found[0].address,
+                )
+            mipow = MiPow(found[0], recorder=recorder, tracer=tracer)
+            try:
+                # Read only, a command writes just what it changes
+                await mipow.read_state()
+                result = await operation(mipow)
+            except Exception as ex:  # pylint: disable=broad-except
+                return DeviceResult(address, time.monotonic() - start, error=ex)
+            finally:
+                await mipow.stop()
+            return DeviceResult(address, time.monotonic() - start, result=result)
+
+    results: list[DeviceResult] = await asyncio.gather(
+        *(_run(address) for address in args.addresses)
+    )
+    for result in results:
+        outcome = result.result if result.error is None else f"error: {result.error!r}"
+        print(f"{result.address}  {result.latency * 1000:8.1f} ms  {outcome}")
+
+    latencies = [result.latency for result in results if result.error is None]
+    if latencies:
+        print(
+            f"{len(latencies)}/{len(results)} ok,"
+            f" median {statistics.median(latencies) * 1000:.1f} ms,"
+            f" max {max(latencies) * 1000:.1f} ms"
+        )
+    return 0 if len(latencies) == len(results) else 1
+
+
+async def _get(args: argparse.Namespace) -> int:
+    async def _operation(mipow: MiPow) -> str:
+        return _describe(mipow)
+
+    return await _run_on_devices(args, _operation)
+
+
+async def _set(args: argparse.Namespace) -> int:
+    async def _operation(mipow: MiPow) -> str:
+        rgbw = args.rgbw or (None, None, None, None)
+        await mipow.set_light(
+            red=rgbw[0],
+            green=rgbw[1],
+            blue=rgbw[2],
+            white=rgbw[3],
+            effect=args.effect,
+            delay=args.delay,
+            repetitions=args.repetitions,
+            pause=args.pause,
+            timer=args.timer,
+        )
+        return _describe(mipow)
+
+    return await _run_on_devices(args, _operation)
+
+
+async def _off(args: argparse.Namespace) -> int:
+    async def _operation(mipow: MiPow) -> str:
+        await mipow.turn_off()
+        return _describe(mipow)
+
+    return await _run_on_devices(args, _operation)
+
+
+async def _timers(args: argparse.Namespace) -> int:
+    async def _operation(mipow: MiPow) -> str:
+        if args.schedule is not None:
+            written: int = await mipow.sync_schedules(args.schedule)
+            return f"written={written} {_describe_timers(mipow)}"
+        return _describe_timers(mipow)
+
+    return await _run_on_devices(args, _operation)
+
+
+async def _replay(args: argparse.Namespace) -> int:
+    from .device import MiPow
+    from .recorder import ReplaySession
+    from .scheduler import ScaledScheduler
+
+    session = ReplaySession.load(args.session)
+    mipow = MiPow(
+        session.device,
+        connector=session.connect,
+        # Idle and alert timers of the device run faster together with the replay
+        scheduler=ScaledScheduler(args.speed),
+    )
+    report = await session.replay(mipow, args.speed)
+    for call in report.calls:
+        outcome = "ok" if call.error is None else f"error: {call.error}"
+        print(
+            f"{call.method:16} recorded {call.recorded * 1000:8.1f} ms"
+            f"  replayed {call.replayed * 1000:8.1f} ms  {outcome}"
+        )
+    for mismatch in report.mismatches:
+        print(f"mismatch: {mismatch}")
+    print(
+        f"{len(report.calls)} calls, {len(report.mismatches)} mismatches,"
+        f" {report.unused_events} unused events,"
+        f" recorded {report.recorded:.3f} s, replayed {report.replayed:.3f} s"
+        f" at {args.speed}x"
+    )
+    return 0 if report.passed else 1
+
+
+async def _soak(args: argparse.Namespace) -> int:
+    from .soak import SoakSettings, SoakThresholds, describe, run_soak
+
+    report = await run_soak(
+        SoakSettings(
+            devices=args.devices,
+            duration=args.duration,
+            poll_interval=args.poll_interval,
+            command_interval=args.command_interval,
+            toggle_interval=args.toggle_interval,
+            reload_interval=args.reload_interval,
+            seed=args.seed,
+            airtime_budget=args.airtime_budget / 100,
+        ),
+        SoakThresholds(
+            memory_per_device_kb=args.max_memory,
+            lag_p99_ms=args.max_lag,
+            drift_p95_ms=args.max_drift,
+            churn_per_device_hour=args.max_churn,
+        ),
+    )
+    for line in describe(report):
+        print(line)
+    for failure in report.failures:
+        print(f"failed: {failure}")
+    return 0 if report.passed else 1
+
+
+async def _stress(args: argparse.Namespace) -> int:
+    from .stress import StressSettings, run_stress
+
+    report = await run_stress(
+        StressSettings(
+            devices=args.devices,
+            workers=args.workers,
+            operations=args.operations,
+            seed=args.seed,
+        )
+    )
+    for action, latency in report.latency_ms.items():
+        print(f"{action:12} {latency}")
+    for problem in report.spurious + report.lost:
+        print(f"failed: {problem}")
+    print(
+        f"{report.operations} operations, {report.commands} commands,"
+        f" {report.throughput:.1f} operations/s,"
+        f" lock contention {report.lock_contention},"
+        f" lock wait mean {report.lock_wait_mean_ms} ms"
+    )
+    print(
+        f"{report.connects} connects, {report.disconnects} idle disconnects,"
+        f" {report.drops} drops, {report.faulted} failed after repeated drops,"
+        f" {len(report.spurious)} spurious failures, {len(report.lost)} lost"
+    )
+    return 0 if report.passed else 1
+
+
+async def _bench(args: argparse.Namespace) -> int:
+    from .benchmark import run_benchmark
+
+    for name, nanoseconds in run_benchmark(args.iterations).items():
+        print(f"{name:24} {nanoseconds:8.1f} ns")
+    return 0
+
+
+def _byte(value: str) -> int:
+    result = int(value)
+    if not 0 <= result <= 255:
+        raise argparse.ArgumentTypeError(f"{value} is not in 0-255")
+    return result
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="pymipow", description="Control many MiPow Playbulb devices at once."
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument(
+        "--scan-timeout", type=float, default=DEFAULT_SCAN_SECONDS, metavar="SECONDS"
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="devices handled at the same time",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIRECTORY",
+        help="record the GATT traffic of every device to a session file",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="DIRECTORY",
+        help="trace the operations of every device to a Chrome trace file",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("scan", help="list MiPow devices in range").set_defaults(
+        handler=_scan
+    )
+
+    get = commands.add_parser("get", help="read the state of devices")
+    get.add_argument("addresses", nargs="+")
+    get.set_defaults(handler=_get)
+
+    set_ = commands.add_parser("set", help="set colour, effect and timer")
+    set_.add_argument("addresses", nargs="+")
+    set_.add_argument("--rgbw", type=_parse_rgbw, metavar="R,G,B,W")
+    set_.add_argument("--effect", type=_parse_effect)
+    set_.add_argument("--delay", type=_byte)
+    set_.add_argument("--repetitions", type=_byte)
+    set_.add_argument("--pause", type=_byte)
+    set_.add_argument("--timer", type=int, metavar="MINUTES")
+    set_.set_defaults(handler=_set)
+
+    off = commands.add_parser("off", help="turn devices off")
+    off.add_argument("addresses", nargs="+")
+    off.set_defaults(handler=_off)
+
+    timers = commands.add_parser("timers", help="read or sync the timer table")
+    timers.add_argument("addresses", nargs="+")
+    timers.add_argument(
+        "--schedule",
+        type=_parse_schedule,
+        action="append",
+        metavar="on@HH:MM[=R,G,B,W][/FADE]|off@HH:MM",
+        help="schedule to write, repeat for more slots",
+    )
+    timers.set_defaults(handler=_timers)
+
+    replay = commands.add_parser("replay", help="replay a recorded session")
+    replay.add_argument("session")
+    replay.add_argument(
+        "--speed", type=float, default=1.0, help="replay faster than recorded"
+    )
+    replay.set_defaults(handler=_replay)
+
+    soak = commands.add_parser(
+        "soak", help="run many simulated devices and check the resource use"
+    )
+    soak.add_argument("--devices", type=int, default=100)
+    soak.add_argument("--duration", type=float, default=600, metavar="SECONDS")
+    soak.add_argument("--poll-interval", type=float, default=30, metavar="SECONDS")
+    soak.add_argument(
+        "--command-interval",
+        type=float,
+        default=120,
+        metavar="SECONDS",
+        help="mean time between the commands sent to one device",
+    )
+    soak.add_argument(
+        "--toggle-interval",
+        type=float,
+        default=900,
+        metavar="SECONDS",
+        help="mean time between the physical toggles of one device",
+    )
+    soak.add_argument(
+        "--reload-interval",
+        type=float,
+        default=1800,
+        metavar="SECONDS",
+        help="mean time between the reloads of one entry",
+    )
+    soak.add_argument("--seed", type=int, default=0)
+    soak.add_argument(
+        "--airtime-budget",
+        type=float,
+        default=0,
+        metavar="PERCENT",
+        help="adapter airtime for background work, 0 for no limit",
+    )
+    soak.add_argument("--max-memory", type=float, default=96, metavar="KIB")
+    soak.add_argument("--max-lag", type=float, default=100, metavar="MS")
+    soak.add_argument("--max-drift", type=float, default=250, metavar="MS")
+    soak.add_argument(
+        "--max-churn",
+        type=float,
+        default=60,
+        metavar="CONNECTS",
+        help="connects per device hour",
+    )
+    soak.set_defaults(handler=_soak)
+
+    stress = commands.add_parser(
+        "stress", help="interleave operations on simulated devices at random"
+    )
+    stress.add_argument("--devices", type=int, default=5)
+    stress.add_argument(
+        "--workers", type=int, default=4, help="concurrent callers per device"
+    )
+    stress.add_argument(
+        "--operations", type=int, default=500, help="operations per worker"
+    )
+    stress.add_argument("--seed", type=int, default=0)
+    stress.set_defaults(handler=_stress)
+
+    bench = commands.add_parser(
+        "bench", help="check and time the packet encoders and decoders"
+    )
+    bench.add_argument("--iterations", type=int, default=100_000)
+    bench.set_defaults(handler=_bench)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args: Any = _build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    return asyncio.run(args.handler(args))
@@ -0,0 +1,207 @@
+#
+# Encoders and decoders of the MiPow Playbulb packets
+#
+# Packets are written into preallocated buffers owned by a MiPowCodec, so a
+# codec must be used by one device at a time and a returned buffer is only
+# valid until the next encode of the same packet kind.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+from dataclasses import dataclass
+from functools import lru_cache
+
+RGBW_PACKET_SIZE: int = 4
+EFFECT_PACKET_SIZE: int = 8
+TIMER_PACKET_SIZE: int = 13
+
+TIMER_SLOTS: int = 4
+TIMER_MODE_WAKEUP: int = 0
+TIMER_MODE_DOZE: int = 2
+TIMER_MODE_DISABLED: int = 4
+TIMER_UNSET: int = 0xFF
+
+# Clock written together with relative timers (hour, minute, second),
+# the timer fires when the device clock reaches the scheduled time.
+RELATIVE_CLOCK: tuple[int, int, int] = (0, 1, 1)
+
+
+@dataclass(frozen=True)
+class TimerSlot:
+    mode: int = TIMER_MODE_DISABLED
+    hour: int = 0
+    minute: int = 0
+    red: int = 0
+    green: int = 0
+    blue: int = 0
+    white: int = 0
+    runtime: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != TIMER_MODE_DISABLED
+
+
+TIMER_DISABLED_SLOT = TimerSlot(mode=TIMER_MODE_DISABLED, hour=0, minute=1)
+
+
+@dataclass(frozen=True)
+class EffectPacket:
+    red: int
+    green: int
+    blue: int
+    white: int
+    effect: int
+    repetitions: int
+    delay: int
+    pause: int
+
+
+class MiPowCodec:
+    def __init__(self) -> None:
+        self._rgbw = bytearray(RGBW_PACKET_SIZE)
+        self._effect = bytearray(EFFECT_PACKET_SIZE)
+        # One buffer per slot, so the timers can be encoded ahead of writing
+        self._timers = [bytearray(TIMER_PACKET_SIZE) for _ in range(TIMER_SLOTS)]
+
+    def encode_rgbw(self, red: int, green: int, blue: int, white: int) -> bytearray:
+        packet = self._rgbw
+        packet[0] = white
+        packet[1] = red
+        packet[2] = green
+        packet[3] = blue
+        return packet
+
+    def encode_effect(
+        self,
+        red: int,
+        green: int,
+        blue: int,
+        white: int,
+        effect: int,
+        repetitions: int,
+        delay: int,
+        pause: int,
+    ) -> bytearray:
+        packet = self._effect
+        packet[0] = white
+        packet[1] = red
+        packet[2] = green
+        packet[3] = blue
+        packet[4] = effect
+        packet[5] = repetitions
+        packet[6] = delay
+        packet[7] = pause
+        return packet
+
+    def encode_timer(
+        self,
+        slot_id: int,
+        slot: TimerSlot,
+        clock: tuple[int, int, int] = RELATIVE_CLOCK,
+    ) -> bytearray:
+        packet = self._timers[slot_id]
+        packet[0] = slot_id
+        packet[1] = slot.mode
+        packet[2] = clock[2]
+        packet[3] = clock[1]
+        packet[4] = clock[0]
+        packet[5] = 0
+        packet[6] = slot.minute
+        packet[7] = slot.hour
+        packet[8] = slot.white
+        packet[9] = slot.red
+        packet[10] = slot.green
+        packet[11] = slot.blue
+        packet[12] = slot.runtime
+        return packet
+
+    def encode_off_after(
+        self,
+        minutes: int,
+        slot_id: int = 0,
+        clock: tuple[int, int, int] = RELATIVE_CLOCK,
+    ) -> bytearray:
+        # Without a wall clock the device clock is set to 00:01:01,
+        # so the timer fires after given minutes
+        end: int = (clock[0] * 60 + clock[1] + minutes) % (24 * 60)
+        return self.encode_timer(
+            slot_id,
+            TimerSlot(mode=TIMER_MODE_DOZE, hour=end // 60, minute=end % 60),
+            clock,
+        )
+
+    def encode_disabled(
+        self, slot_id: int, clock: tuple[int, int, int] = RELATIVE_CLOCK
+    ) -> bytes | bytearray:
+        if clock == RELATIVE_CLOCK:
+            return encode_timer_disabled(slot_id)
+        return self.encode_timer(slot_id, TIMER_DISABLED_SLOT, clock)
+
+
+@lru_cache(maxsize=TIMER_SLOTS)
+def encode_timer_disabled(slot_id: int = 0) -> bytes:
+    return bytes(MiPowCodec().encode_timer(slot_id, TIMER_DISABLED_SLOT))
+
+
+@lru_cache(maxsize=16)
+def encode_alert(
+    red: int, green: int, blue: int, white: int, effect: int, delay: int
+) -> bytes:
+    return bytes(
+        MiPowCodec().encode_effect(
+            red=red,
+            green=green,
+            blue=blue,
+            white=white,
+            effect=effect,
+            repetitions=0,
+            delay=delay,
+            pause=0,
+        )
+    )
+
+
+def encode_effect_packet(packet: EffectPacket) -> bytes:
+    return bytes(
+        (
+            packet.white,
+            packet.red,
+            packet.green,
+            packet.blue,
+            packet.effect,
+            packet.repetitions,
+            packet.delay,
+            packet.pause,
+        )
+    )
+
+
+def decode_rgbw(data: bytes | bytearray) -> tuple[int, int, int, int]:
+    return (data[1], data[2], data[3], data[0])
+
+
+def decode_effect(data: bytes | bytearray) -> EffectPacket:
+    return EffectPacket(
+        red=data[1],
+        green=data[2],
+        blue=data[3],
+        white=data[0],
+        effect=data[4],
+        repetitions=data[5],
+        delay=data[6],
+        pause=data[7],
+    )
+
+
+def decode_timers(data: bytes | bytearray) -> tuple[TimerSlot, ...]:
+    # The timer characteristic reads back (mode, hour, minute) of every slot,
+    # the colour and runtime are write only.
+    slots: list[TimerSlot] = []
+    for slot_id in range(min(TIMER_SLOTS, len(data) // 3)):
+        mode, hour, minute = data[slot_id * 3 : slot_id * 3 + 3]
+        if mode == TIMER_MODE_DISABLED or hour == TIMER_UNSET:
+            slots.append(TimerSlot(mode=mode))
+        else:
+            slots.append(TimerSlot(mode=mode, hour=hour, minute=minute))
+    return tuple(slots)
@@ -0,0 +1,1382 @@
+#
+# Python module dedicated to control Mipow Playbulb LED candles
+# Created by: D3M80L
+#
+# Inspired by the following projects.
+# - https://github.com/Heckie75/Mipow-Playbulb-BTL201
+# - https://github.com/amahlaka/python-mipow
+# - https://github.com/Phhere/Playbulb/blob/master/protocols/candle.md
+# - https://github.com/hohler/hass-mipow-comet/blob/master/mipow_comet.py
+# - https://wiki.elvis.science/index.php?title=Mipow_Playbulb:_Bluetooth_Connection_Sniffing
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import asyncio
+from bisect import bisect_right
+from bleak.backends.device import BLEDevice
+from bleak.backends.service import BleakGATTCharacteristic, BleakGATTServiceCollection
+from bleak.exc import BleakError
+from bleak_retry_connector import (
+    BleakClientWithServiceCache,
+    establish_connection,
+)
+from collections.abc import AsyncIterator, Awaitable, Callable, Mapping
+import contextlib
+import contextvars
+from dataclasses import dataclass
+from dataclasses import replace
+from datetime import datetime
+import functools
+import logging
+import time
+from typing import TYPE_CHECKING, Any
+
+from .airtime import (
+    KIND_BATTERY,
+    KIND_CONNECT,
+    KIND_DEVICE_INFO,
+    KIND_OTHER,
+    KIND_POLL,
+    KIND_RECONCILE,
+    OPERATION_KINDS,
+)
+from .keyframes import CompiledEffect
+from .capabilities import CAPABILITY_REGISTRY, Capabilities
+from .profiles import (
+    BATTERY_CHARACTERISTIC_UUID,
+    EFFECT_CHARACTERISTIC_UUID,
+    GENERIC_PROFILE,
+    MIPOW_EFFECT_LIGHT_CODE,
+    MIPOW_EFFECTS,
+    RGBW_CHARACTERISTIC_UUID,
+    TIMER_CHARACTERISTIC_UUID,
+    DeviceProfile,
+)
+from .scheduler import DeadlineScheduler, ScheduledCall
+from .plan import (
+    TRANSITION_BRIGHTNESS,
+    TRANSITION_COLOR,
+    TRANSITION_EFFECT,
+    TRANSITION_OFF,
+    WRITE_EFFECT,
+    WRITE_RGBW,
+    WRITE_TIMER,
+    CommandPlan,
+    CommandStats,
+    is_brightness_change,
+)
+from .codec import (
+    RELATIVE_CLOCK,
+    TIMER_DISABLED_SLOT,
+    TIMER_SLOTS,
+    EffectPacket,
+    MiPowCodec,
+    TimerSlot,
+    decode_effect,
+    decode_rgbw,
+    decode_timers,
+)
+
+if TYPE_CHECKING:
+    from .airtime import DeviceAirtime
+    from .profiler import LoopProfiler
+    from .recorder import GattRecorder
+    from .trace import Tracer
+
+_LOGGER = logging.getLogger(__name__)
+
+MIPOW_PROBE_PARALLELISM: int = 3
+MIPOW_DISCONNECT_SECONDS: int = 120
+# Software revision string of the device information service
+SW_VERSION_UUID: str = "00002a28-0000-1000-8000-00805f9b34fb"
+
+# Which state wins when the device is found in a different state after reconnect
+OWNERSHIP_HOME_ASSISTANT: str = "home_assistant"
+OWNERSHIP_DEVICE: str = "device"
+# Timer slot 0 is used by the "time off" timer, the remaining slots by schedules,
+# the profile of the device may have fewer
+MIPOW_SCHEDULE_SLOTS: int = TIMER_SLOTS - 1
+
+
+# Opens the connection: (device, name, disconnected_callback, cached_services)
+Connector = Callable[..., Awaitable[BleakClientWithServiceCache]]
+
+
+async def connect_device(
+    device: BLEDevice,
+    name: str,
+    disconnected_callback: Callable[[BleakClientWithServiceCache], None] | None = None,
+    cached_services: BleakGATTServiceCollection | None = None,
+) -> BleakClientWithServiceCache:
+    return await establish_connection(
+        BleakClientWithServiceCache,
+        device,
+        name,
+        disconnected_callback,
+        cached_services=cached_services,
+        ble_device_callback=lambda: device,
+    )
+
+
+def _operation(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    # Calls are recorded with the GATT traffic, so a replay can drive the device,
+    # traced on their own track and profiled for the event loop lag around them
+    @functools.wraps(method)
+    async def _call(self: MiPow, *args: Any, **kwargs: Any) -> Any:
+        call = method(self, *args, **kwargs)
+        if self._recorder:
+            call = self._recorder.call(method.__name__, args, kwargs, call)
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(
+                self._airtime_kind(OPERATION_KINDS.get(method.__name__, KIND_OTHER))
+            )
+            if self._tracer:
+                stack.enter_context(self._tracer.operation(method.__name__))
+            if self._profiler:
+                stack.enter_context(self._profiler.operation(method.__name__))
+            return await call
+
+    return _call
+
+
+@dataclass(frozen=True)
+class State:
+    power: bool = False
+    red: int = 0
+    green: int = 0
+    blue: int = 0
+    white: int = 0
+    battery_level: int | None = None
+
+
+@dataclass(frozen=True)
+class DesiredState:
+    power: bool = False
+    red: int = 0
+    green: int = 0
+    blue: int = 0
+    white: int = 0
+    effect: int = MIPOW_EFFECT_LIGHT_CODE
+    delay: int = 0x14
+    repetitions: int = 0
+    pause: int = 0
+    timer: int = 0
+
+
+class MiPowDeviceInfo:
+    manufacturer: str | None
+    hw_version: str | None
+    sw_version: str | None
+    model: str | None
+    serial: str | None
+    battery_powered: bool
+    has_timer: bool
+
+
+class MiPow:
+    def __init__(
+        self,
+        device: BLEDevice,
+        now: Callable[[], datetime] = datetime.now,
+        ownership: str = OWNERSHIP_HOME_ASSISTANT,
+        scheduler: DeadlineScheduler | None = None,
+        connector: Connector | None = None,
+        recorder: GattRecorder | None = None,
+        tracer: Tracer | None = None,
+        profiler: LoopProfiler | None = None,
+        batch_callbacks: bool = False,
+        airtime: DeviceAirtime | None = None,
+        profile: DeviceProfile | None = None,
+    ) -> None:
+        self._state: State = State()
+        self._device: BLEDevice = device
+        self._services: BleakGATTServiceCollection | None = None
+        self._update_padlock: asyncio.Lock = asyncio.Lock()
+        self._client: BleakClientWithServiceCache | None = None
+        self._disconnect_timer: asyncio.TimerHandle | ScheduledCall | None = None
+        self._disconnect_task: asyncio.Task | None = None
+        self._expected_disconnect: bool = False
+        self._loop = asyncio.get_running_loop()
+        # Device timers run on the shared scheduler when given
+        self._scheduler: DeadlineScheduler | asyncio.AbstractEventLoop = (
+            scheduler if scheduler is not None else self._loop
+        )
+        self._rgbw_characteristic: BleakGATTCharacteristic | None = None
+        self._effect_characteristic: BleakGATTCharacteristic | None = None
+        self._battery_characteristic: BleakGATTCharacteristic | None = None
+        self._timer_characteristic: BleakGATTCharacteristic | None = None
+        self._recorder: GattRecorder | None = recorder
+        self._connector: Connector = connector or connect_device
+        self._airtime: DeviceAirtime | None = airtime
+        if airtime:
+            self._connector = airtime.wrap(self._connector)
+        if recorder:
+            self._connector = recorder.wrap(self._connector)
+        self._tracer: Tracer | None = tracer
+        if tracer:
+            self._connector = tracer.wrap(self._connector)
+        self._profiler: LoopProfiler | None = profiler
+        self._callbacks: list[Callable[[State], None]] = []
+        # Callbacks fired many times in one loop iteration are dispatched once
+        self._batch_callbacks: bool = batch_callbacks
+        self._dispatch_handle: asyncio.Handle | None = None
+        # Chosen by the model once the device information is read, unless given
+        self._profile: DeviceProfile = profile or GENERIC_PROFILE
+        self._profile_given: bool = profile is not None
+        self._codec: MiPowCodec = self._profile.codec()
+        self._command_stats: CommandStats | None = None
+        self._alert_handle: asyncio.TimerHandle | ScheduledCall | None = None
+        self._alert_task: asyncio.Task | None = None
+        self._render_task: asyncio.Task | None = None
+        self._device_info: MiPowDeviceInfo | None = None
+        self._delay: int = 0x14
+        self._repetitions: int = 0
+        self._pause: int = 0
+        self._effect: int = MIPOW_EFFECT_LIGHT_CODE
+        self._timer: int = 0
+        self._timer_set: bool | None = None
+        self._timers: tuple[TimerSlot, ...] = ()
+        self._schedules: dict[int, TimerSlot] = {}
+        self._now: Callable[[], datetime] = now
+        self._ownership: str = ownership
+        self._reconnect: bool = False
+        self._update_counter: int = 0
+
+    @property
+    def address(self) -> str:
+        return self._device.address
+
+    @property
+    def name(self) -> str:
+        return self._device.name or self._device.address
+
+    @property
+    def rssi(self) -> str:
+        return self._device.rssi
+
+    @property
+    def state(self) -> State:
+        return self._state
+
+    @property
+    def is_on(self) -> bool:
+        return self._state.power
+
+    @property
+    def rgbw(self) -> tuple[int, int, int, int]:
+        state: State = self._state
+        return (state.red, state.green, state.blue, state.white)
+
+    @property
+    def battery_level(self) -> int | None:
+        return self._state.battery_level
+
+    @property
+    def delay(self) -> int:
+        return self._delay
+
+    @property
+    def repetitions(self) -> int:
+        return self._repetitions
+
+    @property
+    def pause(self) -> int:
+        return self._pause
+
+    @property
+    def effect(self) -> int:
+        return self._effect
+
+    @property
+    def timer(self) -> int:
+        return self._timer
+
+    @property
+    def desired_state(self) -> DesiredState:
+        state: State = self._state
+        return DesiredState(
+            power=state.power,
+            red=state.red,
+            green=state.green,
+            blue=state.blue,
+            white=state.white,
+            effect=self._effect,
+            delay=self._delay,
+            repetitions=self._repetitions,
+            pause=self._pause,
+            timer=self._timer,
+        )
+
+    def load_state(self, desired: DesiredState) -> None:
+        # Nothing is written here, the next connect reconciles the device with it
+        self._state = replace(
+            self._state,
+            power=desired.power,
+            red=desired.red,
+            green=desired.green,
+            blue=desired.blue,
+            white=desired.white,
+        )
+        self._effect = desired.effect
+        self._delay = desired.delay
+        self._repetitions = desired.repetitions
+        self._pause = desired.pause
+        self._timer = desired.timer
+        self._reconnect = True
+
+    @property
+    def timers(self) -> tuple[TimerSlot, ...]:
+        return self._timers
+
+    @property
+    def connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    @property
+    def alerting(self) -> bool:
+        return self._alert_handle is not None
+
+    @property
+    def rendering(self) -> bool:
+        return self._render_task is not None and not self._render_task.done()
+
+    @property
+    def command_stats(self) -> CommandStats | None:
+        return self._command_stats
+
+    @property
+    def device_info(self) -> MiPowDeviceInfo | None:
+        return self._device_info
+
+    @property
+    def profiler(self) -> LoopProfiler | None:
+        return self._profiler
+
+    @property
+    def airtime(self) -> DeviceAirtime | None:
+        return self._airtime
+
+    @property
+    def profile(self) -> DeviceProfile:
+        return self._profile
+
+    @property
+    def effects(self) -> Mapping[str, int]:
+        return self._profile.effects
+
+    async def stop(self):
+        self._stop_render()
+        if self._disconnect_task:
+            self._disconnect_task.cancel()
+            self._disconnect_task = None
+        if self._alert_task:
+            self._alert_task.cancel()
+            self._alert_task = None
+        if self._recorder is None:
+            await self._execute_disconnect()
+        else:
+            await self._recorder.call("stop", (), {}, self._execute_disconnect())
+            await self._recorder.flush()
+        if self._tracer:
+            await self._tracer.flush()
+        if self._dispatch_handle:
+            self._dispatch_handle.cancel()
+            self._dispatch_handle = None
+        if self._profiler:
+            self._profiler.stop()
+
+    def _span(self, name: str, **args: Any) -> contextlib.AbstractContextManager:
+        if self._tracer is None:
+            return contextlib.nullcontext()
+        return self._tracer.span(name, **args)
+
+    def _airtime_kind(self, kind: str) -> contextlib.AbstractContextManager:
+        if self._airtime is None:
+            return contextlib.nullcontext()
+        return self._airtime.kind(kind)
+
+    def _defer(self, kind: str) -> bool:
+        # Background work waits for a busy adapter, but not the first update
+        if self._airtime is None or not self._update_counter:
+            return False
+        if self._airtime.defer(kind):
+            _LOGGER.debug("%s: Adapter busy, %s deferred", self.name, kind)
+            return True
+        return False
+
+    @contextlib.asynccontextmanager
+    async def _locked(self) -> AsyncIterator[None]:
+        contended: bool = self._update_padlock.locked()
+        start: float = time.perf_counter()
+        with self._span("lock", locked=contended):
+            await self._update_padlock.acquire()
+        if self._profiler:
+            self._profiler.lock_acquired(time.perf_counter() - start, contended)
+        try:
+            yield
+        finally:
+            self._update_padlock.release()
+
+    @_operation
+    async def update(self, fetch_battery: bool | None = None):
+        _LOGGER.debug("Update locked %s", self._update_padlock.locked())
+        async with self._locked():
+            if self.alerting or self.rendering:
+                # The device shows the alert or the effect frames, not the state
+                return
+
+            if self._defer(KIND_POLL):
+                return
+
+            previous: State = self._state
+            reconnected: bool = await self._ensure_connected()
+            if reconnected:
+                await self._reconcile()
+                return
+
+            rgbw = await self._fetch_rgbw()
+
+            is_on = rgbw[0] != 0 or rgbw[1] != 0 or rgbw[2] != 0 or rgbw[3] != 0
+
+            # Tapping some candles causes they can toggle the state
+            powerStateChanged: bool = is_on != self._state.power
+
+            self._state = replace(
+                self._state,
+                power=is_on,
+                red=rgbw[0],
+                green=rgbw[1],
+                blue=rgbw[2],
+                white=rgbw[3],
+            )
+
+            if powerStateChanged:
+                plan = self._plan("power_changed")
+                if not is_on:
+                    self._plan_disable_timer(plan)
+                else:
+                    self._plan_enable_timer(plan)
+                await self._execute(plan)
+
+            if self._battery_characteristic:
+                if fetch_battery is None:
+                    fetch_battery = (
+                        powerStateChanged
+                        or reconnected
+                        or is_on
+                        or self._update_counter % 10 == 0
+                    )
+                if fetch_battery and not self._defer(KIND_BATTERY):
+                    await self._fetch_battery_level()
+            self._update_counter += 1
+            # Polls mostly read what is known, the listeners are told only of changes
+            if self._update_counter == 1 or self._state != previous:
+                self._fire_callbacks()
+
+    @_operation
+    async def read_state(self) -> None:
+        # Read-only: the device state is taken over as it is, nothing is written,
+        # neither the timer nor the saved state after a reconnect
+        _LOGGER.debug("Read state locked %s", self._update_padlock.locked())
+        async with self._locked():
+            if self.alerting or self.rendering:
+                return
+
+            await self._ensure_connected()
+            rgbw = await self._fetch_rgbw()
+            effect: EffectPacket = await self._fetch_effect()
+            self._adopt_state(rgbw, effect)
+            if self._battery_characteristic:
+                await self._fetch_battery_level()
+            self._fire_callbacks()
+
+    async def _reconcile(
+        self,
+        rgbw: tuple[int, int, int, int] | None = None,
+        effect: EffectPacket | None = None,
+    ) -> None:
+        with self._span("reconcile"), self._airtime_kind(KIND_RECONCILE):
+            await self._reconcile_state(rgbw, effect)
+
+    async def _reconcile_state(
+        self,
+        rgbw: tuple[int, int, int, int] | None = None,
+        effect: EffectPacket | None = None,
+    ) -> None:
+        # Read what the device shows after the reconnect, unless the caller just
+        # did, and write only what differs
+        if rgbw is None or effect is None:
+            rgbw = await self._fetch_rgbw()
+            effect = await self._fetch_effect()
+        _LOGGER.debug("%s: Reconciling device state %s %s", self.name, rgbw, effect)
+
+        plan = self._plan("reconcile", self._transition())
+        if self._ownership == OWNERSHIP_DEVICE:
+            self._adopt_state(rgbw, effect)
+        elif self._state.power:
+            self._plan_reconcile_light(plan, rgbw, effect)
+        else:
+            if any(rgbw):
+                self._plan_rgbw(plan)
+            self._plan_disable_timer(plan)
+
+        await self._execute(plan)
+        self._fire_callbacks()
+
+    def _plan_reconcile_light(
+        self,
+        plan: CommandPlan,
+        rgbw: tuple[int, int, int, int],
+        effect: EffectPacket,
+    ) -> None:
+        if self._effect == MIPOW_EFFECT_LIGHT_CODE:
+            if rgbw != self.rgbw or effect.effect != MIPOW_EFFECT_LIGHT_CODE:
+                self._plan_rgbw(plan)
+        elif effect != self._get_effect_packet():
+            self._plan_rgbw(plan)
+            self._plan_effect(plan)
+
+        # We are reconnecting, so ensure if the timer was already set on the device
+        # when set, then we do not want to reset the timer
+        if not self._timer_set and self._timer != 0:
+            self._plan_enable_timer(plan)
+
+    def _adopt_state(
+        self, rgbw: tuple[int, int, int, int], effect: EffectPacket
+    ) -> None:
+        self._state = replace(
+            self._state,
+            power=any(rgbw),
+            red=rgbw[0],
+            green=rgbw[1],
+            blue=rgbw[2],
+            white=rgbw[3],
+        )
+        self._effect = effect.effect
+        if effect.effect != MIPOW_EFFECT_LIGHT_CODE:
+            self._repetitions = effect.repetitions
+            self._delay = effect.delay
+            self._pause = effect.pause
+
+    async def _connect(self) -> None:
+        if await self._ensure_connected():
+            await self._reconcile()
+
+    @_operation
+    async def snapshot(self) -> EffectPacket:
+        _LOGGER.debug("Snapshot locked %s", self._update_padlock.locked())
+        async with self._locked():
+            # Read before the reconcile of a reconnect, so the snapshot is what the
+            # device showed, and the reconcile does not read it again
+            reconnected: bool = await self._ensure_connected()
+            rgbw = await self._fetch_rgbw()
+            effect: EffectPacket = await self._fetch_effect()
+            if reconnected:
+                await self._reconcile(rgbw, effect)
+            return replace(
+                effect, red=rgbw[0], green=rgbw[1], blue=rgbw[2], white=rgbw[3]
+            )
+
+    @_operation
+    async def restore(self, snapshot: EffectPacket) -> bool:
+        _LOGGER.debug("Restore locked %s", self._update_padlock.locked())
+        async with self._locked():
+            await self._connect()
+            # The device shows an effect frame, not the state
+            if not self._stop_render() and self._is_current_state(snapshot):
+                return False
+
+            rgbw = (snapshot.red, snapshot.green, snapshot.blue, snapshot.white)
+            if snapshot.effect == MIPOW_EFFECT_LIGHT_CODE:
+                # Only the colour, the plain light keeps the last effect parameters
+                await self._set_light(*rgbw, effect=snapshot.effect)
+            else:
+                await self._set_light(
+                    *rgbw,
+                    effect=snapshot.effect,
+                    delay=snapshot.delay,
+                    repetitions=snapshot.repetitions,
+                    pause=snapshot.pause,
+                )
+            return True
+
+    def _is_current_state(self, snapshot: EffectPacket) -> bool:
+        rgbw = (snapshot.red, snapshot.green, snapshot.blue, snapshot.white)
+        if rgbw != self.rgbw:
+            return False
+        if not any(rgbw):
+            return True
+        if snapshot.effect == MIPOW_EFFECT_LIGHT_CODE:
+            return self._effect == MIPOW_EFFECT_LIGHT_CODE
+        return snapshot == self._get_effect_packet()
+
+    @_operation
+    async def alert(self, packet: bytes, duration: float) -> None:
+        # The alert does not change the desired state, which is restored after duration
+        _LOGGER.debug("Alert locked %s", self._update_padlock.locked())
+        async with self._locked():
+            await self._connect()
+            self._stop_render()
+            if self._alert_handle:
+                self._alert_handle.cancel()
+            # Keep the connection open for the whole alert, so the restore is quick
+            if self._disconnect_timer:
+                self._disconnect_timer.cancel()
+                self._disconnect_timer = None
+            await self._client.write_gatt_char(self._effect_characteristic, packet)
+            self._alert_handle = self._call_later(duration, self._end_alert)
+
+    def _end_alert(self) -> None:
+        self._alert_handle = None
+        self._alert_task = asyncio.create_task(self._restore_after_alert())
+
+    async def _restore_after_alert(self) -> None:
+        _LOGGER.debug("Restore after alert locked %s", self._update_padlock.locked())
+        async with self._locked():
+            if self.alerting:
+                return
+
+            try:
+                if await self._ensure_connected():
+                    await self._reconcile()
+                    return
+
+                plan = self._plan("restore_after_alert", self._transition())
+                self._plan_rgbw(plan)
+                if self._state.power and self._effect != MIPOW_EFFECT_LIGHT_CODE:
+                    self._plan_effect(plan)
+                await self._execute(plan)
+            except (AttributeError, BleakError, asyncio.TimeoutError) as ex:
+                _LOGGER.warning("%s: Unable to restore after alert: %s", self.name, ex)
+                # Reconcile on the next update
+                self._reconnect = True
+
+    @_operation
+    async def refresh_battery(self) -> None:
+        _LOGGER.debug("Refresh battery locked %s", self._update_padlock.locked())
+        async with self._locked():
+            if self.alerting or self._defer(KIND_BATTERY):
+                return
+            await self._connect()
+            if self._battery_characteristic:
+                previous: int | None = self._state.battery_level
+                await self._fetch_battery_level()
+                if self._state.battery_level != previous:
+                    self._fire_callbacks()
+
+    async def _fetch_battery_level(self):
+        with self._airtime_kind(KIND_BATTERY):
+            level = bytes(
+                await self._client.read_gatt_char(self._battery_characteristic)
+            )
+        _LOGGER.debug("Battery checked %s", level)
+        if level and level[0] != self._state.battery_level:
+            self._state = replace(self._state, battery_level=level[0])
+
+
+    @_operation
+    async def turn_off(self):
+        _LOGGER.debug("Turn off locked %s", self._update_padlock.locked())
+        async with self._locked():
+            await self._command(self._turn_off)
+
+    async def _turn_off(self):
+        plan = self._plan("turn_off", TRANSITION_OFF)
+        self._state = replace(self._state, red=0, green=0, blue=0, white=0, power=False)
+        self._plan_rgbw(plan)
+        self._plan_disable_timer(plan)
+        await self._execute(plan)
+        self._fire_callbacks()
+
+    async def _ensure_connected(self) -> bool:
+        if not self._reconnect and self._client and self._client.is_connected:
+            self._reset_disconnect_timer()
+            return False
+
+        reconnected: bool = self._reconnect
+
+        client = await self._connector(
+            self._device, self.name, self._disconnected, self._services
+        )
+        # Kept when the connect failed, the next connect reconciles
+        self._reconnect = False
+        self._expected_disconnect = False
+
+        self._resolve_characteristics(client.services)
+
+        self._services = client.services
+        self._client = client
+        if self._device_info is None:
+            # Read once, the device registry needs it, so it is never deferred
+            with self._span("device_info"), self._airtime_kind(KIND_DEVICE_INFO):
+                self._device_info = await self._fetch_device_info()
+        elif not self._device_info.battery_powered:
+            self._battery_characteristic = None
+
+        if self._timer_characteristic:
+            with self._airtime_kind(KIND_CONNECT):
+                await self._fetch_timers()
+            self._timer_set = bool(self._timers) and self._timers[0].enabled
+
+        self._reset_disconnect_timer()
+        return reconnected
+    
+    async def _fetch_device_info(self) -> MiPowDeviceInfo:
+        deviceInfo = MiPowDeviceInfo()
+        capabilities = CAPABILITY_REGISTRY.get(self.address)
+        if capabilities:
+            # An update of the firmware can change the rest of the information
+            sw_version = await self._get_characteristic_str(SW_VERSION_UUID)
+            if sw_version != capabilities.sw_version:
+                _LOGGER.debug(
+                    "%s: Firmware changed from %s to %s",
+                    self.name,
+                    capabilities.sw_version,
+                    sw_version,
+                )
+                capabilities = None
+        if capabilities:
+            _LOGGER.debug("%s: Known capabilities %s", self.name, capabilities)
+            deviceInfo.manufacturer = capabilities.manufacturer
+            deviceInfo.hw_version = capabilities.hw_version
+            deviceInfo.sw_version = capabilities.sw_version
+            deviceInfo.model = capabilities.model
+            deviceInfo.serial = capabilities.serial
+        else:
+            await self._read_device_info(deviceInfo)
+
+        if not self._profile_given:
+            profile = CAPABILITY_REGISTRY.find_profile(
+                deviceInfo.model, deviceInfo.sw_version
+            )
+            self._use_profile(profile)
+
+        if self._profile.battery_powered is not None:
+            # Known from the profile, nothing to probe
+            deviceInfo.battery_powered = self._profile.battery_powered
+        elif capabilities:
+            deviceInfo.battery_powered = capabilities.battery_powered
+        else:
+            await self._probe_battery(deviceInfo)
+        if not deviceInfo.battery_powered:
+            self._battery_characteristic = None
+
+        deviceInfo.has_timer = not self._timer_characteristic is None
+        CAPABILITY_REGISTRY.register(
+            self.address,
+            Capabilities(
+                manufacturer=deviceInfo.manufacturer,
+                hw_version=deviceInfo.hw_version,
+                sw_version=deviceInfo.sw_version,
+                model=deviceInfo.model,
+                serial=deviceInfo.serial,
+                battery_powered=deviceInfo.battery_powered,
+            ),
+        )
+        return deviceInfo
+
+    async def _read_device_info(self, deviceInfo: MiPowDeviceInfo) -> None:
+        deviceInfo.manufacturer = await self._get_characteristic_str(
+            "00002a29-0000-1000-8000-00805f9b34fb"
+        )
+        deviceInfo.hw_version = await self._get_characteristic_str(
+            "00002a27-0000-1000-8000-00805f9b34fb"
+        )
+        deviceInfo.sw_version = await self._get_characteristic_str(SW_VERSION_UUID)
+        deviceInfo.model = await self._get_characteristic_str(
+            "00002a26-0000-1000-8000-00805f9b34fb"
+        )
+        deviceInfo.serial = await self._get_characteristic_str(
+            "00002a25-0000-1000-8000-00805f9b34fb"
+        )
+
+    async def _probe_battery(self, deviceInfo: MiPowDeviceInfo) -> None:
+        if self._battery_characteristic:
+            try:
+                await self._fetch_battery_level()
+            except (AttributeError, BleakError, asyncio.TimeoutError):
+                _LOGGER.warn("This device does not support battery status check.")
+                self._battery_characteristic = None
+
+        deviceInfo.battery_powered = not self._battery_characteristic is None
+
+    def _plan(self, name: str, transition: str | None = None) -> CommandPlan:
+        return CommandPlan(name, transition, self._profile.write_plans)
+
+    def _transition(self) -> str:
+        # The transition to the current state
+        if not self._state.power:
+            return TRANSITION_OFF
+        if self._effect != MIPOW_EFFECT_LIGHT_CODE:
+            return TRANSITION_EFFECT
+        return TRANSITION_COLOR
+
+    def _use_profile(self, profile: DeviceProfile) -> None:
+        if profile is self._profile:
+            return
+        _LOGGER.debug("%s: Using the %s profile", self.name, profile.name)
+        self._profile = profile
+        self._codec = profile.codec()
+        self._resolve_characteristics(self._services)
+
+    @_operation
+    async def probe(self) -> None:
+        # Read-only check: the state of the device is neither read nor changed
+        _LOGGER.debug("Probe locked %s", self._update_padlock.locked())
+        async with self._locked():
+            if self._client and self._client.is_connected:
+                self._require_characteristics(self._client.services)
+                return
+
+            client = await self._connector(
+                self._device, self.name, None, self._services
+            )
+            try:
+                self._require_characteristics(client.services)
+                self._services = client.services
+            finally:
+                await client.disconnect()
+
+    def _require_characteristics(self, services: BleakGATTServiceCollection) -> None:
+        for uuid in (self._profile.rgbw_uuid, self._profile.effect_uuid):
+            characteristic = self._require_property(
+                "write",
+                self._require_read_property(services.get_characteristic(uuid)),
+            )
+            if characteristic is None:
+                raise BleakError(
+                    f"{self.name} does not provide the characteristic {uuid}"
+                )
+
+    def _resolve_characteristics(self, services: BleakGATTServiceCollection) -> None:
+        profile: DeviceProfile = self._profile
+        self._rgbw_characteristic = self._require_read_property(
+            services.get_characteristic(profile.rgbw_uuid)
+        )
+        self._rgbw_characteristic = self._require_property(
+            "write", self._rgbw_characteristic
+        )
+        self._effect_characteristic = self._require_read_property(
+            services.get_characteristic(profile.effect_uuid)
+        )
+        self._effect_characteristic = self._require_property(
+            "write", self._effect_characteristic
+        )
+        self._battery_characteristic = None
+        if profile.battery_uuid and profile.battery_powered is not False:
+            self._battery_characteristic = self._require_read_property(
+                services.get_characteristic(profile.battery_uuid)
+            )
+        self._timer_characteristic = None
+        if profile.timer_uuid and profile.timer_slots:
+            self._timer_characteristic = self._require_read_property(
+                services.get_characteristic(profile.timer_uuid)
+            )
+            self._timer_characteristic = self._require_property(
+                "write", self._timer_characteristic
+            )
+
+    def _require_read_property(
+        self, characteristic: BleakGATTCharacteristic | None
+    ) -> BleakGATTCharacteristic | None:
+        return self._require_property("read", characteristic)
+
+    def _require_property(
+        self, property: str, characteristic: BleakGATTCharacteristic | None
+    ) -> BleakGATTCharacteristic | None:
+        if characteristic:
+            for characteristicProperty in characteristic.properties:
+                if characteristicProperty.startswith(property):
+                    return characteristic
+        return None
+
+    def _disconnected(self, client: BleakClientWithServiceCache) -> None:
+        msg: str = "%s: Disconnected; RSSI: %s"
+        arg = [self.name, self.rssi]
+        if self._expected_disconnect:
+            _LOGGER.debug(msg, *arg)
+        else:
+            _LOGGER.warn(msg, *arg)
+            self._reconnect = True
+
+    def _reset_disconnect_timer(self) -> None:
+        if self._disconnect_timer:
+            self._disconnect_timer.cancel()
+        self._expected_disconnect = False
+        self._disconnect_timer = self._call_later(
+            MIPOW_DISCONNECT_SECONDS, self._disconnect
+        )
+
+    def _call_later(
+        self, delay: float, callback: Callable[[], None]
+    ) -> asyncio.TimerHandle | ScheduledCall:
+        # The timer outlives the operation which armed it, in an empty context
+        # its spans and airtime are not attributed to that operation
+        return self._scheduler.call_later(delay, contextvars.Context().run, callback)
+
+    def _disconnect(self) -> None:
+        self._disconnect_timer = None
+        if self.alerting or self.rendering:
+            return
+        if self._disconnect_task is None or self._disconnect_task.done():
+            self._disconnect_task = asyncio.create_task(
+                self._execute_timed_disconnect()
+            )
+
+    async def _execute_timed_disconnect(self) -> None:
+        _LOGGER.debug(
+            "_execute_timed_disconnect locked %s", self._update_padlock.locked()
+        )
+        async with self._locked():
+            # Used again while waiting for the lock, the timer is armed anew
+            if self._disconnect_timer or self.alerting or self.rendering:
+                return
+            await self._disconnect_client()
+
+    async def _execute_disconnect(self) -> None:
+        _LOGGER.debug("_execute_disconnect locked %s", self._update_padlock.locked())
+        async with self._locked():
+            await self._disconnect_client()
+
+    async def _disconnect_client(self) -> None:
+        if self._alert_handle:
+            self._alert_handle.cancel()
+            self._alert_handle = None
+        if self._disconnect_timer:
+            self._disconnect_timer.cancel()
+            self._disconnect_timer = None
+        client = self._client
+        self._expected_disconnect = True
+        self._client = None
+        self._rgbw_characteristic = None
+        self._effect_characteristic = None
+        self._battery_characteristic = None
+        self._timer_characteristic = None
+        self._services = None
+        if client and client.is_connected:
+            await client.disconnect()
+
+    @_operation
+    async def set_light(
+        self,
+        red: int | None = None,
+        green: int | None = None,
+        blue: int | None = None,
+        white: int | None = None,
+        effect: int | None = None,
+        delay: int | None = None,
+        repetitions: int | None = None,
+        pause: int | None = None,
+        timer: int | None = None,
+    ):
+        async def _set_light() -> None:
+            if timer is not None:
+                assert self._timer_characteristic
+            await self._set_light(
+                red=red,
+                green=green,
+                blue=blue,
+                white=white,
+                effect=effect,
+                delay=delay,
+                repetitions=repetitions,
+                pause=pause,
+                timer=timer,
+            )
+
+        _LOGGER.debug("Set light locked %s", self._update_padlock.locked())
+        async with self._locked():
+            await self._command(_set_light)
+
+    async def _command(self, command: Callable[[], Awaitable[None]]) -> None:
+        self._stop_render()
+        try:
+            # The idle disconnect may have closed the connection since the last update
+            await self._connect()
+            assert self._rgbw_characteristic
+            await command()
+        except (BleakError, asyncio.TimeoutError) as ex:
+            if not self._reconnect:
+                raise
+            # Dropped by the device, the command is repeated once
+            _LOGGER.debug("%s: Repeating the command after %s", self.name, ex)
+            await self._connect()
+            await command()
+
+    async def _set_light(
+        self,
+        red: int | None = None,
+        green: int | None = None,
+        blue: int | None = None,
+        white: int | None = None,
+        effect: int | None = None,
+        delay: int | None = None,
+        repetitions: int | None = None,
+        pause: int | None = None,
+        timer: int | None = None,
+    ):
+        if delay is not None:
+            self._delay = delay
+
+        if effect is not None:
+            self._effect = effect
+
+        if repetitions is not None:
+            self._repetitions = repetitions
+
+        if pause is not None:
+            self._pause = pause
+
+        timerSet: bool = timer is not None
+        self._timer = timer if timer is not None else self._timer
+
+        red = red if red is not None else self._state.red
+        green = green if green is not None else self._state.green
+        blue = blue if blue is not None else self._state.blue
+        white = white if white is not None else self._state.white
+
+        if red == 0 and green == 0 and blue == 0 and white == 0:
+            await self._turn_off()
+            return
+
+        turnedOn: bool = self._state.power == False
+        brightness: bool = not turnedOn and is_brightness_change(
+            self.rgbw, (red, green, blue, white)
+        )
+        self._state = replace(
+            self._state, power=True, red=red, green=green, blue=blue, white=white
+        )
+        transition: str = self._transition()
+        if transition == TRANSITION_COLOR and brightness:
+            transition = TRANSITION_BRIGHTNESS
+        plan = self._plan("set_light", transition)
+        self._plan_rgbw(plan)
+
+        if turnedOn or timerSet:
+            if self._timer == 0:
+                self._plan_disable_timer(plan)
+            else:
+                self._plan_enable_timer(plan)
+
+        if self._effect != MIPOW_EFFECT_LIGHT_CODE:
+            self._plan_effect(plan)
+
+        await self._execute(plan)
+        self._fire_callbacks()
+
+    @_operation
+    async def play(self, effect: CompiledEffect) -> bool:
+        # True when the device runs the effect, False when the frames are streamed
+        firmware = effect.firmware
+        _LOGGER.debug("Play locked %s", self._update_padlock.locked())
+        async with self._locked():
+            if firmware and firmware.effect in self.effects:
+                await self._command(
+                    functools.partial(
+                        self._set_light,
+                        *firmware.rgbw,
+                        effect=self.effects[firmware.effect],
+                        delay=firmware.delay,
+                        repetitions=0,
+                        pause=0,
+                    )
+                )
+                return True
+
+            # The first frame is the desired state, shown again after a reconnect
+            await self._command(
+                functools.partial(
+                    self._set_light, *effect.rgbw, effect=MIPOW_EFFECT_LIGHT_CODE
+                )
+            )
+            self._render_task = asyncio.create_task(self._render(effect))
+            return False
+
+    def _stop_render(self) -> bool:
+        if not self.rendering:
+            return False
+        self._render_task.cancel()
+        self._render_task = None
+        return True
+
+    async def _render(self, effect: CompiledEffect) -> None:
+        start: float = self._loop.time()
+        count: int = len(effect.frames)
+        # Frames are counted across the cycles, the first one is shown already
+        shown: int = 0
+        dropped: int = 0
+        try:
+            while True:
+                cycle, offset = divmod(self._loop.time() - start, effect.period)
+                if effect.repeat and cycle >= effect.repeat:
+                    break
+                index: int = bisect_right(effect.offsets, offset) - 1
+                position: int = int(cycle) * count + index
+                if position > shown:
+                    # Frames due while the previous write was running are dropped
+                    dropped += position - shown - 1
+                    shown = position
+                    async with self._locked():
+                        await self._write_frame(effect.frames[index])
+                end: float = (
+                    effect.offsets[index + 1] if index + 1 < count else effect.period
+                )
+                await asyncio.sleep(
+                    max(0, start + cycle * effect.period + end - self._loop.time())
+                )
+
+            async with self._locked():
+                # Ended by itself, the last frame stays on the device
+                rgbw = decode_rgbw(effect.frames[-1])
+                self._state = replace(
+                    self._state,
+                    power=any(rgbw),
+                    red=rgbw[0],
+                    green=rgbw[1],
+                    blue=rgbw[2],
+                    white=rgbw[3],
+                )
+                self._fire_callbacks()
+                if self.connected:
+                    self._reset_disconnect_timer()
+        except (AttributeError, BleakError, asyncio.TimeoutError) as ex:
+            _LOGGER.warning("%s: Effect %s stopped: %s", self.name, effect.name, ex)
+        finally:
+            _LOGGER.debug(
+                "%s: Effect %s showed %s frames, dropped %s",
+                self.name,
+                effect.name,
+                shown + 1 - dropped,
+                dropped,
+            )
+
+    async def _write_frame(self, frame: bytes) -> None:
+        if not self.connected:
+            await self._connect()
+        characteristic = self._rgbw_characteristic
+        await self._client.write_gatt_char(
+            characteristic,
+            frame,
+            "write-without-response" not in characteristic.properties,
+        )
+
+    async def _execute(self, plan: CommandPlan) -> None:
+        if not plan:
+            return
+        with self._span("plan", plan=plan.name):
+            stats: CommandStats = await plan.execute(self._client)
+        self._command_stats = stats
+        _LOGGER.debug("%s: Executed %s", self.name, stats)
+
+    def _plan_rgbw(self, plan: CommandPlan) -> None:
+        state: State = self._state
+        packet = self._codec.encode_rgbw(
+            state.red, state.green, state.blue, state.white
+        )
+        plan.write(WRITE_RGBW, self._rgbw_characteristic, packet)
+
+    def _plan_effect(self, plan: CommandPlan) -> None:
+        assert self._effect_characteristic
+        state: State = self._state
+        packet = self._codec.encode_effect(
+            red=state.red,
+            green=state.green,
+            blue=state.blue,
+            white=state.white,
+            effect=self._effect,
+            repetitions=self._repetitions,
+            delay=self._delay,
+            pause=self._pause,
+        )
+        plan.write(WRITE_EFFECT, self._effect_characteristic, packet)
+
+    def _get_effect_packet(self) -> EffectPacket:
+        state: State = self._state
+        return EffectPacket(
+            red=state.red,
+            green=state.green,
+            blue=state.blue,
+            white=state.white,
+            effect=self._effect,
+            repetitions=self._repetitions,
+            delay=self._delay,
+            pause=self._pause,
+        )
+
+    def register_callback(
+        self, callback: Callable[[State], None]
+    ) -> Callable[[], None]:
+        def unregister_callback() -> None:
+            self._callbacks.remove(callback)
+
+        self._callbacks.append(callback)
+        return unregister_callback
+
+    def measure(self, name: str) -> contextlib.AbstractContextManager:
+        if self._profiler is None:
+            return contextlib.nullcontext()
+        return self._profiler.measure(name)
+
+    def _fire_callbacks(self) -> None:
+        if not self._batch_callbacks:
+            self._dispatch_callbacks()
+        elif self._dispatch_handle is None:
+            self._dispatch_handle = self._loop.call_soon(self._dispatch_callbacks)
+
+    def _dispatch_callbacks(self) -> None:
+        self._dispatch_handle = None
+        state = self._state
+        with self._span("callbacks", count=len(self._callbacks)):
+            for callback in tuple(self._callbacks):
+                with self.measure(getattr(callback, "__qualname__", repr(callback))):
+                    callback(state)
+
+    async def _fetch_rgbw(self):
+        result = await self._client.read_gatt_char(self._rgbw_characteristic)
+        return decode_rgbw(result)
+
+    async def _fetch_effect(self) -> EffectPacket:
+        result = await self._client.read_gatt_char(self._effect_characteristic)
+        return decode_effect(result)
+
+    async def _get_characteristic_str(self, characteristicGuid: str) -> str | None:
+        characteristic = self._require_read_property(
+            self._services.get_characteristic(characteristicGuid)
+        )
+        if characteristic:
+            return bytes(await self._client.read_gatt_char(characteristic)).decode(
+                "utf-8"
+            )
+        return None
+
+    @_operation
+    async def sync_schedules(self, schedules: list[TimerSlot]) -> int:
+        slots: int = self._profile.schedule_slots
+        if len(schedules) > slots:
+            raise ValueError(f"{self.name} supports at most {slots} schedules")
+
+        desired: dict[int, TimerSlot] = {
+            slot_id: schedule for slot_id, schedule in enumerate(schedules, start=1)
+        }
+
+        _LOGGER.debug("Sync schedules locked %s", self._update_padlock.locked())
+        async with self._locked():
+            await self._connect()
+            if not self._timer_characteristic:
+                raise BleakError(f"{self.name} does not support timers")
+
+            hadSchedules: bool = self._has_schedules()
+            changed: list[int] = [
+                slot_id
+                for slot_id in range(1, self._profile.timer_slots)
+                if self._is_schedule_changed(
+                    slot_id, desired.get(slot_id, TIMER_DISABLED_SLOT)
+                )
+            ]
+            self._schedules = {
+                slot_id: schedule
+                for slot_id, schedule in desired.items()
+                if schedule.enabled
+            }
+            if not changed:
+                return 0
+
+            # Schedules need the wall clock on the device,
+            # the time off timer has to follow the same clock
+            plan = self._plan("sync_schedules")
+            clock = self._wall_clock() if self._schedules else RELATIVE_CLOCK
+            for slot_id in changed:
+                schedule = desired.get(slot_id, TIMER_DISABLED_SLOT)
+                if schedule.enabled:
+                    packet = self._codec.encode_timer(slot_id, schedule, clock)
+                else:
+                    packet = self._codec.encode_disabled(slot_id, clock)
+                _LOGGER.debug("Writing schedule %s %s", slot_id, packet)
+                plan.write(WRITE_TIMER, self._timer_characteristic, packet)
+
+            if self._timer_set and hadSchedules != bool(self._schedules):
+                self._plan_enable_timer(plan, clock)
+
+            await self._execute(plan)
+            await self._fetch_timers()
+            self._fire_callbacks()
+            return len(changed)
+
+    def _is_schedule_changed(self, slot_id: int, schedule: TimerSlot) -> bool:
+        if slot_id < len(self._timers):
+            current: TimerSlot = self._timers[slot_id]
+            if current.enabled != schedule.enabled:
+                return True
+            if schedule.enabled and (current.mode, current.hour, current.minute) != (
+                schedule.mode,
+                schedule.hour,
+                schedule.minute,
+            ):
+                return True
+
+        # Colour and runtime cannot be read back from the device
+        return schedule.enabled and self._schedules.get(slot_id) != schedule
+
+    def _has_schedules(self) -> bool:
+        # The timers read back from the device, the schedules written before
+        # a restart are not known otherwise
+        return bool(self._schedules) or any(
+            slot.enabled for slot in self._timers[1:]
+        )
+
+    def _timer_clock(self) -> tuple[int, int, int]:
+        if not self._has_schedules():
+            return RELATIVE_CLOCK
+        return self._wall_clock()
+
+    def _wall_clock(self) -> tuple[int, int, int]:
+        now = self._now()
+        return (now.hour, now.minute, now.second)
+
+    async def _fetch_timers(self) -> None:
+        result = await self._client.read_gatt_char(self._timer_characteristic)
+        self._timers = decode_timers(result)
+
+    def _plan_disable_timer(self, plan: CommandPlan) -> None:
+        if not self._timer_characteristic:
+            return
+
+        if self._timer_set == False:
+            return
+
+        packet = self._codec.encode_disabled(0, self._timer_clock())
+        _LOGGER.debug("Disabling timer %s", packet)
+        plan.write(WRITE_TIMER, self._timer_characteristic, packet)
+        self._timer_set = False
+
+    def _plan_enable_timer(
+        self, plan: CommandPlan, clock: tuple[int, int, int] | None = None
+    ) -> None:
+        if not self._timer_characteristic:
+            return
+
+        packet = self._codec.encode_off_after(
+            self._timer, clock=clock or self._timer_clock()
+        )
+        _LOGGER.debug("Enabling timer %s", packet)
+        plan.write(WRITE_TIMER, self._timer_characteristic, packet)
+        self._timer_set = True
+
+
+async def probe_devices(
+    devices: list[BLEDevice], parallelism: int = MIPOW_PROBE_PARALLELISM
+) -> dict[str, bool]:
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def _probe(device: BLEDevice) -> bool:
+        async with semaphore:
+            try:
+                await MiPow(device).probe()
+            except Exception as ex:  # pylint: disable=broad-except
+                _LOGGER.debug("Probe of %s failed: %s", device.address, ex)
+                return False
+            return True
+
+    results = await asyncio.gather(*(_probe(device) for device in devices))
+    return {device.address: result for device, result in zip(devices, results)}
@@ -0,0 +1,228 @@
+#
+# Polling of many MiPow devices on one deadline scheduler
+#
+# Every device gets a slot for its polls and one for its battery reads and keeps
+# them. A device added later takes the middle of the largest free gap, so the
+# slots of the other devices are not moved. A failed poll backs off, and the
+# listener is told only when the polled state of a device changed.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import asyncio
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass
+import logging
+from typing import Any
+
+from bleak.exc import BleakError
+
+from .device import MiPow
+from .scheduler import DeadlineScheduler, ScheduledCall
+
+_LOGGER = logging.getLogger(__name__)
+
+BATTERY_POLLS: int = 10
+MAX_BACKOFF_SECONDS: float = 600
+
+
+@dataclass
+class FleetMember:
+    device: MiPow
+    next_poll: float = 0
+    next_battery: float = 0
+    failures: int = 0
+    poll: ScheduledCall | None = None
+    battery: ScheduledCall | None = None
+
+    def cancel(self) -> None:
+        if self.poll:
+            self.poll.cancel()
+        if self.battery:
+            self.battery.cancel()
+
+
+class Fleet:
+    def __init__(
+        self,
+        interval: float,
+        on_update: Callable[[MiPow], None],
+        on_error: Callable[[MiPow, Exception], None],
+        scheduler: DeadlineScheduler | None = None,
+        create_task: Callable[[Coroutine[Any, Any, None]], asyncio.Task] | None = None,
+    ) -> None:
+        self._interval: float = interval
+        self._on_update = on_update
+        self._on_error = on_error
+        self._scheduler: DeadlineScheduler = (
+            scheduler if scheduler is not None else DeadlineScheduler()
+        )
+        self._create_task = create_task or asyncio.create_task
+        self._tasks: set[asyncio.Task] = set()
+        self._members: dict[str, FleetMember] = {}
+        # Compact state table, the listener is told only when a row changes
+        self._states: dict[str, tuple[Any, ...]] = {}
+
+    @property
+    def scheduler(self) -> DeadlineScheduler:
+        return self._scheduler
+
+    @property
+    def members(self) -> dict[str, FleetMember]:
+        return self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def add(self, device: MiPow) -> None:
+        if member := self._members.pop(device.address, None):
+            member.cancel()
+        self._members[device.address] = FleetMember(device)
+        self._states[device.address] = self._get_row(device)
+        self._rebalance()
+
+    def remove(self, device: MiPow) -> None:
+        # The slots of the other devices are kept, the next device fills the gap
+        if member := self._members.pop(device.address, None):
+            member.cancel()
+        self._states.pop(device.address, None)
+
+    def stop(self) -> None:
+        for member in self._members.values():
+            member.cancel()
+        self._members.clear()
+        for task in self._tasks:
+            task.cancel()
+        self._scheduler.stop()
+
+    def _rebalance(self) -> None:
+        # Only the devices without slots get them, the others keep theirs
+        now: float = self._scheduler.time()
+        battery_interval: float = self._interval * BATTERY_POLLS
+        for member in self._members.values():
+            if member.poll is None:
+                member.next_poll = self._free_slot(
+                    now, self._interval, [other.next_poll for other in self._placed()]
+                )
+                member.poll = self._scheduler.call_at(
+                    member.next_poll, self._poll, member
+                )
+            if member.battery is None:
+                member.next_battery = self._free_slot(
+                    now,
+                    battery_interval,
+                    [other.next_battery for other in self._placed()],
+                )
+                member.battery = self._scheduler.call_at(
+                    member.next_battery, self._refresh_battery, member
+                )
+
+    def _placed(self) -> list[FleetMember]:
+        return [
+            member
+            for member in self._members.values()
+            if member.poll is not None and member.battery is not None
+        ]
+
+    @staticmethod
+    def _free_slot(now: float, interval: float, slots: list[float]) -> float:
+        if not slots:
+            return now + interval
+        phases: list[float] = sorted((slot - now) % interval for slot in slots)
+        gap, start = max(
+            (following - phase, phase)
+            for phase, following in zip(phases, phases[1:] + [phases[0] + interval])
+        )
+        return now + ((start + gap / 2) % interval or interval)
+
+    def _next_slot(self, slot: float, interval: float) -> float:
+        # Keep the slot of the device, so the polls do not drift together
+        slot += interval
+        now: float = self._scheduler.time()
+        if slot <= now:
+            slot += ((now - slot) // interval + 1) * interval
+        return slot
+
+    def _start(self, coroutine: Coroutine[Any, Any, None]) -> None:
+        task = self._create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _poll(self, member: FleetMember) -> None:
+        self._start(self._async_poll(member))
+
+    async def _async_poll(self, member: FleetMember) -> None:
+        try:
+            await member.device.update(fetch_battery=False)
+        except (AttributeError, BleakError, asyncio.TimeoutError) as ex:
+            self._backoff(member, ex)
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.exception("%s: Unexpected poll error", member.device.name)
+            self._backoff(member, ex)
+        else:
+            recovered: bool = member.failures > 0
+            member.failures = 0
+            member.next_poll = self._next_slot(member.next_poll, self._interval)
+            self._publish(member, recovered)
+        finally:
+            # A removed device is not polled any more, a device rescheduled
+            # while polled keeps a single poll
+            if self._members.get(member.device.address) is member:
+                if member.poll:
+                    member.poll.cancel()
+                member.poll = self._scheduler.call_at(
+                    member.next_poll, self._poll, member
+                )
+
+    def _backoff(self, member: FleetMember, ex: Exception) -> None:
+        member.failures += 1
+        delay: float = min(self._interval * 2**member.failures, MAX_BACKOFF_SECONDS)
+        _LOGGER.debug(
+            "%s: Poll failed %s times, backoff %ss: %s",
+            member.device.name,
+            member.failures,
+            delay,
+            ex,
+        )
+        member.next_poll = self._scheduler.time() + delay
+        self._on_error(member.device, ex)
+
+    def _refresh_battery(self, member: FleetMember) -> None:
+        self._start(self._async_refresh_battery(member))
+
+    async def _async_refresh_battery(self, member: FleetMember) -> None:
+        try:
+            await member.device.refresh_battery()
+        except (AttributeError, BleakError, asyncio.TimeoutError) as ex:
+            _LOGGER.debug("%s: Battery refresh failed: %s", member.device.name, ex)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("%s: Unexpected battery error", member.device.name)
+        else:
+            self._publish(member)
+        finally:
+            if self._members.get(member.device.address) is member:
+                if member.battery:
+                    member.battery.cancel()
+                member.next_battery = self._next_slot(
+                    member.next_battery, self._interval * BATTERY_POLLS
+                )
+                member.battery = self._scheduler.call_at(
+                    member.next_battery, self._refresh_battery, member
+                )
+
+    def _publish(self, member: FleetMember, force: bool = False) -> None:
+        address: str = member.device.address
+        row = self._get_row(member.device)
+        if force or self._states.get(address) != row:
+            self._states[address] = row
+            self._on_update(member.device)
+
+    def _get_row(self, device: MiPow) -> tuple[Any, ...]:
+        return (
+            device.state,
+            device.effect,
+            device.delay,
+            device.repetitions,
+            device.pause,
+            device.timer,
+        )
@@ -0,0 +1,188 @@
+#
+# Keyframe effects of the MiPow Playbulb devices
+#
+# A keyframe effect is compiled once into the RGBW frames of one cycle, a frame
+# only at the steps where a fade changes a colour channel or a keyframe begins,
+# so the compile time does not grow with the length of the fades. The frames are
+# streamed to the device, frames which are due while a write is still running
+# are dropped. On request, an effect with the shape of one of the firmware
+# effects (flash, pulse or colorloop) with a delay the device can run names that
+# effect, so playing it is a single effect write. The speed of the firmware
+# effects is not measured yet, so this is not the default.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+from collections.abc import Iterator
+from colorsys import rgb_to_hsv
+from dataclasses import dataclass
+import math
+
+from .codec import MiPowCodec, decode_rgbw
+
+FRAME_INTERVAL: float = 0.1
+# Relative difference of the times which still match a firmware effect
+MATCH_TOLERANCE: float = 0.1
+
+# Estimated seconds of one cycle of a firmware effect per delay step, the cycle
+# takes (delay + 1) steps. Not measured on the devices, within MATCH_TOLERANCE
+# a keyframe effect can run faster or slower on the device than streamed
+FIRMWARE_CYCLE_SECONDS: dict[str, float] = {
+    "flash": 0.02,
+    "pulse": 0.1,
+    "colorloop": 0.5,
+}
+
+RGBW = tuple[int, int, int, int]
+OFF: RGBW = (0, 0, 0, 0)
+
+
+@dataclass(frozen=True)
+class Keyframe:
+    rgbw: RGBW
+    # Seconds of the fade from the previous keyframe and of the hold afterwards,
+    # the first keyframe fades from the last one
+    fade: float = 0
+    hold: float = 0
+
+
+@dataclass(frozen=True)
+class FirmwareEffect:
+    effect: str
+    rgbw: RGBW
+    delay: int
+
+
+@dataclass(frozen=True)
+class CompiledEffect:
+    name: str
+    period: float
+    # Cycles to play, 0 to play until another command
+    repeat: int
+    firmware: FirmwareEffect | None
+    # Offsets in the cycle and the RGBW packets, a frame only where the colour changes
+    offsets: tuple[float, ...]
+    frames: tuple[bytes, ...]
+
+    @property
+    def rgbw(self) -> RGBW:
+        return decode_rgbw(self.frames[0])
+
+
+def compile_effect(
+    name: str,
+    keyframes: list[Keyframe],
+    repeat: int = 0,
+    interval: float = FRAME_INTERVAL,
+    firmware: bool = False,
+) -> CompiledEffect:
+    if not keyframes:
+        raise ValueError(f"Effect {name} has no keyframes")
+    period: float = sum(keyframe.fade + keyframe.hold for keyframe in keyframes)
+    if period <= 0:
+        raise ValueError(f"Effect {name} takes no time")
+
+    codec = MiPowCodec()
+    offsets: list[float] = []
+    frames: list[bytes] = []
+    for offset, rgbw in _changes(keyframes, interval, max(1, round(period / interval))):
+        frame = bytes(codec.encode_rgbw(*rgbw))
+        if not frames or frame != frames[-1]:
+            offsets.append(offset)
+            frames.append(frame)
+
+    return CompiledEffect(
+        name=name,
+        period=period,
+        repeat=repeat,
+        firmware=(
+            _match_firmware(keyframes, period) if firmware and not repeat else None
+        ),
+        offsets=tuple(offsets),
+        frames=tuple(frames),
+    )
+
+
+def _changes(
+    keyframes: list[Keyframe], interval: float, steps: int
+) -> Iterator[tuple[float, RGBW]]:
+    # The colours of the steps where the colour can change, in the order of steps
+    start: float = 0
+    previous: RGBW = keyframes[-1].rgbw
+    for keyframe in keyframes:
+        fade_end: float = start + keyframe.fade
+        end: float = fade_end + keyframe.hold
+        candidates: set[int] = {_first_step(start, interval)}
+        if keyframe.fade:
+            for first, last in zip(previous, keyframe.rgbw):
+                # A rounded channel changes where it crosses a half level
+                for level in range(min(first, last), max(first, last)):
+                    share: float = (level + 0.5 - first) / (last - first)
+                    step: int = _first_step(start + keyframe.fade * share, interval)
+                    # Both neighbours too, against the rounding of the times
+                    candidates.update((step - 1, step, step + 1))
+            candidates.add(_first_step(fade_end, interval))
+
+        for step in sorted(candidates):
+            offset: float = step * interval
+            if not 0 <= step < steps or not start <= offset < end:
+                continue
+            if offset < fade_end:
+                share = (offset - start) / keyframe.fade
+                yield offset, tuple(
+                    round(first + (last - first) * share)
+                    for first, last in zip(previous, keyframe.rgbw)
+                )
+            else:
+                yield offset, keyframe.rgbw
+        start = end
+        previous = keyframe.rgbw
+
+
+def _first_step(offset: float, interval: float) -> int:
+    return math.ceil(offset / interval)
+
+
+def _match_firmware(keyframes: list[Keyframe], period: float) -> FirmwareEffect | None:
+    fades: list[float] = [keyframe.fade for keyframe in keyframes]
+    holds: list[float] = [keyframe.hold for keyframe in keyframes]
+    colors: list[RGBW] = [keyframe.rgbw for keyframe in keyframes if any(keyframe.rgbw)]
+
+    # One colour and off, switched or faded in the same time both ways
+    if len(keyframes) == 2 and len(colors) == 1:
+        if not any(fades) and _close(*holds):
+            return _firmware("flash", colors[0], period)
+        if not any(holds) and _close(*fades):
+            return _firmware("pulse", colors[0], period)
+        return None
+
+    # Fully saturated colours fading once around the colour wheel
+    if len(colors) == len(keyframes) >= 3 and not any(holds) and _close(*fades):
+        hues: list[float] = []
+        for red, green, blue, white in colors:
+            if white or max(red, green, blue) != 255 or min(red, green, blue):
+                return None
+            hues.append(rgb_to_hsv(red, green, blue)[0])
+        turns: float = sum((hue - previous) % 1 for previous, hue in _pairs(hues))
+        if abs(turns - 1) < MATCH_TOLERANCE:
+            return _firmware("colorloop", colors[0], period)
+    return None
+
+
+def _firmware(effect: str, rgbw: RGBW, period: float) -> FirmwareEffect | None:
+    step: float = FIRMWARE_CYCLE_SECONDS[effect]
+    delay: int = round(period / step) - 1
+    if not 0 <= delay <= 255 or not _close((delay + 1) * step, period):
+        return None
+    return FirmwareEffect(effect, rgbw, delay)
+
+
+def _close(first: float, *others: float) -> bool:
+    return all(
+        abs(first - other) <= MATCH_TOLERANCE * max(first, other) for other in others
+    )
+
+
+def _pairs(values: list[float]) -> list[tuple[float, float]]:
+    # Cyclic, the last value is followed by the first one
+    return list(zip(values[-1:] + values[:-1], values))
@@ -0,0 +1,62 @@
+#
+# Line buffered output files of the recorder and the tracer
+#
+# Lines are collected on the event loop and appended to the file from the
+# executor, so a slow disk does not block the loop.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import asyncio
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+
+FLUSH_SECONDS: float = 5.0
+FLUSH_LINES: int = 256
+
+
+class BufferedLines:
+    def __init__(self, path: str, lines: list[str] | None = None) -> None:
+        self._path: str = path
+        self._lines: list[str] = lines or []
+        self._flush_lock: asyncio.Lock = asyncio.Lock()
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def append(self, line: str) -> None:
+        self._lines.append(line)
+        if len(self._lines) >= FLUSH_LINES:
+            self._schedule_flush(0)
+        elif self._flush_handle is None:
+            self._schedule_flush(FLUSH_SECONDS)
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_handle:
+            self._flush_handle.cancel()
+        self._flush_handle = asyncio.get_running_loop().call_later(
+            delay, lambda: asyncio.create_task(self.flush())
+        )
+
+    async def flush(self) -> None:
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._flush_lock:
+            lines, self._lines = self._lines, []
+            if lines:
+                _LOGGER.debug("Writing %s lines to %s", len(lines), self._path)
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._write, lines
+                )
+
+    def _write(self, lines: list[str]) -> None:
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self._path, "a", encoding="utf-8") as output:
+            output.write("\n".join(lines) + "\n")
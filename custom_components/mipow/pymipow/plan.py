@@ -0,0 +1,136 @@
+#
+# Command plans of the MiPow Playbulb devices
+#
+# A plan collects all characteristic writes a state change needs, orders them,
+# drops the redundant ones and issues them pipelined over the open connection.
+# The profile of the device gives the writes of every kind of state change, the
+# transition, in their order. A plan without a transition, e.g. the timer sync,
+# issues all its writes.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+from collections.abc import Mapping
+from dataclasses import dataclass
+import time
+from types import MappingProxyType
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bleak.backends.characteristic import BleakGATTCharacteristic
+    from bleak_retry_connector import BleakClientWithServiceCache
+
+WRITE_RGBW: str = "rgbw"
+WRITE_EFFECT: str = "effect"
+WRITE_TIMER: str = "timer"
+
+# Colour first, an effect has to follow the colour as the colour write stops it
+WRITE_ORDER: tuple[str, ...] = (WRITE_RGBW, WRITE_EFFECT, WRITE_TIMER)
+
+TRANSITION_COLOR: str = "color"
+TRANSITION_BRIGHTNESS: str = "brightness"
+TRANSITION_EFFECT: str = "effect"
+TRANSITION_OFF: str = "off"
+
+# The writes of every transition in their order, other writes are dropped
+DEFAULT_WRITE_PLANS: Mapping[str, tuple[str, ...]] = MappingProxyType(
+    {
+        TRANSITION_COLOR: (WRITE_RGBW, WRITE_TIMER),
+        TRANSITION_BRIGHTNESS: (WRITE_RGBW, WRITE_TIMER),
+        # The effect packet carries the colour
+        TRANSITION_EFFECT: (WRITE_EFFECT, WRITE_TIMER),
+        TRANSITION_OFF: (WRITE_RGBW, WRITE_TIMER),
+    }
+)
+
+
+def is_brightness_change(
+    old: tuple[int, int, int, int], new: tuple[int, int, int, int]
+) -> bool:
+    # The same colour scaled, every channel may be rounded by one
+    if old == new or not any(old) or not any(new):
+        return False
+    old_peak, new_peak = max(old), max(new)
+    return all(
+        abs(before * new_peak - after * old_peak) <= max(old_peak, new_peak)
+        for before, after in zip(old, new)
+    )
+
+
+@dataclass(frozen=True)
+class GattWrite:
+    kind: str
+    characteristic: BleakGATTCharacteristic
+    data: bytes | bytearray
+
+
+@dataclass(frozen=True)
+class CommandStats:
+    name: str
+    transition: str | None
+    writes: int
+    dropped: int
+    elapsed: float
+
+
+class CommandPlan:
+    def __init__(
+        self,
+        name: str,
+        transition: str | None = None,
+        write_plans: Mapping[str, tuple[str, ...]] = DEFAULT_WRITE_PLANS,
+    ) -> None:
+        self._name: str = name
+        self._transition: str | None = transition
+        self._order: tuple[str, ...] = (
+            write_plans[transition] if transition else WRITE_ORDER
+        )
+        self._writes: dict[tuple[str, int], GattWrite] = {}
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def transition(self) -> str | None:
+        return self._transition
+
+    def __bool__(self) -> bool:
+        return bool(self._writes)
+
+    def write(
+        self,
+        kind: str,
+        characteristic: BleakGATTCharacteristic,
+        data: bytes | bytearray,
+    ) -> None:
+        # A later write of the same characteristic (timer slot) replaces the former
+        slot: int = data[0] if kind == WRITE_TIMER else 0
+        self._writes[(kind, slot)] = GattWrite(kind, characteristic, data)
+
+    @property
+    def writes(self) -> list[GattWrite]:
+        return sorted(
+            (write for write in self._writes.values() if write.kind in self._order),
+            key=lambda write: self._order.index(write.kind),
+        )
+
+    async def execute(self, client: BleakClientWithServiceCache) -> CommandStats:
+        writes = self.writes
+        start: float = time.monotonic()
+        for index, write in enumerate(writes):
+            properties = write.characteristic.properties
+            if index == len(writes) - 1:
+                # Wait for the last write, so the whole plan is known to be applied
+                response = "write" in properties
+            else:
+                response = "write-without-response" not in properties
+            await client.write_gatt_char(write.characteristic, write.data, response)
+
+        return CommandStats(
+            name=self._name,
+            transition=self._transition,
+            writes=len(writes),
+            dropped=len(self._writes) - len(writes),
+            elapsed=time.monotonic() - start,
+        )
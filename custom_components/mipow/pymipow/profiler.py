@@ -0,0 +1,136 @@
+#
+# Event loop impact profiling of the MiPow Playbulb devices
+#
+# Measures how long the device callbacks and the entity updates hold the event
+# loop, and samples the event loop lag while device operations are running.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import asyncio
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+import logging
+import time
+from typing import Any
+
+_LOGGER = logging.getLogger(__name__)
+
+SLOW_CALLBACK_SECONDS: float = 0.01
+LAG_SAMPLE_SECONDS: float = 0.05
+LAG_WARNING_SECONDS: float = 0.1
+
+
+@dataclass
+class TimingStats:
+    count: int = 0
+    total: float = 0
+    max: float = 0
+    slow: int = 0
+
+    def add(self, elapsed: float, slow: bool = False) -> None:
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if slow:
+            self.slow += 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def as_dict(self, flagged: str = "slow") -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.mean * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            flagged: self.slow,
+        }
+
+
+class LoopProfiler:
+    def __init__(
+        self, name: str, slow_callback: float = SLOW_CALLBACK_SECONDS
+    ) -> None:
+        self._name: str = name
+        self._slow_callback: float = slow_callback
+        self._timings: dict[str, TimingStats] = {}
+        self._lag: TimingStats = TimingStats()
+        self._lock: TimingStats = TimingStats()
+        self._operation_lag: float = 0
+        self._active: int = 0
+        self._lag_handle: asyncio.TimerHandle | None = None
+        self._lag_expected: float = 0
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed: float = time.perf_counter() - start
+            slow: bool = elapsed >= self._slow_callback
+            if slow:
+                _LOGGER.warning(
+                    "%s: %s held the event loop for %.1f ms",
+                    self._name,
+                    name,
+                    elapsed * 1000,
+                )
+            self._timings.setdefault(name, TimingStats()).add(elapsed, slow)
+
+    @contextmanager
+    def operation(self, name: str) -> Iterator[None]:
+        # The lag is sampled only while the device is busy
+        self._active += 1
+        if self._active == 1:
+            self._operation_lag = 0
+            self._schedule_lag_sample(asyncio.get_running_loop())
+        try:
+            yield
+        finally:
+            self._active -= 1
+            if not self._active:
+                self._stop_lag_samples()
+                if self._operation_lag >= LAG_WARNING_SECONDS:
+                    _LOGGER.warning(
+                        "%s: Event loop lag up to %.1f ms around %s",
+                        self._name,
+                        self._operation_lag * 1000,
+                        name,
+                    )
+
+    @property
+    def lock(self) -> TimingStats:
+        return self._lock
+
+    def lock_acquired(self, waited: float, contended: bool) -> None:
+        self._lock.add(waited, contended)
+
+    def _schedule_lag_sample(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._lag_expected = loop.time() + LAG_SAMPLE_SECONDS
+        self._lag_handle = loop.call_at(self._lag_expected, self._sample_lag, loop)
+
+    def _sample_lag(self, loop: asyncio.AbstractEventLoop) -> None:
+        lag: float = max(0, loop.time() - self._lag_expected)
+        self._lag.add(lag, lag >= LAG_WARNING_SECONDS)
+        self._operation_lag = max(self._operation_lag, lag)
+        self._schedule_lag_sample(loop)
+
+    def _stop_lag_samples(self) -> None:
+        if self._lag_handle:
+            self._lag_handle.cancel()
+            self._lag_handle = None
+
+    def stop(self) -> None:
+        self._stop_lag_samples()
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "callbacks": {
+                name: stats.as_dict() for name, stats in self._timings.items()
+            },
+            "loop_lag": self._lag.as_dict(),
+            "lock_wait": self._lock.as_dict("contended"),
+        }
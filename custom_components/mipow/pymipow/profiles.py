@@ -0,0 +1,77 @@
+#
+# Device profiles of the MiPow Playbulb models
+#
+# A profile is chosen by the model and the firmware read from the device
+# information service. It declares the characteristics, the packet format, the
+# effects, whether the device runs on a battery, how many timer slots it has and
+# the writes of every kind of state change: colour, brightness, effect and off.
+# The profiles are kept by the capability registry, other models are added with
+# CAPABILITY_REGISTRY.register_profile.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from types import MappingProxyType
+
+from .codec import TIMER_SLOTS, MiPowCodec
+from .plan import DEFAULT_WRITE_PLANS
+
+RGBW_CHARACTERISTIC_UUID: str = "0000fffc-0000-1000-8000-00805f9b34fb"
+EFFECT_CHARACTERISTIC_UUID: str = "0000fffb-0000-1000-8000-00805f9b34fb"
+BATTERY_CHARACTERISTIC_UUID: str = "00002a19-0000-1000-8000-00805f9b34fb"
+TIMER_CHARACTERISTIC_UUID: str = "0000fffe-0000-1000-8000-00805f9b34fb"
+
+MIPOW_EFFECT_LIGHT_CODE: int = 255
+MIPOW_EFFECTS: Mapping[str, int] = MappingProxyType(
+    {
+        "flash": 0,
+        "pulse": 1,
+        "colorloop": 2,
+        "rainbow": 3,
+        "candle": 4,
+        "light": MIPOW_EFFECT_LIGHT_CODE,
+    }
+)
+
+
+@dataclass(frozen=True)
+class DeviceProfile:
+    name: str
+    # Patterns of the model and the software revision, e.g. "BTL300*"
+    models: tuple[str, ...] = ("*",)
+    firmware: tuple[str, ...] = ("*",)
+    rgbw_uuid: str = RGBW_CHARACTERISTIC_UUID
+    effect_uuid: str = EFFECT_CHARACTERISTIC_UUID
+    battery_uuid: str | None = BATTERY_CHARACTERISTIC_UUID
+    timer_uuid: str | None = TIMER_CHARACTERISTIC_UUID
+    # None when it is probed with a battery read
+    battery_powered: bool | None = None
+    timer_slots: int = TIMER_SLOTS
+    effects: Mapping[str, int] = field(default_factory=lambda: MIPOW_EFFECTS)
+    codec: type[MiPowCodec] = MiPowCodec
+    # The writes of every transition in their order, see DEFAULT_WRITE_PLANS
+    write_plans: Mapping[str, tuple[str, ...]] = field(
+        default_factory=lambda: DEFAULT_WRITE_PLANS
+    )
+
+    @property
+    def schedule_slots(self) -> int:
+        # Slot 0 is used by the "time off" timer
+        return max(0, self.timer_slots - 1)
+
+    def matches(self, model: str | None, firmware: str | None) -> bool:
+        return any(fnmatch(model or "", pattern) for pattern in self.models) and any(
+            fnmatch(firmware or "", pattern) for pattern in self.firmware
+        )
+
+
+GENERIC_PROFILE = DeviceProfile("generic")
+
+BUILTIN_PROFILES: tuple[DeviceProfile, ...] = (
+    DeviceProfile("candle", models=("BTL300*", "BTL305*"), battery_powered=True),
+    # Mains powered, the battery is not probed
+    DeviceProfile("bulb", models=("BTL200*", "BTL201*"), battery_powered=False),
+)
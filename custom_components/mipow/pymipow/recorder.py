@@ -0,0 +1,553 @@
+#
+# Recorder and replay of the GATT traffic of MiPow Playbulb devices
+#
+# A session file has JSON lines: a header object, followed by events
+#   ["connect", t, dt, services, error]
+#   ["read", t, dt, uuid, hex, error]
+#   ["write", t, dt, uuid, hex, response, error]
+#   ["disconnect", t, dt]
+#   ["disconnected", t]
+#   ["call", t, dt, method, args, kwargs, error]
+# where t is the start in seconds since the session began and dt the duration.
+# The GATT events are replayed in order with the recorded timing (or faster),
+# the calls drive the MiPow device like the caller did.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field, fields, is_dataclass
+from datetime import datetime
+import json
+import time
+from typing import Any
+
+from bleak.exc import BleakError
+
+from .codec import EffectPacket, TimerSlot
+from .keyframes import CompiledEffect, FirmwareEffect
+from .output import BufferedLines
+
+SESSION_VERSION: int = 1
+
+# Bytes of the timer packet with the clock of the device, they differ between runs.
+# The off time of slot 0 is counted from the clock too.
+TIMER_CLOCK_BYTES = slice(2, 5)
+TIMER_OFF_TIME_BYTES = slice(6, 8)
+TIMER_PACKET_SIZE: int = 13
+
+SERIALIZED_TYPES: dict[str, type] = {
+    EffectPacket.__name__: EffectPacket,
+    TimerSlot.__name__: TimerSlot,
+    CompiledEffect.__name__: CompiledEffect,
+    FirmwareEffect.__name__: FirmwareEffect,
+}
+
+Connector = Callable[..., Awaitable[Any]]
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"bytes": bytes(value).hex()}
+    if is_dataclass(value):
+        return {
+            type(value).__name__: {
+                item.name: _to_json(getattr(value, item.name))
+                for item in fields(value)
+            }
+        }
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
+
+def _from_json(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    if isinstance(value, dict) and len(value) == 1:
+        (name, data), = value.items()
+        if name == "bytes":
+            return bytes.fromhex(data)
+        if name in SERIALIZED_TYPES:
+            return SERIALIZED_TYPES[name](
+                **{key: _from_json(item) for key, item in data.items()}
+            )
+    return value
+
+
+def _describe_error(ex: BaseException) -> str:
+    return f"{type(ex).__name__}: {ex}"
+
+
+def _raise_recorded(error: str) -> None:
+    name, _, message = error.partition(": ")
+    if name == "TimeoutError":
+        raise asyncio.TimeoutError(message)
+    raise BleakError(message)
+
+
+def _uuid(characteristic: Any) -> str:
+    return getattr(characteristic, "uuid", characteristic)
+
+
+class GattRecorder:
+    def __init__(self, path: str, address: str, name: str | None = None) -> None:
+        self._start: float = time.monotonic()
+        header = {
+            "version": SESSION_VERSION,
+            "address": address,
+            "name": name,
+            "started": datetime.now().isoformat(timespec="seconds"),
+        }
+        self._output: BufferedLines = BufferedLines(path, [json.dumps(header)])
+
+    @property
+    def path(self) -> str:
+        return self._output.path
+
+    def now(self) -> float:
+        return round(time.monotonic() - self._start, 4)
+
+    def event(self, *event: Any) -> None:
+        self._output.append(json.dumps(event, separators=(",", ":")))
+
+    def since(self, start: float) -> float:
+        return round(self.now() - start, 4)
+
+    def wrap(self, connector: Connector) -> Connector:
+        async def _connect(
+            device: Any,
+            name: str,
+            disconnected_callback: Callable[[Any], None] | None = None,
+            cached_services: Any = None,
+        ) -> RecordingClient:
+            recording: RecordingClient | None = None
+
+            def _disconnected(client: Any) -> None:
+                # Disconnects asked by the device code are recorded as "disconnect"
+                if recording is None or not recording.disconnecting:
+                    self.event("disconnected", self.now())
+                if disconnected_callback:
+                    disconnected_callback(client)
+
+            start: float = self.now()
+            try:
+                client = await connector(
+                    device, name, _disconnected, cached_services
+                )
+            except Exception as ex:
+                error: str = _describe_error(ex)
+                self.event("connect", start, self.since(start), None, error)
+                raise
+            self.event(
+                "connect",
+                start,
+                self.since(start),
+                [
+                    [
+                        characteristic.uuid,
+                        characteristic.handle,
+                        characteristic.properties,
+                    ]
+                    for service in client.services
+                    for characteristic in service.characteristics
+                ],
+                None,
+            )
+            recording = RecordingClient(self, client)
+            return recording
+
+        return _connect
+
+    async def call(
+        self, method: str, args: tuple, kwargs: dict[str, Any], coro: Awaitable[Any]
+    ) -> Any:
+        start: float = self.now()
+        error: str | None = None
+        try:
+            return await coro
+        except Exception as ex:
+            error = _describe_error(ex)
+            raise
+        finally:
+            self.event(
+                "call",
+                start,
+                self.since(start),
+                method,
+                _to_json(args),
+                {key: _to_json(value) for key, value in kwargs.items()},
+                error,
+            )
+
+    async def flush(self) -> None:
+        await self._output.flush()
+
+
+class RecordingClient:
+    def __init__(self, recorder: GattRecorder, client: Any) -> None:
+        self._recorder: GattRecorder = recorder
+        self._client = client
+        self.disconnecting: bool = False
+
+    @property
+    def services(self) -> Any:
+        return self._client.services
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client.is_connected
+
+    async def read_gatt_char(self, characteristic: Any, **kwargs: Any) -> bytearray:
+        start: float = self._recorder.now()
+        try:
+            result = await self._client.read_gatt_char(characteristic, **kwargs)
+        except Exception as ex:
+            self._recorder.event(
+                "read",
+                start,
+                self._recorder.since(start),
+                _uuid(characteristic),
+                None,
+                _describe_error(ex),
+            )
+            raise
+        self._recorder.event(
+            "read",
+            start,
+            self._recorder.since(start),
+            _uuid(characteristic),
+            bytes(result).hex(),
+            None,
+        )
+        return result
+
+    async def write_gatt_char(
+        self,
+        characteristic: Any,
+        data: bytes | bytearray,
+        response: bool | None = None,
+    ) -> None:
+        start: float = self._recorder.now()
+        error: str | None = None
+        try:
+            await self._client.write_gatt_char(characteristic, data, response)
+        except Exception as ex:
+            error = _describe_error(ex)
+            raise
+        finally:
+            self._recorder.event(
+                "write",
+                start,
+                self._recorder.since(start),
+                _uuid(characteristic),
+                bytes(data).hex(),
+                response,
+                error,
+            )
+
+    async def disconnect(self) -> bool:
+        start: float = self._recorder.now()
+        self.disconnecting = True
+        try:
+            return await self._client.disconnect()
+        finally:
+            self._recorder.event("disconnect", start, self._recorder.since(start))
+
+
+@dataclass(frozen=True)
+class ReplayDevice:
+    address: str
+    name: str | None = None
+    rssi: int = 0
+    details: Any = None
+
+
+@dataclass(frozen=True)
+class ReplayCharacteristic:
+    uuid: str
+    handle: int
+    properties: list[str]
+
+
+class ReplayServices:
+    def __init__(self, services: list[list[Any]]) -> None:
+        self._characteristics: dict[str, ReplayCharacteristic] = {
+            uuid: ReplayCharacteristic(uuid, handle, properties)
+            for uuid, handle, properties in services
+        }
+
+    def get_characteristic(self, uuid: str) -> ReplayCharacteristic | None:
+        return self._characteristics.get(uuid)
+
+
+@dataclass
+class CallReport:
+    method: str
+    recorded: float
+    replayed: float
+    error: str | None = None
+
+
+@dataclass
+class ReplayReport:
+    calls: list[CallReport] = field(default_factory=list)
+    mismatches: list[str] = field(default_factory=list)
+    unused_events: int = 0
+    recorded: float = 0
+    replayed: float = 0
+
+    @property
+    def passed(self) -> bool:
+        return not self.mismatches and not self.unused_events
+
+
+class ReplaySession:
+    def __init__(self, header: dict[str, Any], events: list[list[Any]]) -> None:
+        self.header: dict[str, Any] = header
+        self._gatt: list[list[Any]] = [
+            event for event in events if event[0] != "call"
+        ]
+        self.calls: list[list[Any]] = sorted(
+            (event for event in events if event[0] == "call"),
+            key=lambda event: event[1],
+        )
+        self._position: int = 0
+        self._speed: float = 1.0
+        self._report: ReplayReport = ReplayReport()
+        self._client: ReplayClient | None = None
+        self._progressed: asyncio.Event | None = None
+        # Offsets of the calls which did not finish yet
+        self._pending: list[float] = []
+
+    @classmethod
+    def load(cls, path: str) -> ReplaySession:
+        with open(path, encoding="utf-8") as session:
+            lines = [line for line in session.read().splitlines() if line]
+        header: dict[str, Any] = json.loads(lines[0])
+        if header.get("version") != SESSION_VERSION:
+            raise ValueError(f"Unsupported session version {header.get('version')}")
+        return cls(header, [json.loads(line) for line in lines[1:]])
+
+    @property
+    def address(self) -> str:
+        return self.header["address"]
+
+    @property
+    def name(self) -> str | None:
+        return self.header.get("name")
+
+    @property
+    def speed(self) -> float:
+        return self._speed
+
+    @property
+    def device(self) -> ReplayDevice:
+        return ReplayDevice(self.address, self.name)
+
+    def peek(self) -> list[Any] | None:
+        if self._position < len(self._gatt):
+            return self._gatt[self._position]
+        return None
+
+    def take(self, kind: str, uuid: str | None = None) -> list[Any]:
+        event = self.peek()
+        if event and event[0] == "disconnected" and kind != "disconnected":
+            # The replay runs ahead of the recorded drop of the connection
+            if self._client:
+                self._client.drop()
+            raise BleakError("Disconnected")
+
+        if event is None or event[0] != kind or (uuid and event[3] != uuid):
+            expected: str = "end of session"
+            if event is not None:
+                expected = event[0]
+                if event[0] in ("read", "write"):
+                    expected += f" {event[3]}"
+            message = f"{kind} {uuid or ''} at {self._position}, expected {expected}"
+            self._report.mismatches.append(message)
+            raise BleakError(f"Replay diverged: {message}")
+        self._position += 1
+        self._progress()
+        return event
+
+    def _progress(self) -> None:
+        if self._progressed:
+            self._progressed.set()
+
+    async def _reach(self, offset: float) -> None:
+        # Calls start after the GATT events recorded before them, like a drop
+        while not self._is_reached(offset):
+            self._progressed.clear()
+            await self._progressed.wait()
+
+    def _is_reached(self, offset: float) -> bool:
+        event = self.peek()
+        if event is None or event[1] >= offset or self._report.mismatches:
+            return True
+        if self._client and self._client.dropping:
+            return False
+        return not any(pending < offset for pending in self._pending)
+
+    def mismatch(self, message: str) -> None:
+        self._report.mismatches.append(message)
+
+    async def wait(self, event: list[Any]) -> None:
+        await asyncio.sleep(event[2] / self._speed)
+
+    async def connect(
+        self,
+        device: Any,
+        name: str,
+        disconnected_callback: Callable[[Any], None] | None = None,
+        cached_services: Any = None,
+    ) -> ReplayClient:
+        event = self.take("connect")
+        await self.wait(event)
+        if event[4]:
+            _raise_recorded(event[4])
+        client = ReplayClient(self, ReplayServices(event[3]), disconnected_callback)
+        self._client = client
+        client.schedule_disconnected(event)
+        return client
+
+    async def replay(self, device: Any, speed: float = 1.0) -> ReplayReport:
+        self._position = 0
+        self._speed = speed
+        self._client = None
+        self._progressed = asyncio.Event()
+        self._pending = [event[1] for event in self.calls]
+        self._report = report = ReplayReport()
+        loop = asyncio.get_running_loop()
+        start: float = loop.time()
+
+        async def _call(event: list[Any]) -> None:
+            _, offset, recorded, method, args, kwargs, _ = event
+            await asyncio.sleep(max(0, start + offset / speed - loop.time()))
+            await self._reach(offset)
+            call_start: float = loop.time()
+            error: str | None = None
+            try:
+                await getattr(device, method)(
+                    *_from_json(args),
+                    **{key: _from_json(value) for key, value in kwargs.items()},
+                )
+            except Exception as ex:  # pylint: disable=broad-except
+                error = _describe_error(ex)
+            finally:
+                self._pending.remove(offset)
+                self._progress()
+            if error != event[6]:
+                report.mismatches.append(
+                    f"{method} at {offset}s: recorded {event[6]}, replayed {error}"
+                )
+            report.calls.append(
+                CallReport(method, recorded, loop.time() - call_start, error)
+            )
+
+        await asyncio.gather(*(_call(event) for event in self.calls))
+        report.replayed = loop.time() - start
+        if self._gatt or self.calls:
+            report.recorded = max(
+                event[1] + (event[2] if len(event) > 2 else 0)
+                for event in self._gatt + self.calls
+            )
+        report.unused_events = len(self._gatt) - self._position
+        return report
+
+
+class ReplayClient:
+    def __init__(
+        self,
+        session: ReplaySession,
+        services: ReplayServices,
+        disconnected_callback: Callable[[Any], None] | None,
+    ) -> None:
+        self._session: ReplaySession = session
+        self._services: ReplayServices = services
+        self._disconnected_callback = disconnected_callback
+        self._connected: bool = True
+        self._drop_handle: asyncio.TimerHandle | None = None
+
+    @property
+    def services(self) -> ReplayServices:
+        return self._services
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    @property
+    def dropping(self) -> bool:
+        return self._drop_handle is not None
+
+    def _require_connected(self) -> None:
+        if not self._connected:
+            raise BleakError("Replay client is not connected")
+
+    async def read_gatt_char(self, characteristic: Any, **kwargs: Any) -> bytearray:
+        self._require_connected()
+        event = self._session.take("read", _uuid(characteristic))
+        await self._session.wait(event)
+        self.schedule_disconnected(event)
+        if event[5]:
+            _raise_recorded(event[5])
+        return bytearray.fromhex(event[4])
+
+    async def write_gatt_char(
+        self,
+        characteristic: Any,
+        data: bytes | bytearray,
+        response: bool | None = None,
+    ) -> None:
+        self._require_connected()
+        uuid: str = _uuid(characteristic)
+        event = self._session.take("write", uuid)
+        if not self._is_same_write(bytes.fromhex(event[4]), bytes(data)):
+            self._session.mismatch(
+                f"write {uuid} at {event[1]}s: recorded {event[4]}, got {data.hex()}"
+            )
+        await self._session.wait(event)
+        self.schedule_disconnected(event)
+        if event[6]:
+            _raise_recorded(event[6])
+
+    def _is_same_write(self, recorded: bytes, data: bytes) -> bool:
+        if len(recorded) == len(data) == TIMER_PACKET_SIZE:
+            recorded, data = bytearray(recorded), bytearray(data)
+            for packet in (recorded, data):
+                if packet[0] == 0:
+                    packet[TIMER_OFF_TIME_BYTES] = bytes(2)
+                packet[TIMER_CLOCK_BYTES] = bytes(3)
+        return recorded == data
+
+    async def disconnect(self) -> bool:
+        if self._drop_handle:
+            self._drop_handle.cancel()
+            self._drop_handle = None
+        event = self._session.take("disconnect")
+        await self._session.wait(event)
+        self._connected = False
+        if self._disconnected_callback:
+            self._disconnected_callback(self)
+        return True
+
+    def schedule_disconnected(self, event: list[Any]) -> None:
+        # The device dropped the connection after this event in the recording
+        following = self._session.peek()
+        if following is None or following[0] != "disconnected":
+            return
+        delay: float = max(0, following[1] - event[1] - event[2])
+        self._drop_handle = asyncio.get_running_loop().call_later(
+            delay / self._session.speed, self.drop
+        )
+
+    def drop(self) -> None:
+        if self._drop_handle:
+            self._drop_handle.cancel()
+            self._drop_handle = None
+        self._session.take("disconnected")
+        self._connected = False
+        if self._disconnected_callback:
+            self._disconnected_callback(self)
@@ -0,0 +1,117 @@
+#
+# Deadline ordered scheduler shared by many MiPow devices
+#
+# All the per-device timers (idle disconnect, poll, battery, backoff) are kept
+# in one heap and driven by a single event loop timer of the earliest deadline.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import asyncio
+from collections.abc import Callable
+import contextvars
+import heapq
+import itertools
+from typing import Any
+
+
+class ScheduledCall:
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(
+        self, when: float, callback: Callable[..., None], args: tuple
+    ) -> None:
+        self.when: float = when
+        self.callback: Callable[..., None] = callback
+        self.args: tuple = args
+        self.cancelled: bool = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class DeadlineScheduler:
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        self._loop = loop or asyncio.get_running_loop()
+        self._heap: list[tuple[float, int, ScheduledCall]] = []
+        self._sequence = itertools.count()
+        self._handle: asyncio.TimerHandle | None = None
+        self._handle_when: float | None = None
+
+    def __len__(self) -> int:
+        return sum(1 for _, _, call in self._heap if not call.cancelled)
+
+    def time(self) -> float:
+        return self._loop.time()
+
+    def call_at(
+        self, when: float, callback: Callable[..., None], *args: Any
+    ) -> ScheduledCall:
+        call = ScheduledCall(when, callback, args)
+        heapq.heappush(self._heap, (when, next(self._sequence), call))
+        if self._handle_when is None or when < self._handle_when:
+            self._arm()
+        return call
+
+    def call_later(
+        self, delay: float, callback: Callable[..., None], *args: Any
+    ) -> ScheduledCall:
+        return self.call_at(self._loop.time() + delay, callback, *args)
+
+    def stop(self) -> None:
+        if self._handle:
+            self._handle.cancel()
+        self._handle = None
+        self._handle_when = None
+        for _, _, call in self._heap:
+            call.cancel()
+        self._heap.clear()
+
+    def _arm(self) -> None:
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+            self._handle_when = None
+
+        # Cancelled calls are dropped lazily when they reach the top
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+
+        if self._heap:
+            self._handle_when = self._heap[0][0]
+            # Not in the context of whoever armed the earliest deadline
+            self._handle = self._loop.call_at(
+                self._handle_when, self._run, context=contextvars.Context()
+            )
+
+    def _run(self) -> None:
+        self._handle = None
+        self._handle_when = None
+        now: float = self._loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, call = heapq.heappop(self._heap)
+            if call.cancelled:
+                continue
+            call.cancelled = True
+            try:
+                call.callback(*call.args)
+            except Exception as ex:  # pylint: disable=broad-except
+                self._loop.call_exception_handler(
+                    {
+                        "message": "Exception in scheduled callback",
+                        "exception": ex,
+                    }
+                )
+        self._arm()
+
+
+class ScaledScheduler(DeadlineScheduler):
+    # Device timers run faster than real time, e.g. in replays and stress runs
+    def __init__(self, speed: float) -> None:
+        super().__init__()
+        self._speed: float = speed
+
+    def call_later(
+        self, delay: float, callback: Callable[..., None], *args: Any
+    ) -> ScheduledCall:
+        return super().call_later(delay / self._speed, callback, *args)
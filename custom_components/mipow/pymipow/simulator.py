@@ -0,0 +1,255 @@
+#
+# Simulated MiPow Playbulb candles for soak and stress runs
+#
+# A candle keeps its GATT state across connections and is reached through its
+# connector, like a real device through establish_connection. Latency, dropped
+# connections, failed connects and physical toggles are injected from a seeded
+# random generator, so a run can be repeated.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import asyncio
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+import random
+from typing import Any
+
+from bleak.exc import BleakError
+
+from .codec import (
+    EFFECT_PACKET_SIZE,
+    RGBW_PACKET_SIZE,
+    TIMER_MODE_DISABLED,
+    TIMER_PACKET_SIZE,
+    TIMER_SLOTS,
+)
+from .device import (
+    BATTERY_CHARACTERISTIC_UUID,
+    EFFECT_CHARACTERISTIC_UUID,
+    MIPOW_EFFECT_LIGHT_CODE,
+    RGBW_CHARACTERISTIC_UUID,
+    TIMER_CHARACTERISTIC_UUID,
+)
+
+MANUFACTURER_CHARACTERISTIC_UUID: str = "00002a29-0000-1000-8000-00805f9b34fb"
+HW_VERSION_CHARACTERISTIC_UUID: str = "00002a27-0000-1000-8000-00805f9b34fb"
+SW_VERSION_CHARACTERISTIC_UUID: str = "00002a28-0000-1000-8000-00805f9b34fb"
+MODEL_CHARACTERISTIC_UUID: str = "00002a26-0000-1000-8000-00805f9b34fb"
+SERIAL_CHARACTERISTIC_UUID: str = "00002a25-0000-1000-8000-00805f9b34fb"
+
+WRITE_PROPERTIES: list[str] = ["read", "write", "write-without-response"]
+
+
+@dataclass
+class SimulationProfile:
+    latency: tuple[float, float] = (0.01, 0.08)
+    connect_latency: tuple[float, float] = (0.3, 1.5)
+    # Probabilities per connect and per read or write
+    connect_failure_rate: float = 0.02
+    drop_rate: float = 0.002
+
+
+@dataclass
+class SimulationStats:
+    connects: int = 0
+    connect_failures: int = 0
+    disconnects: int = 0
+    drops: int = 0
+    reads: int = 0
+    writes: int = 0
+    toggles: int = 0
+
+
+@dataclass(frozen=True)
+class SimulatedCharacteristic:
+    uuid: str
+    handle: int
+    properties: list[str]
+
+
+class SimulatedService:
+    def __init__(self, characteristics: list[SimulatedCharacteristic]) -> None:
+        self.characteristics: list[SimulatedCharacteristic] = characteristics
+        self._by_uuid: dict[str, SimulatedCharacteristic] = {
+            characteristic.uuid: characteristic for characteristic in characteristics
+        }
+
+    def __iter__(self) -> Iterator[SimulatedService]:
+        # The candle has a single service
+        return iter((self,))
+
+    def get_characteristic(self, uuid: str) -> SimulatedCharacteristic | None:
+        return self._by_uuid.get(uuid)
+
+
+class SimulatedCandle:
+    def __init__(
+        self,
+        address: str,
+        seed: int | None = None,
+        profile: SimulationProfile | None = None,
+        model: str = "BTL300",
+    ) -> None:
+        self.address: str = address
+        self.name: str = f"PLAYBULB {address[-5:]}"
+        self.rssi: int = -60
+        self.details: Any = None
+        self.profile: SimulationProfile = profile or SimulationProfile()
+        self.stats: SimulationStats = SimulationStats()
+        self._random = random.Random(seed)
+        self._client: SimulatedClient | None = None
+        self._last_color = bytes((0, 255, 80, 0))
+        self.values: dict[str, bytearray] = {
+            RGBW_CHARACTERISTIC_UUID: bytearray(RGBW_PACKET_SIZE),
+            EFFECT_CHARACTERISTIC_UUID: bytearray(
+                (0, 0, 0, 0, MIPOW_EFFECT_LIGHT_CODE, 0, 0, 0)
+            ),
+            TIMER_CHARACTERISTIC_UUID: bytearray(
+                (TIMER_MODE_DISABLED, 0, 0) * TIMER_SLOTS
+            ),
+            BATTERY_CHARACTERISTIC_UUID: bytearray((100,)),
+            MANUFACTURER_CHARACTERISTIC_UUID: bytearray(b"MIPOW"),
+            HW_VERSION_CHARACTERISTIC_UUID: bytearray(b"1.0"),
+            SW_VERSION_CHARACTERISTIC_UUID: bytearray(b"1.0"),
+            MODEL_CHARACTERISTIC_UUID: bytearray(model.encode()),
+            SERIAL_CHARACTERISTIC_UUID: bytearray(address.replace(":", "").encode()),
+        }
+        self.services = SimulatedService(
+            [
+                SimulatedCharacteristic(uuid, handle, self._properties(uuid))
+                for handle, uuid in enumerate(self.values, start=1)
+            ]
+        )
+
+    def _properties(self, uuid: str) -> list[str]:
+        if uuid in (RGBW_CHARACTERISTIC_UUID, EFFECT_CHARACTERISTIC_UUID):
+            return WRITE_PROPERTIES
+        if uuid == TIMER_CHARACTERISTIC_UUID:
+            return ["read", "write"]
+        return ["read"]
+
+    @property
+    def connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    @property
+    def rgbw(self) -> bytes:
+        return bytes(self.values[RGBW_CHARACTERISTIC_UUID])
+
+    def random(self) -> random.Random:
+        return self._random
+
+    def latency(self) -> float:
+        return self._random.uniform(*self.profile.latency)
+
+    async def connect(
+        self,
+        device: Any,
+        name: str,
+        disconnected_callback: Callable[[Any], None] | None = None,
+        cached_services: Any = None,
+    ) -> SimulatedClient:
+        await asyncio.sleep(self._random.uniform(*self.profile.connect_latency))
+        if self._random.random() < self.profile.connect_failure_rate:
+            self.stats.connect_failures += 1
+            raise BleakError(f"{self.name}: Simulated connection failure")
+        if self._client and self._client.is_connected:
+            # One central at a time, the former connection is gone
+            self._client.drop()
+        self.stats.connects += 1
+        self._client = SimulatedClient(self, disconnected_callback)
+        return self._client
+
+    def toggle(self) -> None:
+        # Tapping the candle switches it off, or on with the former colour
+        rgbw = self.values[RGBW_CHARACTERISTIC_UUID]
+        if any(rgbw):
+            self._last_color = bytes(rgbw)
+            rgbw[:] = bytes(RGBW_PACKET_SIZE)
+        else:
+            rgbw[:] = self._last_color
+        self.values[EFFECT_CHARACTERISTIC_UUID][4] = MIPOW_EFFECT_LIGHT_CODE
+        self.stats.toggles += 1
+
+    def drop(self) -> None:
+        if self._client and self._client.is_connected:
+            self._client.drop()
+
+    def write(self, uuid: str, data: bytes) -> None:
+        if uuid == RGBW_CHARACTERISTIC_UUID:
+            self.values[uuid][:] = data[:RGBW_PACKET_SIZE]
+            # A colour stops the running effect
+            self.values[EFFECT_CHARACTERISTIC_UUID][4] = MIPOW_EFFECT_LIGHT_CODE
+        elif uuid == EFFECT_CHARACTERISTIC_UUID:
+            self.values[uuid][:] = data[:EFFECT_PACKET_SIZE]
+            self.values[RGBW_CHARACTERISTIC_UUID][:] = data[:RGBW_PACKET_SIZE]
+        elif uuid == TIMER_CHARACTERISTIC_UUID and len(data) == TIMER_PACKET_SIZE:
+            slot_id, mode = data[0], data[1]
+            minute, hour = data[6], data[7]
+            self.values[uuid][slot_id * 3 : slot_id * 3 + 3] = bytes(
+                (mode, hour, minute)
+            )
+        else:
+            raise BleakError(f"{self.name}: Characteristic {uuid} is not writable")
+
+
+class SimulatedClient:
+    def __init__(
+        self,
+        candle: SimulatedCandle,
+        disconnected_callback: Callable[[Any], None] | None,
+    ) -> None:
+        self._candle: SimulatedCandle = candle
+        self._disconnected_callback = disconnected_callback
+        self._connected: bool = True
+
+    @property
+    def services(self) -> SimulatedService:
+        return self._candle.services
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def _transfer(self) -> None:
+        if not self._connected:
+            raise BleakError(f"{self._candle.name}: Not connected")
+        await asyncio.sleep(self._candle.latency())
+        if self._connected and (
+            self._candle.random().random() < self._candle.profile.drop_rate
+        ):
+            self.drop()
+        if not self._connected:
+            raise BleakError(f"{self._candle.name}: Disconnected")
+
+    async def read_gatt_char(self, characteristic: Any, **kwargs: Any) -> bytearray:
+        await self._transfer()
+        self._candle.stats.reads += 1
+        return bytearray(self._candle.values[characteristic.uuid])
+
+    async def write_gatt_char(
+        self,
+        characteristic: Any,
+        data: bytes | bytearray,
+        response: bool | None = None,
+    ) -> None:
+        await self._transfer()
+        self._candle.stats.writes += 1
+        self._candle.write(characteristic.uuid, bytes(data))
+
+    async def disconnect(self) -> bool:
+        if self._connected:
+            self._connected = False
+            self._candle.stats.disconnects += 1
+            if self._disconnected_callback:
+                self._disconnected_callback(self)
+        return True
+
+    def drop(self) -> None:
+        if not self._connected:
+            return
+        self._connected = False
+        self._candle.stats.drops += 1
+        if self._disconnected_callback:
+            self._disconnected_callback(self)
@@ -0,0 +1,393 @@
+#
+# Fleet scale soak run of the MiPow device code against simulated candles
+#
+# Every candle gets the setup of the integration: a MiPow device polled by the
+# fleet of the shared coordinator, entries reloaded from time to time, users
+# sending commands and people tapping the candles. The run reports memory per
+# device, event loop lag, poll drift and rate, lock contention and connection
+# churn, and fails when a threshold is exceeded.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import asyncio
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+import gc
+import logging
+import math
+import random
+import tracemalloc
+from typing import Any
+
+from .airtime import DEFAULT_ADAPTER, AirtimeRegistry
+from .device import MIPOW_EFFECTS, MiPow, State
+from .fleet import Fleet, FleetMember
+from .profiler import LoopProfiler
+from .scheduler import DeadlineScheduler
+from .simulator import SimulatedCandle, SimulationProfile
+
+_LOGGER = logging.getLogger(__name__)
+
+LAG_SAMPLE_SECONDS: float = 0.05
+
+
+@dataclass
+class SoakThresholds:
+    memory_per_device_kb: float = 96
+    memory_growth_per_device_kb: float = 16
+    lag_p99_ms: float = 100
+    drift_p95_ms: float = 250
+    # Polls of the busiest device per poll interval, above 1 it is polled twice
+    poll_rate: float = 1.2
+    lock_wait_mean_ms: float = 500
+    churn_per_device_hour: float = 60
+    command_failure_rate: float = 0.05
+
+
+@dataclass
+class SoakSettings:
+    devices: int = 100
+    duration: float = 600
+    poll_interval: float = 30
+    # Mean seconds between the commands and the taps of one candle
+    command_interval: float = 120
+    toggle_interval: float = 900
+    # Mean seconds between the reloads of one entry
+    reload_interval: float = 1800
+    seed: int = 0
+    shared_scheduler: bool = True
+    # Share of the adapter airtime for background work, 0 for no limit
+    airtime_budget: float = 0
+    simulation: SimulationProfile = field(default_factory=SimulationProfile)
+
+
+@dataclass
+class SoakReport:
+    devices: int
+    duration: float
+    memory_per_device_kb: float = 0
+    memory_growth_per_device_kb: float = 0
+    lag_ms: dict[str, float] = field(default_factory=dict)
+    drift_ms: dict[str, float] = field(default_factory=dict)
+    poll_rate: float = 0
+    lock_wait_mean_ms: float = 0
+    lock_wait_max_ms: float = 0
+    lock_contention: float = 0
+    connects: int = 0
+    connect_failures: int = 0
+    drops: int = 0
+    toggles: int = 0
+    reloads: int = 0
+    churn_per_device_hour: float = 0
+    polls: int = 0
+    poll_failures: int = 0
+    commands: int = 0
+    command_failures: int = 0
+    airtime: dict[str, Any] = field(default_factory=dict)
+    failures: list[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+    @property
+    def command_failure_rate(self) -> float:
+        return self.command_failures / self.commands if self.commands else 0
+
+
+def percentiles(samples: list[float], *points: int) -> dict[str, float]:
+    ordered = sorted(samples)
+    result: dict[str, float] = {}
+    for point in points:
+        if ordered:
+            index = min(len(ordered) - 1, math.ceil(point / 100 * len(ordered)) - 1)
+            result[f"p{point}"] = round(ordered[max(0, index)] * 1000, 3)
+        else:
+            result[f"p{point}"] = 0
+    result["max"] = round(ordered[-1] * 1000, 3) if ordered else 0
+    return result
+
+
+class _SoakFleet(Fleet):
+    # The fleet of the hub, measuring how late the polls are started
+    def __init__(self, run: SoakRun, *args: Any) -> None:
+        super().__init__(*args)
+        self._run = run
+
+    def _poll(self, member: FleetMember) -> None:
+        self._run.poll_started(member)
+        super()._poll(member)
+
+
+class SoakRun:
+    def __init__(self, settings: SoakSettings) -> None:
+        self._settings: SoakSettings = settings
+        self._random = random.Random(settings.seed)
+        self._loop = asyncio.get_running_loop()
+        self._lag: list[float] = []
+        self._drift: list[float] = []
+        self._polls: dict[str, int] = {}
+        # The state saved per device, like the state store of the integration
+        self._saved: dict[str, dict[str, Any]] = {}
+        self._report = SoakReport(settings.devices, settings.duration)
+
+    def poll_started(self, member: FleetMember) -> None:
+        address: str = member.device.address
+        self._drift.append(max(0, self._loop.time() - member.next_poll))
+        self._polls[address] = self._polls.get(address, 0) + 1
+        self._report.polls += 1
+
+    def _poll_failed(self, device: MiPow, ex: Exception) -> None:
+        self._report.poll_failures += 1
+        _LOGGER.debug("%s: Poll failed: %s", device.name, ex)
+
+    async def run(self, thresholds: SoakThresholds) -> SoakReport:
+        settings = self._settings
+        report = self._report
+        gc.collect()
+        tracemalloc.start()
+        baseline: int = tracemalloc.get_traced_memory()[0]
+
+        scheduler = DeadlineScheduler() if settings.shared_scheduler else None
+        fleet = _SoakFleet(
+            self,
+            settings.poll_interval,
+            lambda device: None,
+            self._poll_failed,
+            scheduler,
+        )
+        airtime = AirtimeRegistry()
+        # The simulated candles share the default adapter
+        airtime.set_budget(DEFAULT_ADAPTER, settings.airtime_budget)
+        candles: list[SimulatedCandle] = [
+            SimulatedCandle(
+                f"AA:BB:CC:{index >> 16 & 0xFF:02X}:{index >> 8 & 0xFF:02X}:"
+                f"{index & 0xFF:02X}",
+                seed=self._random.randrange(2**32),
+                profile=settings.simulation,
+            )
+            for index in range(settings.devices)
+        ]
+        devices: list[MiPow] = [
+            MiPow(
+                candle,
+                connector=candle.connect,
+                scheduler=scheduler,
+                profiler=LoopProfiler(candle.name),
+                airtime=airtime.device(candle),
+            )
+            for candle in candles
+        ]
+
+        start: float = self._loop.time()
+        tasks: list[asyncio.Task] = [
+            asyncio.create_task(self._sample_lag()),
+            asyncio.create_task(self._reloads(fleet, devices)),
+        ]
+        for candle, device in zip(candles, devices):
+            ready = asyncio.Event()
+            device.register_callback(self._track(device, ready))
+            fleet.add(device)
+            tasks.append(asyncio.create_task(self._commands(device, ready)))
+            tasks.append(asyncio.create_task(self._toggles(candle)))
+
+        # Memory once every device went through its first poll
+        await asyncio.sleep(min(settings.poll_interval * 2, settings.duration / 2))
+        gc.collect()
+        settled: int = tracemalloc.get_traced_memory()[0]
+        await asyncio.sleep(max(0, start + settings.duration - self._loop.time()))
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        fleet.stop()
+        gc.collect()
+        final: int = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        for device in devices:
+            await device.stop()
+
+        report.memory_per_device_kb = round(
+            (final - baseline) / settings.devices / 1024, 2
+        )
+        report.memory_growth_per_device_kb = round(
+            (final - settled) / settings.devices / 1024, 2
+        )
+        report.airtime = airtime.summary()
+        report.lag_ms = percentiles(self._lag, 50, 95, 99)
+        report.drift_ms = percentiles(self._drift, 50, 95, 99)
+        # The first poll of a device is due within one interval
+        intervals: float = settings.duration / settings.poll_interval
+        report.poll_rate = round(
+            max(self._polls.values(), default=0) / max(1, intervals), 3
+        )
+
+        acquisitions: int = sum(device.profiler.lock.count for device in devices)
+        contended: int = sum(device.profiler.lock.slow for device in devices)
+        waited: float = sum(device.profiler.lock.total for device in devices)
+        report.lock_wait_mean_ms = round(
+            waited / acquisitions * 1000 if acquisitions else 0, 3
+        )
+        report.lock_wait_max_ms = round(
+            max(device.profiler.lock.max for device in devices) * 1000, 3
+        )
+        report.lock_contention = round(
+            contended / acquisitions if acquisitions else 0, 4
+        )
+
+        for candle in candles:
+            report.connects += candle.stats.connects
+            report.connect_failures += candle.stats.connect_failures
+            report.drops += candle.stats.drops
+            report.toggles += candle.stats.toggles
+        # The first connect of every device is the setup, not churn
+        device_hours: float = settings.devices * settings.duration / 3600
+        report.churn_per_device_hour = round(
+            max(0, report.connects - settings.devices) / device_hours, 2
+        )
+
+        self._check(thresholds)
+        return report
+
+    async def _sample_lag(self) -> None:
+        while True:
+            expected: float = self._loop.time() + LAG_SAMPLE_SECONDS
+            await asyncio.sleep(LAG_SAMPLE_SECONDS)
+            self._lag.append(max(0, self._loop.time() - expected))
+
+    def _track(
+        self, device: MiPow, ready: asyncio.Event
+    ) -> Callable[[State], None]:
+        def _save(state: State) -> None:
+            # Entities take commands once the first refresh succeeded
+            ready.set()
+            self._saved[device.address] = asdict(device.desired_state)
+
+        return _save
+
+    async def _reloads(self, fleet: Fleet, devices: list[MiPow]) -> None:
+        # An entry reload takes the device out of the hub and adds it again,
+        # while the polls of the other devices run
+        while True:
+            await asyncio.sleep(
+                self._random.expovariate(
+                    len(devices) / self._settings.reload_interval
+                )
+            )
+            device: MiPow = self._random.choice(devices)
+            fleet.remove(device)
+            fleet.add(device)
+            self._report.reloads += 1
+
+    async def _commands(self, device: MiPow, ready: asyncio.Event) -> None:
+        effects: list[int] = list(MIPOW_EFFECTS.values())
+        # Entities take commands once the first refresh of the entry succeeded
+        await ready.wait()
+        while True:
+            await asyncio.sleep(
+                self._random.expovariate(1 / self._settings.command_interval)
+            )
+            self._report.commands += 1
+            try:
+                await self._command(device, effects)
+            except Exception as ex:  # pylint: disable=broad-except
+                self._report.command_failures += 1
+                _LOGGER.debug("%s: Command failed: %r", device.name, ex)
+
+    async def _command(self, device: MiPow, effects: list[int]) -> None:
+        choice: float = self._random.random()
+        if choice < 0.2:
+            await device.turn_off()
+        elif choice < 0.4:
+            await device.set_light(
+                effect=self._random.choice(effects), delay=self._random.randrange(256)
+            )
+        else:
+            await device.set_light(
+                red=self._random.randrange(256),
+                green=self._random.randrange(256),
+                blue=self._random.randrange(256),
+                white=self._random.randrange(256),
+            )
+
+    async def _toggles(self, candle: SimulatedCandle) -> None:
+        while True:
+            await asyncio.sleep(
+                self._random.expovariate(1 / self._settings.toggle_interval)
+            )
+            candle.toggle()
+
+    def _check(self, thresholds: SoakThresholds) -> None:
+        report = self._report
+        checks: list[tuple[str, float, float]] = [
+            (
+                "memory per device (KiB)",
+                report.memory_per_device_kb,
+                thresholds.memory_per_device_kb,
+            ),
+            (
+                "memory growth per device (KiB)",
+                report.memory_growth_per_device_kb,
+                thresholds.memory_growth_per_device_kb,
+            ),
+            ("event loop lag p99 (ms)", report.lag_ms["p99"], thresholds.lag_p99_ms),
+            ("poll drift p95 (ms)", report.drift_ms["p95"], thresholds.drift_p95_ms),
+            ("poll rate", report.poll_rate, thresholds.poll_rate),
+            (
+                "lock wait mean (ms)",
+                report.lock_wait_mean_ms,
+                thresholds.lock_wait_mean_ms,
+            ),
+            (
+                "connects per device hour",
+                report.churn_per_device_hour,
+                thresholds.churn_per_device_hour,
+            ),
+            (
+                "command failure rate",
+                report.command_failure_rate,
+                thresholds.command_failure_rate,
+            ),
+        ]
+        for name, value, limit in checks:
+            if value > limit:
+                report.failures.append(f"{name} {value} exceeds {limit}")
+
+
+async def run_soak(
+    settings: SoakSettings, thresholds: SoakThresholds | None = None
+) -> SoakReport:
+    return await SoakRun(settings).run(thresholds or SoakThresholds())
+
+
+def describe(report: SoakReport) -> list[str]:
+    values: dict[str, Any] = {
+        "devices": report.devices,
+        "duration (s)": report.duration,
+        "memory per device (KiB)": report.memory_per_device_kb,
+        "memory growth per device (KiB)": report.memory_growth_per_device_kb,
+        "event loop lag (ms)": report.lag_ms,
+        "poll drift (ms)": report.drift_ms,
+        "poll rate": report.poll_rate,
+        "lock wait mean / max (ms)": (
+            f"{report.lock_wait_mean_ms} / {report.lock_wait_max_ms}"
+        ),
+        "lock contention": report.lock_contention,
+        "connects / failed / drops": (
+            f"{report.connects} / {report.connect_failures} / {report.drops}"
+        ),
+        "connects per device hour": report.churn_per_device_hour,
+        "polls / failed": f"{report.polls} / {report.poll_failures}",
+        "commands / failed": f"{report.commands} / {report.command_failures}",
+        "toggles / reloads": f"{report.toggles} / {report.reloads}",
+    }
+    for adapter, summary in report.airtime.items():
+        values[f"airtime {adapter}"] = (
+            f"budget {summary['budget']}, utilisation {summary['utilisation']}, "
+            f"deferred {summary['deferred']}"
+        )
+        for kind, stats in summary["kinds"].items():
+            values[f"  {kind}"] = stats
+    return [f"{name:32} {value}" for name, value in values.items()]
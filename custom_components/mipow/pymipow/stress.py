@@ -0,0 +1,243 @@
+#
+# Concurrency stress run of the MiPow device lock and the disconnect races
+#
+# Several workers per simulated candle interleave updates, commands, idle
+# disconnects and unexpected disconnects in a seeded random order. Every command
+# that returns has to be shown by the candle right away, and every command that
+# fails has to be explained by a fault of the candle.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+import logging
+import random
+import time
+
+from bleak.exc import BleakError
+
+from .codec import decode_effect, decode_rgbw
+from .device import EFFECT_CHARACTERISTIC_UUID, MIPOW_EFFECTS, MiPow
+from .profiler import LoopProfiler
+from .scheduler import ScaledScheduler
+from .simulator import SimulatedCandle, SimulationProfile
+from .soak import percentiles
+
+_LOGGER = logging.getLogger(__name__)
+
+# An idle disconnect of 120 s takes 0.2 s
+TIMER_SPEED: float = 600
+
+STRESS_PROFILE = SimulationProfile(
+    latency=(0.001, 0.01),
+    connect_latency=(0.005, 0.03),
+    # Connects are retried by establish_connection, only drops remain
+    connect_failure_rate=0,
+    drop_rate=0.01,
+)
+
+ACTIONS: dict[str, float] = {
+    "update": 0.3,
+    "set_color": 0.25,
+    "set_effect": 0.1,
+    "turn_off": 0.1,
+    "idle": 0.2,
+    "drop": 0.05,
+}
+COMMANDS: tuple[str, ...] = ("set_color", "set_effect", "turn_off")
+
+
+@dataclass
+class StressSettings:
+    devices: int = 5
+    workers: int = 4
+    operations: int = 500
+    seed: int = 0
+    simulation: SimulationProfile = field(default_factory=lambda: STRESS_PROFILE)
+
+
+@dataclass
+class StressReport:
+    operations: int = 0
+    commands: int = 0
+    elapsed: float = 0
+    # Failures after two or more faults of the candle, which the retry can not hide
+    faulted: int = 0
+    spurious: list[str] = field(default_factory=list)
+    lost: list[str] = field(default_factory=list)
+    latency_ms: dict[str, dict[str, float]] = field(default_factory=dict)
+    lock_contention: float = 0
+    lock_wait_mean_ms: float = 0
+    connects: int = 0
+    disconnects: int = 0
+    drops: int = 0
+
+    @property
+    def passed(self) -> bool:
+        return not self.spurious and not self.lost
+
+    @property
+    def throughput(self) -> float:
+        return self.operations / self.elapsed if self.elapsed else 0
+
+
+class StressRun:
+    def __init__(self, settings: StressSettings) -> None:
+        self._settings: StressSettings = settings
+        self._random = random.Random(settings.seed)
+        self._report = StressReport()
+        self._latency: dict[str, list[float]] = {}
+
+    async def run(self) -> StressReport:
+        settings = self._settings
+        report = self._report
+        scheduler = ScaledScheduler(TIMER_SPEED)
+        candles: list[SimulatedCandle] = [
+            SimulatedCandle(
+                f"AA:BB:CC:DD:{index >> 8 & 0xFF:02X}:{index & 0xFF:02X}",
+                seed=self._random.randrange(2**32),
+                profile=settings.simulation,
+            )
+            for index in range(settings.devices)
+        ]
+        devices: list[MiPow] = [
+            MiPow(
+                candle,
+                connector=candle.connect,
+                scheduler=scheduler,
+                profiler=LoopProfiler(candle.name),
+            )
+            for candle in candles
+        ]
+        # Worker seeds are drawn up front, so the choices do not depend on timing
+        workers: list[Awaitable[None]] = [
+            self._worker(candle, device, random.Random(self._random.randrange(2**32)))
+            for candle, device in zip(candles, devices)
+            for _ in range(settings.workers)
+        ]
+
+        start: float = time.perf_counter()
+        await asyncio.gather(*workers)
+        report.elapsed = time.perf_counter() - start
+
+        for candle, device in zip(candles, devices):
+            await self._check_settled(candle, device)
+            report.disconnects += candle.stats.disconnects
+            await device.stop()
+        scheduler.stop()
+
+        report.latency_ms = {
+            action: percentiles(samples, 50, 95)
+            for action, samples in sorted(self._latency.items())
+        }
+        acquisitions: int = sum(device.profiler.lock.count for device in devices)
+        if acquisitions:
+            report.lock_contention = round(
+                sum(device.profiler.lock.slow for device in devices) / acquisitions, 4
+            )
+            report.lock_wait_mean_ms = round(
+                sum(device.profiler.lock.total for device in devices)
+                / acquisitions
+                * 1000,
+                3,
+            )
+        for candle in candles:
+            report.connects += candle.stats.connects
+            report.drops += candle.stats.drops
+        return report
+
+    async def _worker(
+        self, candle: SimulatedCandle, device: MiPow, choices: random.Random
+    ) -> None:
+        actions: list[str] = list(ACTIONS)
+        weights: list[float] = list(ACTIONS.values())
+        for _ in range(self._settings.operations):
+            action: str = choices.choices(actions, weights)[0]
+            if action == "idle":
+                # Long enough for the idle disconnect now and then
+                await asyncio.sleep(choices.uniform(0, 1))
+            elif action == "drop":
+                candle.drop()
+                await asyncio.sleep(0)
+            else:
+                await self._operation(candle, device, action, choices)
+            self._report.operations += 1
+
+    async def _operation(
+        self,
+        candle: SimulatedCandle,
+        device: MiPow,
+        action: str,
+        choices: random.Random,
+    ) -> None:
+        expected: Callable[[], bool]
+        if action == "update":
+            operation = device.update()
+            expected = lambda: True
+        elif action == "set_color":
+            rgbw = tuple(choices.randrange(1, 256) for _ in range(4))
+            operation = device.set_light(*rgbw, effect=MIPOW_EFFECTS["light"])
+            expected = lambda: decode_rgbw(candle.rgbw) == rgbw
+        elif action == "set_effect":
+            effect: int = choices.choice(list(MIPOW_EFFECTS.values()))
+            delay: int = choices.randrange(256)
+            operation = device.set_light(effect=effect, delay=delay)
+            expected = lambda: (
+                not device.is_on
+                or _effect(candle) == effect
+                and decode_rgbw(candle.rgbw) == device.rgbw
+            )
+        else:
+            operation = device.turn_off()
+            expected = lambda: not any(candle.rgbw)
+
+        drops: int = candle.stats.drops
+        start: float = time.perf_counter()
+        try:
+            await operation
+        except (BleakError, asyncio.TimeoutError) as ex:
+            if action in COMMANDS and candle.stats.drops - drops < 2:
+                self._spurious(device, action, ex)
+            else:
+                self._report.faulted += 1
+            return
+        except Exception as ex:  # pylint: disable=broad-except
+            self._spurious(device, action, ex)
+            return
+        finally:
+            self._latency.setdefault(action, []).append(time.perf_counter() - start)
+
+        # Checked before any other task runs
+        if action in COMMANDS:
+            self._report.commands += 1
+            if not expected():
+                self._report.lost.append(
+                    f"{device.name}: {action} not shown,"
+                    f" device {decode_rgbw(candle.rgbw)}"
+                )
+
+    def _spurious(self, device: MiPow, action: str, ex: BaseException) -> None:
+        _LOGGER.debug("%s: %s failed: %r", device.name, action, ex)
+        self._report.spurious.append(f"{device.name}: {action} failed: {ex!r}")
+
+    async def _check_settled(self, candle: SimulatedCandle, device: MiPow) -> None:
+        try:
+            await device.update()
+        except (BleakError, asyncio.TimeoutError):
+            # One more try, the candle may drop the connection at any time
+            await device.update()
+        if decode_rgbw(candle.rgbw) != device.rgbw:
+            self._report.lost.append(
+                f"{device.name}: settled at {decode_rgbw(candle.rgbw)},"
+                f" expected {device.rgbw}"
+            )
+
+
+def _effect(candle: SimulatedCandle) -> int:
+    return decode_effect(candle.values[EFFECT_CHARACTERISTIC_UUID]).effect
+
+
+async def run_stress(settings: StressSettings) -> StressReport:
+    return await StressRun(settings).run()
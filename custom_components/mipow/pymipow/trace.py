@@ -0,0 +1,169 @@
+#
+# Tracing of the MiPow Playbulb operations in the Chrome trace event format
+#
+# Every public operation gets its own track with nested spans for the lock wait,
+# connect, characteristic reads and writes and the callback dispatch. The spans
+# carry the id of the context which started the operation, e.g. a service call.
+# The file is a JSON array, it opens in chrome://tracing or ui.perfetto.dev.
+#
+# This code is released under the terms of the MIT license.
+#
+from __future__ import annotations
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+import itertools
+import json
+import time
+from typing import Any
+
+from .output import BufferedLines
+
+# Set by the caller, e.g. to the id of the Home Assistant context of a service call
+TRACE_CONTEXT: ContextVar[str | None] = ContextVar("mipow_trace_context", default=None)
+_TRACK: ContextVar[int] = ContextVar("mipow_trace_track", default=0)
+
+Connector = Callable[..., Awaitable[Any]]
+
+
+def _uuid(characteristic: Any) -> str:
+    return getattr(characteristic, "uuid", characteristic)
+
+
+class Tracer:
+    def __init__(self, path: str, name: str) -> None:
+        self._name: str = name
+        self._output: BufferedLines = BufferedLines(path, ["["])
+        self._tracks = itertools.count(1)
+        # Wall clock origin, so the traces of many devices can be merged
+        self._origin: float = time.time() * 1_000_000 - time.perf_counter_ns() / 1000
+        self._metadata(0, f"{name} background")
+
+    @property
+    def path(self) -> str:
+        return self._output.path
+
+    def _now(self) -> float:
+        return round(self._origin + time.perf_counter_ns() / 1000, 1)
+
+    def _emit(self, event: dict[str, Any]) -> None:
+        self._output.append(json.dumps(event, separators=(",", ":")) + ",")
+
+    def _metadata(self, track: int, name: str) -> None:
+        self._emit(
+            {
+                "ph": "M",
+                "name": "thread_name",
+                "pid": 1,
+                "tid": track,
+                "args": {"name": name},
+            }
+        )
+
+    @contextmanager
+    def operation(self, name: str) -> Iterator[None]:
+        track: int = next(self._tracks)
+        self._metadata(track, f"{self._name} {name}")
+        token = _TRACK.set(track)
+        try:
+            with self.span(name, "operation"):
+                yield
+        finally:
+            _TRACK.reset(token)
+
+    @contextmanager
+    def span(self, name: str, category: str = "mipow", **args: Any) -> Iterator[None]:
+        start: float = self._now()
+        try:
+            yield
+        except BaseException as ex:
+            args["error"] = f"{type(ex).__name__}: {ex}"
+            raise
+        finally:
+            context: str | None = TRACE_CONTEXT.get()
+            if context:
+                args["context"] = context
+            self._emit(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": start,
+                    "dur": round(self._now() - start, 1),
+                    "pid": 1,
+                    "tid": _TRACK.get(),
+                    "args": args,
+                }
+            )
+
+    def instant(self, name: str, **args: Any) -> None:
+        self._emit(
+            {
+                "name": name,
+                "cat": "mipow",
+                "ph": "i",
+                "s": "t",
+                "ts": self._now(),
+                "pid": 1,
+                "tid": _TRACK.get(),
+                "args": args,
+            }
+        )
+
+    def wrap(self, connector: Connector) -> Connector:
+        async def _connect(
+            device: Any,
+            name: str,
+            disconnected_callback: Callable[[Any], None] | None = None,
+            cached_services: Any = None,
+        ) -> TracingClient:
+            def _disconnected(client: Any) -> None:
+                self.instant("disconnected")
+                if disconnected_callback:
+                    disconnected_callback(client)
+
+            with self.span("connect", "gatt", cached=cached_services is not None):
+                client = await connector(device, name, _disconnected, cached_services)
+            return TracingClient(self, client)
+
+        return _connect
+
+    async def flush(self) -> None:
+        await self._output.flush()
+
+
+class TracingClient:
+    def __init__(self, tracer: Tracer, client: Any) -> None:
+        self._tracer: Tracer = tracer
+        self._client = client
+
+    @property
+    def services(self) -> Any:
+        return self._client.services
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client.is_connected
+
+    async def read_gatt_char(self, characteristic: Any, **kwargs: Any) -> bytearray:
+        with self._tracer.span("read", "gatt", uuid=_uuid(characteristic)):
+            return await self._client.read_gatt_char(characteristic, **kwargs)
+
+    async def write_gatt_char(
+        self,
+        characteristic: Any,
+        data: bytes | bytearray,
+        response: bool | None = None,
+    ) -> None:
+        with self._tracer.span(
+            "write",
+            "gatt",
+            uuid=_uuid(characteristic),
+            data=bytes(data).hex(),
+            response=response,
+        ):
+            await self._client.write_gatt_char(characteristic, data, response)
+
+    async def disconnect(self) -> bool:
+        with self._tracer.span("disconnect", "gatt"):
+            return await self._client.disconnect()
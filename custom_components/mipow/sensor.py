@@ -16,7 +16,7 @@ from homeassistant.helpers.update_coordinator import (
 import logging
 
 from .component import MIPOW_DOMAIN, map_to_device_info, MiPowData
-from .mipow import MiPow
+from .pymipow import MiPow
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from homeassistant.components.light import ATTR_EFFECT, ATTR_RGBW_COLOR
+from homeassistant.const import ATTR_NAME
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.service import async_extract_config_entry_ids
+from homeassistant.helpers.storage import Store
+import logging
+from typing import Any, TypeVar
+import voluptuous as vol
+
+from .pymipow.codec import (
+    EffectPacket,
+    decode_effect,
+    encode_alert,
+    encode_effect_packet,
+)
+from .pymipow.keyframes import CompiledEffect, Keyframe, compile_effect
+from .pymipow.trace import TRACE_CONTEXT
+from .component import (
+    MIPOW_DOMAIN,
+    ATTR_DELAY,
+    ATTR_DURATION,
+    ATTR_FADE,
+    ATTR_FIRMWARE,
+    ATTR_HOLD,
+    ATTR_KEYFRAMES,
+    ATTR_REPEAT,
+    ATTR_SCENE,
+    CONNECTION_SLOTS,
+    SERVICE_ALERT,
+    SERVICE_DEFINE_EFFECT,
+    SERVICE_PLAY_EFFECT,
+    SERVICE_RESTORE_SCENE,
+    SERVICE_SNAPSHOT_SCENE,
+    CandleEffectsMap,
+    MiPowData,
+    MiPowEffects,
+    get_target_data,
+)
+from .pymipow import MiPow
+
+_LOGGER = logging.getLogger(__name__)
+_T = TypeVar("_T")
+
+SCENES_STORAGE_VERSION = 1
+SCENES_STORAGE_KEY = f"{MIPOW_DOMAIN}.scenes"
+EFFECTS_STORAGE_VERSION = 1
+EFFECTS_STORAGE_KEY = f"{MIPOW_DOMAIN}.effects"
+
+ALERT_SCHEMA = cv.make_entity_service_schema(
+    {
+        vol.Optional(ATTR_RGBW_COLOR, default=(255, 0, 0, 0)): vol.All(
+            vol.ExactSequence((cv.byte,) * 4), vol.Coerce(tuple)
+        ),
+        vol.Optional(ATTR_EFFECT, default=MiPowEffects.FLASH): vol.In(
+            CandleEffectsMap
+        ),
+        vol.Optional(ATTR_DELAY, default=0x10): cv.byte,
+        vol.Optional(ATTR_DURATION, default=5): vol.All(
+            vol.Coerce(float), vol.Range(min=0.1, max=3600)
+        ),
+    }
+)
+
+SCENE_SCHEMA = cv.make_entity_service_schema(
+    {
+        vol.Required(ATTR_SCENE): cv.string,
+    }
+)
+
+KEYFRAME_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_RGBW_COLOR): vol.All(
+            vol.ExactSequence((cv.byte,) * 4), vol.Coerce(tuple)
+        ),
+        vol.Optional(ATTR_FADE, default=0): vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=3600)
+        ),
+        vol.Optional(ATTR_HOLD, default=0): vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=3600)
+        ),
+    }
+)
+
+DEFINE_EFFECT_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_NAME): cv.string,
+        vol.Required(ATTR_KEYFRAMES): vol.All(
+            cv.ensure_list, vol.Length(min=1, max=64), [KEYFRAME_SCHEMA]
+        ),
+        vol.Optional(ATTR_REPEAT, default=0): vol.All(
+            vol.Coerce(int), vol.Range(min=0, max=10000)
+        ),
+        vol.Optional(ATTR_FIRMWARE, default=False): cv.boolean,
+    }
+)
+
+PLAY_EFFECT_SCHEMA = cv.make_entity_service_schema(
+    {
+        vol.Required(ATTR_NAME): cv.string,
+    }
+)
+
+
+async def _async_run_on_devices(
+    devices: list[MiPow], operation: Callable[[MiPow], Awaitable[_T]]
+) -> list[_T | BaseException]:
+    # Connected devices go first and need no connection slot,
+    # the others are connected within the connection slot limits.
+    semaphore = asyncio.Semaphore(CONNECTION_SLOTS)
+
+    async def _run(device: MiPow) -> _T:
+        if device.connected:
+            return await operation(device)
+        async with semaphore:
+            return await operation(device)
+
+    ordered = sorted(devices, key=lambda device: not device.connected)
+    results = await asyncio.gather(
+        *(_run(device) for device in ordered), return_exceptions=True
+    )
+    by_address = {device.address: result for device, result in zip(ordered, results)}
+    return [by_address[device.address] for device in devices]
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    store: Store = Store(hass, SCENES_STORAGE_VERSION, SCENES_STORAGE_KEY)
+    scenes: dict[str, dict[str, str]] | None = None
+
+    async def _async_load_scenes() -> dict[str, dict[str, str]]:
+        nonlocal scenes
+        if scenes is None:
+            scenes = await store.async_load() or {}
+        return scenes
+
+    effects_store: Store = Store(hass, EFFECTS_STORAGE_VERSION, EFFECTS_STORAGE_KEY)
+    effects: dict[str, dict[str, Any]] | None = None
+    # Every effect is compiled once, when defined or loaded
+    compiled: dict[str, CompiledEffect] = {}
+
+    def _compile(name: str, definition: dict[str, Any]) -> CompiledEffect:
+        keyframes: list[Keyframe] = [
+            Keyframe(
+                rgbw=tuple(keyframe[ATTR_RGBW_COLOR]),
+                fade=keyframe[ATTR_FADE],
+                hold=keyframe[ATTR_HOLD],
+            )
+            for keyframe in definition[ATTR_KEYFRAMES]
+        ]
+        return compile_effect(
+            name,
+            keyframes,
+            definition[ATTR_REPEAT],
+            firmware=definition.get(ATTR_FIRMWARE, False),
+        )
+
+    async def _async_load_effects() -> dict[str, dict[str, Any]]:
+        nonlocal effects
+        if effects is None:
+            effects = await effects_store.async_load() or {}
+            for name, definition in effects.items():
+                compiled[name] = _compile(name, definition)
+        return effects
+
+    async def _async_define_effect(call: ServiceCall) -> None:
+        name: str = call.data[ATTR_NAME]
+        definition: dict[str, Any] = {
+            ATTR_KEYFRAMES: [
+                {**keyframe, ATTR_RGBW_COLOR: list(keyframe[ATTR_RGBW_COLOR])}
+                for keyframe in call.data[ATTR_KEYFRAMES]
+            ],
+            ATTR_REPEAT: call.data[ATTR_REPEAT],
+            ATTR_FIRMWARE: call.data[ATTR_FIRMWARE],
+        }
+        try:
+            effect: CompiledEffect = _compile(name, definition)
+        except ValueError as ex:
+            raise HomeAssistantError(str(ex)) from ex
+        _LOGGER.debug("Compiled effect %s, firmware %s", name, effect.firmware)
+
+        (await _async_load_effects())[name] = definition
+        compiled[name] = effect
+        await effects_store.async_save(effects)
+
+    async def _async_play_effect(call: ServiceCall) -> None:
+        TRACE_CONTEXT.set(call.context.id)
+        await _async_load_effects()
+        effect = compiled.get(call.data[ATTR_NAME])
+        if effect is None:
+            raise HomeAssistantError(f"Unknown effect {call.data[ATTR_NAME]}")
+
+        targets: list[MiPowData] = get_target_data(
+            hass, await async_extract_config_entry_ids(hass, call)
+        )
+        devices: list[MiPow] = [data.device for data in targets]
+        results = await _async_run_on_devices(
+            devices, lambda device: device.play(effect)
+        )
+        for device, result in zip(devices, results):
+            if isinstance(result, BaseException):
+                _LOGGER.warning("Effect failed on %s: %s", device.name, result)
+            else:
+                _LOGGER.debug("Effect on %s run by the device %s", device.name, result)
+
+    async def _async_snapshot_scene(call: ServiceCall) -> None:
+        TRACE_CONTEXT.set(call.context.id)
+        targets: list[MiPowData] = get_target_data(
+            hass, await async_extract_config_entry_ids(hass, call)
+        )
+        devices: list[MiPow] = [data.device for data in targets]
+        results = await _async_run_on_devices(
+            devices, lambda device: device.snapshot()
+        )
+
+        scene: dict[str, str] = {}
+        for device, result in zip(devices, results):
+            if isinstance(result, BaseException):
+                _LOGGER.warning("Snapshot failed on %s: %s", device.name, result)
+            else:
+                scene[device.address] = encode_effect_packet(result).hex()
+
+        (await _async_load_scenes())[call.data[ATTR_SCENE]] = scene
+        await store.async_save(scenes)
+
+    async def _async_restore_scene(call: ServiceCall) -> None:
+        TRACE_CONTEXT.set(call.context.id)
+        scene = (await _async_load_scenes()).get(call.data[ATTR_SCENE])
+        if scene is None:
+            raise HomeAssistantError(f"Unknown scene {call.data[ATTR_SCENE]}")
+
+        entry_ids = await async_extract_config_entry_ids(hass, call)
+        if not entry_ids:
+            entry_ids = set(hass.data.get(MIPOW_DOMAIN, {}))
+        devices: list[MiPow] = [
+            data.device
+            for data in get_target_data(hass, entry_ids)
+            if data.device.address in scene
+        ]
+
+        async def _restore(device: MiPow) -> bool:
+            snapshot: EffectPacket = decode_effect(bytes.fromhex(scene[device.address]))
+            return await device.restore(snapshot)
+
+        results = await _async_run_on_devices(devices, _restore)
+        for device, result in zip(devices, results):
+            if isinstance(result, BaseException):
+                _LOGGER.warning("Restore failed on %s: %s", device.name, result)
+            else:
+                _LOGGER.debug("Restored %s, written %s", device.name, result)
+
+    async def _async_alert(call: ServiceCall) -> None:
+        TRACE_CONTEXT.set(call.context.id)
+        targets: list[MiPowData] = get_target_data(
+            hass, await async_extract_config_entry_ids(hass, call)
+        )
+        rgbw_color = call.data[ATTR_RGBW_COLOR]
+        # One packet for all the devices
+        packet: bytes = encode_alert(
+            red=rgbw_color[0],
+            green=rgbw_color[1],
+            blue=rgbw_color[2],
+            white=rgbw_color[3],
+            effect=CandleEffectsMap[call.data[ATTR_EFFECT]],
+            delay=call.data[ATTR_DELAY],
+        )
+        devices: list[MiPow] = [data.device for data in targets]
+        results = await _async_run_on_devices(
+            devices, lambda device: device.alert(packet, call.data[ATTR_DURATION])
+        )
+        for device, result in zip(devices, results):
+            if isinstance(result, BaseException):
+                _LOGGER.warning("Alert failed on %s: %s", device.name, result)
+
+    hass.services.async_register(
+        MIPOW_DOMAIN, SERVICE_ALERT, _async_alert, schema=ALERT_SCHEMA
+    )
+    hass.services.async_register(
+        MIPOW_DOMAIN,
+        SERVICE_DEFINE_EFFECT,
+        _async_define_effect,
+        schema=DEFINE_EFFECT_SCHEMA,
+    )
+    hass.services.async_register(
+        MIPOW_DOMAIN,
+        SERVICE_PLAY_EFFECT,
+        _async_play_effect,
+        schema=PLAY_EFFECT_SCHEMA,
+    )
+    hass.services.async_register(
+        MIPOW_DOMAIN,
+        SERVICE_SNAPSHOT_SCENE,
+        _async_snapshot_scene,
+        schema=SCENE_SCHEMA,
+    )
+    hass.services.async_register(
+        MIPOW_DOMAIN,
+        SERVICE_RESTORE_SCENE,
+        _async_restore_scene,
+        schema=SCENE_SCHEMA,
+    )
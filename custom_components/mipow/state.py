@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import asdict, fields
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+import logging
+from typing import Any
+
+from .component import MIPOW_DOMAIN, DATA_STATE, DEFAULT_AIRTIME_BUDGET
+from .pymipow import DesiredState, MiPow, State
+from .pymipow.capabilities import CAPABILITY_REGISTRY
+
+_LOGGER = logging.getLogger(__name__)
+
+STATE_STORAGE_VERSION = 1
+STATE_STORAGE_KEY = f"{MIPOW_DOMAIN}.state"
+AIRTIME_STORAGE_KEY = f"{MIPOW_DOMAIN}.airtime"
+# A burst of changes, e.g. a colour picker or a restart, is saved once
+STATE_SAVE_DELAY = 10
+ATTR_CAPABILITIES = "capabilities"
+
+DESIRED_STATE_FIELDS: tuple[str, ...] = tuple(
+    item.name for item in fields(DesiredState)
+)
+
+
+class MiPowStateStore:
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._store: Store = Store(hass, STATE_STORAGE_VERSION, STATE_STORAGE_KEY)
+        # Saved state of every device by its address
+        self._states: dict[str, dict[str, Any]] = {}
+        self._budget_store: Store = Store(
+            hass, STATE_STORAGE_VERSION, AIRTIME_STORAGE_KEY
+        )
+        # Airtime budget in percent by the adapter, shared by its devices
+        self._budgets: dict[str, int] = {}
+
+    async def async_load(self) -> None:
+        self._states = await self._store.async_load() or {}
+        self._budgets = await self._budget_store.async_load() or {}
+        _LOGGER.debug("Loaded the state of %s devices", len(self._states))
+
+    def get_airtime_budget(self, adapter: str) -> int:
+        return self._budgets.get(adapter, DEFAULT_AIRTIME_BUDGET)
+
+    @callback
+    def async_set_airtime_budget(self, adapter: str, budget: int) -> None:
+        if self._budgets.get(adapter) == budget:
+            return
+        self._budgets[adapter] = budget
+        self._budget_store.async_delay_save(lambda: self._budgets, STATE_SAVE_DELAY)
+
+    def get(self, address: str) -> dict[str, Any] | None:
+        return self._states.get(address)
+
+    def get_desired_state(self, address: str) -> DesiredState | None:
+        saved = self._states.get(address)
+        if not saved or not all(name in saved for name in DESIRED_STATE_FIELDS):
+            return None
+        return DesiredState(**{name: saved[name] for name in DESIRED_STATE_FIELDS})
+
+    @callback
+    def async_set(self, address: str, values: dict[str, Any]) -> None:
+        saved: dict[str, Any] = self._states.setdefault(address, {})
+        if all(saved.get(key) == value for key, value in values.items()):
+            return
+        saved.update(values)
+        self._store.async_delay_save(lambda: self._states, STATE_SAVE_DELAY)
+
+    def load_capabilities(self, address: str) -> None:
+        # Known from the last run, the first connect skips the device info reads
+        saved = self._states.get(address)
+        if saved and saved.get(ATTR_CAPABILITIES):
+            CAPABILITY_REGISTRY.load(saved[ATTR_CAPABILITIES])
+
+    @callback
+    def async_save_capabilities(self, device: MiPow) -> None:
+        exported = CAPABILITY_REGISTRY.export(device.address)
+        if exported:
+            self.async_set(device.address, {ATTR_CAPABILITIES: exported})
+
+    @callback
+    def async_track(self, device: MiPow) -> Callable[[], None]:
+        def _save(state: State) -> None:
+            self.async_set(device.address, asdict(device.desired_state))
+
+        return device.register_callback(_save)
+
+    @callback
+    def async_remove(self, address: str) -> None:
+        if self._states.pop(address, None) is not None:
+            self._store.async_delay_save(lambda: self._states, STATE_SAVE_DELAY)
+
+
+async def async_setup_state_store(hass: HomeAssistant) -> MiPowStateStore:
+    # Loaded once, before any entry and its platforms are set up
+    store = MiPowStateStore(hass)
+    await store.async_load()
+    hass.data.setdefault(MIPOW_DOMAIN, {})[DATA_STATE] = store
+    return store
+
+
+@callback
+def async_get_state_store(hass: HomeAssistant) -> MiPowStateStore:
+    return hass.data[MIPOW_DOMAIN][DATA_STATE]
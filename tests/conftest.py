@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# pymipow does not depend on Home Assistant, it is imported on its own
+sys.path.insert(0, str(Path(__file__).parent.parent / "custom_components" / "mipow"))
@@ -0,0 +1,36 @@
+import asyncio
+
+from pymipow.airtime import KIND_POLL, AirtimeRegistry
+
+
+class SlowConnector:
+    def __init__(self, client) -> None:
+        self._client = client
+
+    async def __call__(self, device, name, disconnected_callback, cached_services):
+        await asyncio.sleep(0.05)
+        return self._client
+
+
+def test_budget_is_shared_by_the_devices_of_an_adapter():
+    registry = AirtimeRegistry(window=1)
+    first = registry.device(None)
+    second = registry.device(None)
+    registry.set_budget(first.adapter.name, 0.1)
+
+    first.add(0, 0.2, KIND_POLL)
+
+    assert second.saturated
+    assert second.defer(KIND_POLL)
+
+
+def test_establishing_a_connection_is_not_budgeted():
+    registry = AirtimeRegistry(window=1)
+    airtime = registry.device(None)
+    registry.set_budget(airtime.adapter.name, 0.01)
+
+    asyncio.run(airtime.wrap(SlowConnector(object()))(None, "candle"))
+
+    assert airtime.adapter.utilisation() == 0
+    assert not airtime.saturated
+    assert airtime.summary()["kinds"]["connect"]["operations"] == 1
@@ -0,0 +1,32 @@
+import asyncio
+
+from pymipow import MiPow
+from pymipow.capabilities import CAPABILITY_REGISTRY
+from pymipow.device import SW_VERSION_UUID
+from pymipow.simulator import SimulatedCandle, SimulationProfile
+
+QUIET = SimulationProfile(
+    latency=(0, 0), connect_latency=(0, 0), connect_failure_rate=0, drop_rate=0
+)
+
+
+async def _connect(candle: SimulatedCandle) -> int:
+    reads = candle.stats.reads
+    mipow = MiPow(candle, connector=candle.connect)
+    await mipow.update()
+    await mipow.stop()
+    return candle.stats.reads - reads
+
+
+def test_device_info_is_read_again_after_a_firmware_update():
+    async def _run() -> None:
+        candle = SimulatedCandle("AA:BB:CC:DD:EE:31", seed=1, profile=QUIET)
+        first = await _connect(candle)
+        # Only the firmware version is read while it is unchanged
+        assert await _connect(candle) == first - 4
+
+        candle.values[SW_VERSION_UUID] = b"9.9"
+        assert await _connect(candle) == first + 1
+        assert CAPABILITY_REGISTRY.get(candle.address).sw_version == "9.9"
+
+    asyncio.run(_run())
@@ -0,0 +1,107 @@
+from pymipow.benchmark import check_round_trips, run_benchmark, timers_read_back
+from pymipow.codec import (
+    RELATIVE_CLOCK,
+    TIMER_DISABLED_SLOT,
+    TIMER_MODE_DISABLED,
+    TIMER_MODE_DOZE,
+    TIMER_MODE_WAKEUP,
+    TIMER_SLOTS,
+    EffectPacket,
+    MiPowCodec,
+    TimerSlot,
+    decode_effect,
+    decode_rgbw,
+    decode_timers,
+    encode_alert,
+    encode_effect_packet,
+    encode_timer_disabled,
+)
+
+
+def test_rgbw_round_trip():
+    codec = MiPowCodec()
+    for rgbw in ((0, 0, 0, 0), (255, 0, 0, 0), (1, 2, 3, 4), (255, 255, 255, 255)):
+        packet = codec.encode_rgbw(*rgbw)
+        assert packet == bytearray((rgbw[3], rgbw[0], rgbw[1], rgbw[2]))
+        assert decode_rgbw(packet) == rgbw
+
+
+def test_effect_round_trip():
+    effect = EffectPacket(
+        red=255, green=80, blue=0, white=10, effect=1, repetitions=2, delay=20, pause=3
+    )
+    packet = MiPowCodec().encode_effect(
+        effect.red,
+        effect.green,
+        effect.blue,
+        effect.white,
+        effect.effect,
+        effect.repetitions,
+        effect.delay,
+        effect.pause,
+    )
+    assert decode_effect(packet) == effect
+    assert encode_effect_packet(effect) == bytes(packet)
+    assert decode_effect(encode_effect_packet(effect)) == effect
+
+
+def test_codec_buffers_are_reused():
+    codec = MiPowCodec()
+    first = codec.encode_rgbw(1, 2, 3, 4)
+    second = codec.encode_rgbw(5, 6, 7, 8)
+    assert first is second
+    assert decode_rgbw(first) == (5, 6, 7, 8)
+    # One buffer per timer slot
+    assert codec.encode_timer(1, TIMER_DISABLED_SLOT) is not codec.encode_timer(
+        2, TIMER_DISABLED_SLOT
+    )
+
+
+def test_timer_round_trip():
+    codec = MiPowCodec()
+    slots = [
+        TimerSlot(mode=TIMER_MODE_DOZE, hour=0, minute=31),
+        TimerSlot(mode=TIMER_MODE_WAKEUP, hour=6, minute=30, red=255, runtime=10),
+        TimerSlot(mode=TIMER_MODE_DOZE, hour=23, minute=0),
+        TIMER_DISABLED_SLOT,
+    ]
+    packets = [
+        bytes(codec.encode_timer(slot_id, slot, (12, 0, 0)))
+        for slot_id, slot in enumerate(slots)
+    ]
+    decoded = decode_timers(timers_read_back(packets))
+    assert len(decoded) == TIMER_SLOTS
+    for slot, read in zip(slots[:3], decoded):
+        assert (read.mode, read.hour, read.minute) == (
+            slot.mode,
+            slot.hour,
+            slot.minute,
+        )
+    assert decoded[3] == TimerSlot(mode=TIMER_MODE_DISABLED)
+    assert packets[0][2:5] == bytes((0, 0, 12))
+
+
+def test_off_after_wraps_midnight():
+    packet = MiPowCodec().encode_off_after(30, clock=(23, 50, 0))
+    slot = decode_timers(timers_read_back([packet]))[0]
+    assert (slot.mode, slot.hour, slot.minute) == (TIMER_MODE_DOZE, 0, 20)
+
+
+def test_cached_encoders_return_shared_immutable_packets():
+    assert encode_timer_disabled(0) is encode_timer_disabled(0)
+    assert isinstance(encode_timer_disabled(0), bytes)
+    assert encode_timer_disabled(0) == bytes(
+        MiPowCodec().encode_timer(0, TIMER_DISABLED_SLOT, RELATIVE_CLOCK)
+    )
+
+    alert = encode_alert(255, 0, 0, 0, 0, 16)
+    assert alert is encode_alert(255, 0, 0, 0, 0, 16)
+    assert isinstance(alert, bytes)
+    assert decode_effect(alert) == EffectPacket(255, 0, 0, 0, 0, 0, 16, 0)
+
+
+def test_benchmark():
+    check_round_trips()
+    results = run_benchmark(iterations=100)
+    assert set(results) >= {"encode_rgbw", "decode_rgbw", "decode_timers"}
+    assert all(nanoseconds > 0 for nanoseconds in results.values())
@@ -0,0 +1,85 @@
+import asyncio
+
+from pymipow.fleet import Fleet, FleetMember
+
+INTERVAL = 0.05
+
+
+class BlockedDevice:
+    def __init__(self, address: str) -> None:
+        self.address = address
+        self.name = address
+        self.state = self.effect = self.delay = None
+        self.repetitions = self.pause = self.timer = None
+        self.polls = 0
+        self.polling = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def update(self, fetch_battery=None) -> None:
+        self.polls += 1
+        self.polling.set()
+        await self.release.wait()
+
+    async def refresh_battery(self) -> None:
+        pass
+
+
+def _pending(fleet: Fleet, member: FleetMember) -> int:
+    return sum(
+        1
+        for _, _, call in fleet.scheduler._heap
+        if not call.cancelled and call.args[0] is member
+    )
+
+
+async def _rebalance_while_polled() -> tuple[Fleet, list[BlockedDevice]]:
+    fleet = Fleet(INTERVAL, lambda device: None, lambda device, ex: None)
+    first = BlockedDevice("AA:BB:CC:DD:EE:01")
+    fleet.add(first)
+    await asyncio.wait_for(first.polling.wait(), 1)
+
+    # Added and rescheduled while the poll of the first device is running
+    second = BlockedDevice("AA:BB:CC:DD:EE:02")
+    second.release.set()
+    fleet.add(second)
+    fleet.members[first.address].poll = None
+    fleet._rebalance()
+
+    first.release.set()
+    await asyncio.sleep(INTERVAL / 5)
+    return fleet, [first, second]
+
+
+def test_rebalance_while_polled_keeps_one_call_per_member():
+    async def _run() -> None:
+        fleet, devices = await _rebalance_while_polled()
+        for member in fleet.members.values():
+            # One poll and one battery read
+            assert _pending(fleet, member) == 2
+        polls = [device.polls for device in devices]
+        await asyncio.sleep(INTERVAL * 4.5)
+        # A single poll chain per device
+        assert all(
+            after - before <= 5
+            for before, after in zip(polls, (device.polls for device in devices))
+        )
+        fleet.stop()
+
+    asyncio.run(_run())
+
+
+def test_added_device_keeps_the_slots_of_the_others():
+    async def _run() -> None:
+        fleet = Fleet(INTERVAL, lambda device: None, lambda device, ex: None)
+        fleet.add(BlockedDevice("AA:BB:CC:DD:EE:01"))
+        first = fleet.members["AA:BB:CC:DD:EE:01"]
+        slots = (first.next_poll, first.next_battery)
+        fleet.add(BlockedDevice("AA:BB:CC:DD:EE:02"))
+        second = fleet.members["AA:BB:CC:DD:EE:02"]
+
+        assert (first.next_poll, first.next_battery) == slots
+        # Half an interval apart
+        assert abs(abs(first.next_poll - second.next_poll) - INTERVAL / 2) < 0.01
+        fleet.stop()
+
+    asyncio.run(_run())
@@ -0,0 +1,44 @@
+from pymipow.codec import decode_rgbw
+from pymipow.keyframes import FirmwareEffect, Keyframe, compile_effect
+
+
+def test_fade_has_a_frame_per_colour_change():
+    effect = compile_effect(
+        "fade", [Keyframe((0, 0, 0, 0), hold=1), Keyframe((10, 0, 0, 0), fade=2)]
+    )
+
+    colors = [decode_rgbw(frame) for frame in effect.frames]
+    assert effect.period == 3
+    assert colors[0] == (0, 0, 0, 0)
+    # One frame for each level of the fade, frames only where the colour changes
+    assert [red for red, _, _, _ in colors[1:]] == list(range(1, 11))
+    assert effect.offsets[0] == 0
+    assert 1 < effect.offsets[1] < 1.3
+    assert effect.offsets == tuple(sorted(effect.offsets))
+
+
+def test_long_effect_frames_are_bounded_by_the_colour_changes():
+    keyframes = [
+        Keyframe((255 * (index % 2), 0, 255, 0), fade=3600, hold=3600)
+        for index in range(64)
+    ]
+
+    effect = compile_effect("long", keyframes)
+
+    assert effect.period == 64 * 7200
+    # 256 levels per fade and channel instead of a frame every 100 ms
+    assert len(effect.frames) <= 64 * 256
+
+
+def test_firmware_effect_only_on_request():
+    flash = [Keyframe((255, 0, 0, 0), hold=0.5), Keyframe((0, 0, 0, 0), hold=0.5)]
+
+    assert compile_effect("flash", flash).firmware is None
+    assert compile_effect("flash", flash, repeat=3, firmware=True).firmware is None
+    # One cycle takes (delay + 1) steps of FIRMWARE_CYCLE_SECONDS
+    assert compile_effect("flash", flash, firmware=True).firmware == FirmwareEffect(
+        "flash", (255, 0, 0, 0), 49
+    )
+    # Held at both ends, neither a flash nor a pulse
+    uneven = [Keyframe((255, 0, 0, 0), fade=1, hold=1), Keyframe((0, 0, 0, 0), fade=1)]
+    assert compile_effect("uneven", uneven, firmware=True).firmware is None
@@ -0,0 +1,46 @@
+import asyncio
+
+from pymipow import MiPow
+from pymipow.plan import (
+    DEFAULT_WRITE_PLANS,
+    TRANSITION_EFFECT,
+    WRITE_EFFECT,
+    WRITE_RGBW,
+    WRITE_TIMER,
+    is_brightness_change,
+)
+from pymipow.profiles import DeviceProfile
+from pymipow.simulator import SimulatedCandle, SimulationProfile
+
+QUIET = SimulationProfile(
+    latency=(0, 0), connect_latency=(0, 0), connect_failure_rate=0, drop_rate=0
+)
+
+
+async def _effect_writes(profile: DeviceProfile | None) -> int:
+    candle = SimulatedCandle("AA:BB:CC:DD:EE:41", seed=1, profile=QUIET)
+    mipow = MiPow(candle, connector=candle.connect, profile=profile)
+    await mipow.update()
+    writes = candle.stats.writes
+    await mipow.set_light(red=255, green=0, blue=0, white=0, effect=1)
+    await mipow.stop()
+    return candle.stats.writes - writes
+
+
+def test_effect_writes_follow_the_write_plan_of_the_profile():
+    separate = DeviceProfile(
+        "separate",
+        write_plans={
+            **DEFAULT_WRITE_PLANS,
+            TRANSITION_EFFECT: (WRITE_RGBW, WRITE_EFFECT, WRITE_TIMER),
+        },
+    )
+
+    assert asyncio.run(_effect_writes(None)) == 1
+    assert asyncio.run(_effect_writes(separate)) == 2
+
+
+def test_brightness_change_keeps_the_colour():
+    assert is_brightness_change((200, 100, 0, 0), (101, 50, 0, 0))
+    assert not is_brightness_change((200, 100, 0, 0), (100, 100, 0, 0))
+    assert not is_brightness_change((0, 0, 0, 0), (100, 50, 0, 0))
@@ -0,0 +1,46 @@
+import asyncio
+
+from pymipow import MIPOW_EFFECT_LIGHT_CODE, MiPow
+from pymipow.codec import EffectPacket
+from pymipow.simulator import SimulatedCandle, SimulationProfile
+
+QUIET = SimulationProfile(
+    latency=(0, 0), connect_latency=(0, 0), connect_failure_rate=0, drop_rate=0
+)
+
+
+def test_snapshot_after_reconnect_reads_the_device_once():
+    async def _run() -> None:
+        candle = SimulatedCandle("AA:BB:CC:DD:EE:51", seed=1, profile=QUIET)
+        mipow = MiPow(candle, connector=candle.connect)
+        await mipow.set_light(red=255, green=0, blue=0, white=0)
+
+        # Dropped and tapped, the next connect reconciles
+        candle.drop()
+        candle.toggle()
+        reads = candle.stats.reads
+        snapshot = await mipow.snapshot()
+        await mipow.stop()
+
+        # What the device showed, the reconcile switches it on again
+        assert not any((snapshot.red, snapshot.green, snapshot.blue, snapshot.white))
+        # The timers, the colour and the effect, the reconcile reads nothing
+        assert candle.stats.reads - reads == 3
+        assert mipow.rgbw == (255, 0, 0, 0)
+
+    asyncio.run(_run())
+
+
+def test_restore_of_a_plain_light_keeps_the_effect_parameters():
+    async def _run() -> MiPow:
+        candle = SimulatedCandle("AA:BB:CC:DD:EE:52", seed=1, profile=QUIET)
+        mipow = MiPow(candle, connector=candle.connect)
+        await mipow.set_light(red=255, green=0, blue=0, white=0, effect=1, delay=30)
+        white = EffectPacket(0, 0, 0, 255, MIPOW_EFFECT_LIGHT_CODE, 0, 0, 0)
+        await mipow.restore(white)
+        await mipow.stop()
+        return mipow
+
+    mipow = asyncio.run(_run())
+    assert mipow.effect == MIPOW_EFFECT_LIGHT_CODE
+    assert (mipow.rgbw, mipow.delay) == ((0, 0, 0, 255), 30)
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime
+
+from pymipow import MiPow
+from pymipow.codec import TIMER_MODE_DOZE, TIMER_MODE_WAKEUP, MiPowCodec, TimerSlot
+from pymipow.device import RGBW_CHARACTERISTIC_UUID, TIMER_CHARACTERISTIC_UUID
+from pymipow.simulator import SimulatedCandle, SimulationProfile
+
+QUIET = SimulationProfile(
+    latency=(0, 0), connect_latency=(0, 0), connect_failure_rate=0, drop_rate=0
+)
+SCHEDULE = TimerSlot(mode=TIMER_MODE_WAKEUP, hour=6, minute=30, white=255)
+
+
+def _timer_writes(candle: SimulatedCandle) -> list[bytes]:
+    writes: list[bytes] = []
+    write = candle.write
+
+    def _write(uuid: str, data: bytes) -> None:
+        if uuid == TIMER_CHARACTERISTIC_UUID:
+            writes.append(bytes(data))
+        write(uuid, data)
+
+    candle.write = _write
+    return writes
+
+
+async def _restart_with_time_off(now: datetime, schedules: list[TimerSlot]):
+    candle = SimulatedCandle("AA:BB:CC:DD:EE:01", seed=1, profile=QUIET)
+    mipow = MiPow(candle, connector=candle.connect, now=lambda: now)
+    await mipow.update()
+    await mipow.sync_schedules(schedules)
+    await mipow.stop()
+
+    # A new instance, as after a restart of Home Assistant
+    writes = _timer_writes(candle)
+    mipow = MiPow(candle, connector=candle.connect, now=lambda: now)
+    await mipow.set_light(red=255, green=0, blue=0, white=0, timer=5)
+    await mipow.stop()
+    return candle, writes
+
+
+def test_time_off_keeps_wall_clock_of_schedules_after_restart():
+    now = datetime(2022, 10, 1, 18, 15, 30)
+    candle, writes = asyncio.run(_restart_with_time_off(now, [SCHEDULE]))
+
+    slot_id, mode, second, minute, hour, _, end_minute, end_hour = writes[-1][:8]
+    assert (slot_id, mode) == (0, TIMER_MODE_DOZE)
+    assert (hour, minute, second) == (18, 15, 30)
+    assert (end_hour, end_minute) == (18, 20)
+    # The schedule still fires at its time
+    assert candle.values[TIMER_CHARACTERISTIC_UUID][3:6] == bytes(
+        (TIMER_MODE_WAKEUP, 6, 30)
+    )
+
+
+def test_time_off_is_relative_without_schedules():
+    now = datetime(2022, 10, 1, 18, 15, 30)
+    _, writes = asyncio.run(_restart_with_time_off(now, []))
+
+    slot_id, mode, second, minute, hour, _, end_minute, end_hour = writes[-1][:8]
+    assert (slot_id, mode) == (0, TIMER_MODE_DOZE)
+    assert (hour, minute, second) == (0, 1, 1)
+    assert (end_hour, end_minute) == (0, 6)
+
+
+def test_read_state_does_not_write_the_timer():
+    async def _run() -> tuple[SimulatedCandle, MiPow]:
+        candle = SimulatedCandle("AA:BB:CC:DD:EE:02", seed=1, profile=QUIET)
+        # Switched on at the device, an update would enable the time off timer
+        candle.values[RGBW_CHARACTERISTIC_UUID] = MiPowCodec().encode_rgbw(0, 0, 0, 255)
+        mipow = MiPow(candle, connector=candle.connect)
+        await mipow.read_state()
+        await mipow.stop()
+        return candle, mipow
+
+    candle, mipow = asyncio.run(_run())
+    assert candle.stats.writes == 0
+    assert mipow.is_on and mipow.rgbw == (0, 0, 0, 255)
+    assert mipow.battery_level is not None